@@ -1,6 +1,16 @@
-from django.contrib import admin
+import io
+
+from django import forms
+from django.conf.urls import url
+from django.contrib import admin, messages
 from django.contrib.auth.models import User
 from django.contrib.auth.admin import UserAdmin
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.utils import timezone
+
+from .bulk_invitations import (InviteQuotaExceeded, issue_requested_invitations,
+                               issue_user_codes, read_csv)
 
 from .models import (
     ValidPasswordResetKey,
@@ -8,7 +18,8 @@ from .models import (
     RequestInvite,
     UserProfile,
     ActivationKey,
-    MFACode,
+    LoginFailure,
+    QueuedEmail,
     UserRegisterCode)
 
 
@@ -25,6 +36,11 @@ admin.site.unregister(User)
 admin.site.register(User, ua)
 
 
+class BulkUserCodeForm(forms.Form):
+    csv_file = forms.FileField()
+    use_my_quota = forms.BooleanField(required=False, help_text="Send the codes from your invite quota.")
+
+
 class UserRegisterCodeAdmin(admin.ModelAdmin):
     list_display = ('email',
                     'sender',
@@ -37,6 +53,32 @@ class UserRegisterCodeAdmin(admin.ModelAdmin):
     search_fields = ('username', 'first_name', 'last_name',
                      'code', 'email')
 
+    def get_urls(self):
+        return [
+            url(r'^bulk-issue/$', self.admin_site.admin_view(self.bulk_issue),
+                name='accounts_userregistercode_bulk_issue'),
+        ] + super(UserRegisterCodeAdmin, self).get_urls()
+
+    def bulk_issue(self, request):
+        """
+        Issue the user codes listed in an uploaded CSV file.
+        """
+        form = BulkUserCodeForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            rows = read_csv(io.TextIOWrapper(form.cleaned_data['csv_file'].file, encoding='utf-8'))
+            sender = request.user if form.cleaned_data['use_my_quota'] else None
+            try:
+                issued = issue_user_codes(rows, sender)
+            except (InviteQuotaExceeded, KeyError) as e:
+                self.message_user(request, "No code issued: %s" % e, messages.ERROR)
+            else:
+                self.message_user(request, "%s code(s) issued." % issued)
+                return redirect('admin:accounts_userregistercode_changelist')
+
+        context = dict(self.admin_site.each_context(request),
+                       opts=self.model._meta, form=form, title="Issue codes from a CSV file")
+        return TemplateResponse(request, 'admin/accounts/userregistercode/bulk_issue.html', context)
+
 
 admin.site.register(UserRegisterCode, UserRegisterCodeAdmin)
 
@@ -53,6 +95,13 @@ class RequestInviteAdmin(admin.ModelAdmin):
         'added')
     search_fields = ('first_name', 'last_name',
                      'user_type', 'organization', 'email')
+    actions = ['issue_invitations']
+
+    def issue_invitations(self, request, queryset):
+        issued = issue_requested_invitations(queryset)
+        self.message_user(request, "%s invitation(s) issued." % issued)
+
+    issue_invitations.short_description = "Issue invitations to the selected requests"
 
 
 admin.site.register(RequestInvite, RequestInviteAdmin)
@@ -92,14 +141,33 @@ class InvitationAdmin(admin.ModelAdmin):
 admin.site.register(Invitation, InvitationAdmin)
 
 
-class MFACodeAdmin(admin.ModelAdmin):
-    list_display = ('user', 'code',
-                    'tries_counter',
-                    'mode',
-                    'endpoint',
-                    'expires')
-    search_fields = ('mode', 'endpoint')
-    raw_id_fields = ("user", )
+class QueuedEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'to', 'status', 'attempts',
+                    'next_attempt', 'created', 'sent')
+    list_filter = ('status',)
+    search_fields = ('to', 'subject')
+    readonly_fields = ('dedup_key', 'attempts', 'last_error', 'created', 'sent')
+    # the bodies hold MFA codes and reset links
+    exclude = ('text_body', 'html_body')
+    actions = ['retry']
+
+    def retry(self, request, queryset):
+        # the emails whose bodies were purged cannot be sent again
+        updated = queryset.exclude(status='sent').exclude(text_body='').update(
+            status='queued', next_attempt=timezone.now())
+        self.message_user(request, "%s email(s) queued again." % updated)
+
+    retry.short_description = "Send again"
+
+
+admin.site.register(QueuedEmail, QueuedEmailAdmin)
+
+
+class LoginFailureAdmin(admin.ModelAdmin):
+    list_display = ('username', 'ip_address', 'path', 'created')
+    search_fields = ('username', 'ip_address')
+    date_hierarchy = 'created'
+    readonly_fields = ('username', 'ip_address', 'user_agent', 'path', 'created')
 
 
-admin.site.register(MFACode, MFACodeAdmin)
+admin.site.register(LoginFailure, LoginFailureAdmin)
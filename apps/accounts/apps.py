@@ -5,3 +5,6 @@ class OAuth2AccountsConfig(AppConfig):
     name = 'apps.accounts'
     label = 'accounts'
     verbose_name = "Accounts and Invites"
+
+    def ready(self):
+        from . import checks  # noqa: F401
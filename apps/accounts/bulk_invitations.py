@@ -0,0 +1,155 @@
+import csv
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.db import transaction
+from django.db.models import F
+
+from .emails import invitation_code_email, invite_to_create_account_email
+from .hashing import hash_user_id
+from .models import Invitation, RequestInvite, UserProfile, UserRegisterCode, random_code
+from .outbox import queue_emails
+
+logger = logging.getLogger('hhs_server.%s' % __name__)
+perf_logger = logging.getLogger('performance')
+
+# SQLite allows at most 999 variables per statement
+CODE_LOOKUP_CHUNK = 500
+
+
+class InviteQuotaExceeded(Exception):
+    pass
+
+
+def read_csv(csv_file):
+    """
+    Return the rows of `csv_file` as dicts keyed on the lower cased
+    header names, with the values stripped.
+    """
+    reader = csv.DictReader(csv_file)
+    return [dict((k.strip().lower(), (v or '').strip()) for k, v in row.items() if k)
+            for row in reader]
+
+
+def hash_user_ids(user_ids, processes=None):
+    """
+    Hash `user_ids` with PBKDF2, in a pool of `processes` processes when
+    more than one is requested.
+    """
+    if not processes or processes < 2:
+        return [hash_user_id(user_id) for user_id in user_ids]
+    chunksize = max(1, len(user_ids) // (processes * 4))
+    with ProcessPoolExecutor(processes) as pool:
+        return list(pool.map(hash_user_id, user_ids, chunksize=chunksize))
+
+
+def unique_codes(model, count, length=10):
+    """
+    Generate `count` distinct codes that are not used by any `model` row.
+    """
+    codes = set()
+    while len(codes) < count:
+        candidates = set()
+        while len(candidates) < count - len(codes):
+            code = random_code(length)
+            if code not in codes:
+                candidates.add(code)
+        candidates = list(candidates)
+        for i in range(0, len(candidates), CODE_LOOKUP_CHUNK):
+            chunk = candidates[i:i + CODE_LOOKUP_CHUNK]
+            taken = set(model.objects.filter(code__in=chunk).values_list('code', flat=True))
+            codes.update(code for code in chunk if code not in taken)
+    return list(codes)
+
+
+def reserve_invites(sender, count):
+    """
+    Take `count` invites from the quota of `sender` with a single
+    conditional update. Raises InviteQuotaExceeded if the quota is short.
+    """
+    reserved = UserProfile.objects.filter(
+        user=sender, remaining_user_invites__gte=count).update(
+        remaining_user_invites=F('remaining_user_invites') - count)
+    if not reserved:
+        raise InviteQuotaExceeded("%s cannot send %s more invites." % (sender, count))
+
+
+def release_invites(sender, count):
+    UserProfile.objects.filter(user=sender).update(
+        remaining_user_invites=F('remaining_user_invites') + count)
+
+
+def _batches(items, batch_size):
+    for i in range(0, len(items), batch_size):
+        yield items[i:i + batch_size]
+
+
+def issue_user_codes(rows, sender=None, batch_size=1000, processes=None):
+    """
+    Issue a UserRegisterCode for each row, a dict with the `email`,
+    `first_name`, `last_name`, `username` and optional `user_id` keys,
+    and queue the invitation emails. The rows are inserted by batches
+    of `batch_size`, one transaction per batch. Returns the number of
+    issued codes.
+    """
+    start = time.time()
+    if sender is not None:
+        reserve_invites(sender, len(rows))
+
+    issued = 0
+    try:
+        hashes = hash_user_ids([row.get('user_id', '') for row in rows], processes)
+        codes = unique_codes(UserRegisterCode, len(rows))
+        user_codes = [
+            UserRegisterCode(user_id_hash=user_id_hash, code=code, sender=sender,
+                             email=row['email'], username=row.get('username', ''),
+                             first_name=row.get('first_name', ''),
+                             last_name=row.get('last_name', ''),
+                             sent=True)
+            for row, user_id_hash, code in zip(rows, hashes, codes)]
+        for batch in _batches(user_codes, batch_size):
+            with transaction.atomic():
+                UserRegisterCode.objects.bulk_create(batch)
+                queue_emails([invitation_code_email(user_code) for user_code in batch])
+            issued += len(batch)
+    finally:
+        if sender is not None and issued < len(rows):
+            release_invites(sender, len(rows) - issued)
+
+    perf_logger.info("bulk_invitations user_codes=%s ms=%.1f", issued, (time.time() - start) * 1000)
+    return issued
+
+
+def issue_invitations(emails, batch_size=1000):
+    """
+    Issue a developer Invitation for each address in `emails` and
+    queue the invitation emails. Returns the number of invitations.
+    """
+    start = time.time()
+    codes = unique_codes(Invitation, len(emails))
+    invitations = [Invitation(code=code, email=email) for email, code in zip(emails, codes)]
+    for batch in _batches(invitations, batch_size):
+        with transaction.atomic():
+            Invitation.objects.bulk_create(batch)
+            queue_emails([invite_to_create_account_email(invitation) for invitation in batch])
+
+    perf_logger.info("bulk_invitations invitations=%s ms=%.1f",
+                     len(invitations), (time.time() - start) * 1000)
+    return len(invitations)
+
+
+def issue_requested_invitations(request_invites, batch_size=1000):
+    """
+    Issue the Invitations of the RequestInvite queryset `request_invites`
+    that were not sent yet, and mark them as sent.
+    """
+    pending = request_invites.filter(invite_sent=False)
+    ids, emails = [], []
+    for pk, email in pending.values_list('pk', 'email'):
+        ids.append(pk)
+        emails.append(email)
+    issued = issue_invitations(emails, batch_size)
+    for batch in _batches(ids, CODE_LOOKUP_CHUNK):
+        RequestInvite.objects.filter(pk__in=batch).update(issue_invite='DONE', invite_sent=True)
+    return issued
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, Tags, register
+
+# The settings naming the caches that must be shared by the processes of
+# the server: in a per process cache, each worker counts its own login
+# failures, and misses the invalidations of the principals by the others.
+SHARED_CACHE_SETTINGS = ('LOGIN_LOCKOUT_CACHE', 'PRINCIPAL_CACHE')
+
+
+@register(Tags.security, Tags.caches)
+def check_shared_caches(app_configs, **kwargs):
+    """
+    Refuse per process caches for the login lockout counters and the
+    principals, unless DEBUG is on.
+    """
+    if settings.DEBUG:
+        return []
+    errors = []
+    for name in SHARED_CACHE_SETTINGS:
+        alias = getattr(settings, name, 'counters')
+        if alias not in settings.CACHES:
+            errors.append(Error("%s names the cache %r, which is not in CACHES." % (name, alias),
+                                id='accounts.E001'))
+        elif isinstance(caches[alias], (LocMemCache, DummyCache)):
+            errors.append(Error(
+                "%s names the per process cache %r." % (name, alias),
+                hint="Point COUNTER_CACHE_BACKEND and COUNTER_CACHE_LOCATION, or %s, at a "
+                     "cache shared by the processes of the server, such as memcached." % name,
+                id='accounts.E002'))
+    return errors
@@ -1,18 +1,15 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.backends import ModelBackend
 
+from .lookups import user_by_email
+
 
 class EmailBackend(ModelBackend):
 
     def authenticate(self, username=None, password=None, **kwargs):
-        UserModel = get_user_model()
-        try:
-            user = UserModel.objects.get(email=username)
-        except UserModel.DoesNotExist:
-            return None
-        else:
-            if user.check_password(password):
-                return user
+        user = user_by_email(username)
+        if user is not None and user.check_password(password):
+            return user
         return None
 
     def get_user(self, user_id):
@@ -2,8 +2,8 @@ import random
 import logging
 from django.conf import settings
 from django.core.urlresolvers import reverse
-from django.core.mail import EmailMultiAlternatives
 from django.template.loader import get_template
+from .outbox import queue_email
 
 logger = logging.getLogger('hhs_server.%s' % __name__)
 
@@ -34,12 +34,17 @@ def notify_admin_of_invite_request(request_invite):
         to_email = [settings.DEFAULT_ADMIN_EMAIL, settings.DEFAULT_FROM_EMAIL]
     text_content = plaintext.render(context)
     html_content = htmly.render(context)
-    msg = EmailMultiAlternatives(subject, text_content, from_email, to_email)
-    msg.attach_alternative(html_content, "text/html")
-    msg.send()
+    queue_email(subject, text_content, from_email, to_email, html_content)
 
 
 def send_invite_to_create_account(invitation):
+    queue_email(*invite_to_create_account_email(invitation))
+
+
+def invite_to_create_account_email(invitation):
+    """
+    Return the (subject, text, from, to, html) of the invitation email.
+    """
     plaintext = get_template('email-invite.txt')
     htmly = get_template('email-invite.html')
     context = {"APPLICATION_TITLE": settings.APPLICATION_TITLE,
@@ -54,14 +59,17 @@ def send_invite_to_create_account(invitation):
     to_email = invitation.email
     text_content = plaintext.render(context)
     html_content = htmly.render(context)
-    msg = EmailMultiAlternatives(
-        subject, text_content, from_email, [
-            to_email, ])
-    msg.attach_alternative(html_content, "text/html")
-    msg.send()
+    return subject, text_content, from_email, [to_email], html_content
 
 
 def send_invitation_code_to_user(user_code_invitation):
+    queue_email(*invitation_code_email(user_code_invitation))
+
+
+def invitation_code_email(user_code_invitation):
+    """
+    Return the (subject, text, from, to, html) of the invitation code email.
+    """
     plaintext = get_template('email-user-code-by-email.txt')
     htmly = get_template('email-user-code-by-email.html')
     context = {"APPLICATION_TITLE": settings.APPLICATION_TITLE,
@@ -74,11 +82,7 @@ def send_invitation_code_to_user(user_code_invitation):
     to_email = user_code_invitation.email
     text_content = plaintext.render(context)
     html_content = htmly.render(context)
-    msg = EmailMultiAlternatives(
-        subject, text_content, from_email, [
-            to_email, ])
-    msg.attach_alternative(html_content, "text/html")
-    msg.send()
+    return subject, text_content, from_email, [to_email], html_content
 
 
 def mfa_via_email(user, code):
@@ -110,9 +114,7 @@ def mfa_via_email(user, code):
     The %s Team
 
     """ % (code, settings.APPLICATION_TITLE)
-    msg = EmailMultiAlternatives(subject, text_content, from_email, [to])
-    msg.attach_alternative(html_content, 'text/html')
-    msg.send()
+    queue_email(subject, text_content, from_email, [to], html_content)
 
 
 def send_password_reset_url_via_email(user, reset_key):
@@ -131,11 +133,7 @@ def send_password_reset_url_via_email(user, reset_key):
                "PASSWORD_RESET_LINK": password_reset_link}
     text_content = plaintext.render(context)
     html_content = htmly.render(context)
-    msg = EmailMultiAlternatives(
-        subject, text_content, from_email, [
-            to_email, ])
-    msg.attach_alternative(html_content, "text/html")
-    msg.send()
+    queue_email(subject, text_content, from_email, [to_email], html_content)
 
 
 def send_activation_key_via_email(user, signup_key):
@@ -157,11 +155,7 @@ def send_activation_key_via_email(user, signup_key):
         settings.APPLICATION_TITLE)
     text_content = plaintext.render(context)
     html_content = htmly.render(context)
-    msg = EmailMultiAlternatives(
-        subject, text_content, from_email, [
-            to_email, ])
-    msg.attach_alternative(html_content, "text/html")
-    msg.send()
+    queue_email(subject, text_content, from_email, [to_email], html_content)
 
 
 def send_invite_request_notices(invite_request):
@@ -208,11 +202,8 @@ def send_invite_request_notices(invite_request):
            invite_request.last_name,
            settings.ORGANIZATION_NAME,
            get_hostname())
-    msg = EmailMultiAlternatives(subject, text_content, from_email,
-                                 [to, settings.INVITE_REQUEST_ADMIN])
-    msg.attach_alternative(html_content, 'text/html')
-
-    msg.send()
+    queue_email(subject, text_content, from_email,
+                [to, settings.INVITE_REQUEST_ADMIN], html_content)
 
 
 def get_hostname():
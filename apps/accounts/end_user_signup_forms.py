@@ -1,23 +1,20 @@
 import logging
-import binascii
 from random import randint
 
 from localflavor.us.forms import USPhoneNumberField
 
 from django import forms
-from django.conf import settings
 from django.contrib.auth.models import User, Group
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
 from django.utils.dates import MONTHS
 from django.utils.translation import ugettext_lazy as _
-from django.utils.crypto import pbkdf2
 
-from .models import UserProfile, create_activation_key, UserRegisterCode, get_user_id_salt
+from .hashing import hash_user_id
+from .lookups import users_by_email, users_by_username
+from .models import UserProfile, create_activation_key, UserRegisterCode
 from ..fhir.bluebutton.models import Crosswalk
 
-from .models import MFA_CHOICES
-
 logger = logging.getLogger('hhs_server.%s' % __name__)
 
 MEDICARE_SUFFIX_CHOICES = (('A', 'A'), ('A0', 'A0'), ('A1', 'A1'),
@@ -120,8 +117,8 @@ class SimpleUserSignupForm(forms.Form):
         email = self.cleaned_data.get('email', "")
         if email:
             username = self.cleaned_data.get('username')
-            if email and User.objects.filter(email=email).exclude(
-                    username=username).count():
+            if email and users_by_email(email).exclude(
+                    username=username).exists():
                 raise forms.ValidationError(
                     _('This email address is already registered.'))
             return email.rstrip().lstrip().lower()
@@ -132,7 +129,7 @@ class SimpleUserSignupForm(forms.Form):
         username = self.cleaned_data.get('username')
         username = username.rstrip().lstrip().lower()
 
-        if User.objects.filter(username=username).count() > 0:
+        if users_by_username(username).exists():
             raise forms.ValidationError(_('This username is already taken.'))
         return username
 
@@ -166,9 +163,7 @@ class SimpleUserSignupForm(forms.Form):
 
         # TODO: Add Crosswalk Create.
         Crosswalk.objects.create(user=new_user,
-                                 user_id_hash=binascii.hexlify(pbkdf2(self.cleaned_data['id_number'],
-                                                                      get_user_id_salt(),
-                                                                      settings.USER_ID_ITERATIONS)).decode("ascii"))
+                                 user_id_hash=hash_user_id(self.cleaned_data['id_number']))
         #
         group = Group.objects.get(name='BlueButton')
         new_user.groups.add(group)
@@ -270,8 +265,8 @@ class UserSignupForm(forms.Form):
         email = self.cleaned_data.get('email', "")
         if email:
             username = self.cleaned_data.get('username')
-            if email and User.objects.filter(email=email).exclude(
-                    username=username).count():
+            if email and users_by_email(email).exclude(
+                    username=username).exists():
                 raise forms.ValidationError(
                     _('This email address is already registered.'))
             return email.rstrip().lstrip().lower()
@@ -282,7 +277,7 @@ class UserSignupForm(forms.Form):
         username = self.cleaned_data.get('username')
         username = username.rstrip().lstrip().lower()
 
-        if User.objects.filter(username=username).count() > 0:
+        if users_by_username(username).exists():
             raise forms.ValidationError(_('This username is already taken.'))
         return username
 
@@ -335,52 +330,3 @@ class UserSignupForm(forms.Form):
         create_activation_key(new_user)
 
         return new_user
-
-
-class AccountSettingsForm(forms.Form):
-    username = forms.CharField(max_length=30, label=_('User Name'))
-    email = forms.CharField(max_length=30, label=_('Email'))
-    first_name = forms.CharField(max_length=100, label=_('First Name'))
-    last_name = forms.CharField(max_length=100, label=_('Last Name'))
-    mfa_login_mode = forms.ChoiceField(required=False,
-                                       choices=MFA_CHOICES,
-                                       help_text=_("Change this to turn on "
-                                                   "multi-factor "
-                                                   "authentication (MFA)."))
-    mobile_phone_number = USPhoneNumberField(required=False,
-                                             help_text=_("US numbers only. "
-                                                         "We use this for "
-                                                         "multi-factor "
-                                                         "authentication."))
-    organization_name = forms.CharField(max_length=100,
-                                        label=_('Organization Name'),
-                                        required=False)
-    create_applications = forms.BooleanField(initial=False,
-                                             required=False)
-    required_css_class = 'required'
-
-    def clean_email(self):
-        email = self.cleaned_data.get('email')
-        if email:
-            if email and User.objects.filter(
-                    email=email).exclude(email=email).count():
-                raise forms.ValidationError(_('This email address is '
-                                              'already registered.'))
-        return email.rstrip().lstrip().lower()
-
-    def clean_mobile_phone_number(self):
-        mobile_phone_number = self.cleaned_data.get('mobile_phone_number', '')
-        mfa_login_mode = self.cleaned_data.get('mfa_login_mode', '')
-        if mfa_login_mode == "SMS" and not mobile_phone_number:
-            raise forms.ValidationError(
-                _('A mobile phone number is required to use SMS-based '
-                  'multi-factor authentication'))
-        return mobile_phone_number
-
-    def clean_username(self):
-        username = self.cleaned_data.get('username')
-        username = username.rstrip().lstrip().lower()
-        if username and User.objects.filter(
-                username=username).exclude(username=username).count():
-            raise forms.ValidationError(_('This username is already taken.'))
-        return username
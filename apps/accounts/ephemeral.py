@@ -0,0 +1,171 @@
+import json
+import threading
+import time
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.db import DatabaseCache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+_cleanup_lock = threading.Lock()
+_last_cleanup = [0]
+
+
+class EphemeralStore(object):
+    """
+    Short lived state, such as OAuth state parameters and MFA codes,
+    that expires after `timeout` seconds.
+
+    The values are JSON serializable. They are kept in the default cache,
+    or in the EphemeralState table when `EPHEMERAL_STORE` is 'db'. `pop`
+    returns a value to a single caller and `incr` counts attempts
+    atomically: in the EphemeralState table as well when the cache is a
+    DatabaseCache, whose incr() is a get and a set.
+    """
+
+    def __init__(self, namespace, timeout):
+        self.namespace = namespace
+        self._timeout = timeout
+
+    @property
+    def timeout(self):
+        # a setting name is read on use, so that it can be overridden
+        if isinstance(self._timeout, str):
+            return getattr(settings, self._timeout)
+        return self._timeout
+
+    def make_key(self, key):
+        return 'ephemeral:%s:%s' % (self.namespace, key)
+
+    def backend(self):
+        if getattr(settings, 'EPHEMERAL_STORE', 'cache') == 'db':
+            return _database_backend
+        return _cache_backend
+
+    def set(self, key, value):
+        self.backend().set(self.make_key(key), value, self.timeout)
+
+    def get(self, key):
+        return self.backend().get(self.make_key(key))
+
+    def pop(self, key):
+        """
+        Return the value of `key` and remove it. Concurrent callers get
+        None, so the value is used once.
+        """
+        return self.backend().pop(self.make_key(key), self.timeout)
+
+    def counter_backend(self):
+        backend = self.backend()
+        if backend is _cache_backend and not cache_increments_atomically():
+            return _database_backend
+        return backend
+
+    def delete(self, key):
+        self.backend().delete(self.make_key(key))
+        self.counter_backend().delete(self.make_key(key) + ':count')
+
+    def incr(self, key):
+        """
+        Increment the counter of `key`, created with the timeout of the
+        store, and return its new value.
+        """
+        return self.counter_backend().incr(self.make_key(key) + ':count', self.timeout)
+
+
+def cache_increments_atomically():
+    return not isinstance(caches['default'], DatabaseCache)
+
+
+class CacheBackend(object):
+
+    def set(self, key, value, timeout):
+        cache.delete(key + ':used')
+        cache.set(key, value, timeout)
+
+    def get(self, key):
+        return cache.get(key)
+
+    def pop(self, key, timeout):
+        value = cache.get(key)
+        if value is None:
+            return None
+        # add() is atomic: only the first caller claims the value
+        if not cache.add(key + ':used', True, timeout):
+            return None
+        cache.delete(key)
+        return value
+
+    def delete(self, key):
+        cache.delete(key)
+
+    def incr(self, key, timeout):
+        cache.add(key, 0, timeout)
+        try:
+            return cache.incr(key)
+        except ValueError:
+            # expired between add() and incr()
+            cache.add(key, 1, timeout)
+            return 1
+
+
+class DatabaseBackend(object):
+    """
+    Store the values in the indexed EphemeralState table. Expired rows
+    are ignored, and deleted at most every
+    `EPHEMERAL_STORE_CLEANUP_SECONDS` seconds by the process writing.
+    """
+
+    def model(self):
+        return apps.get_model('accounts', 'EphemeralState')
+
+    def cleanup(self):
+        interval = getattr(settings, 'EPHEMERAL_STORE_CLEANUP_SECONDS', 300)
+        now = time.time()
+        with _cleanup_lock:
+            if now - _last_cleanup[0] < interval:
+                return
+            _last_cleanup[0] = now
+        self.model().objects.filter(expires__lte=timezone.now()).delete()
+
+    def set(self, key, value, timeout):
+        self.cleanup()
+        self.model().objects.update_or_create(key=key, defaults={
+            'value': json.dumps(value), 'counter': 0,
+            'expires': timezone.now() + timedelta(seconds=timeout)})
+
+    def _live(self, key):
+        return self.model().objects.filter(key=key, expires__gt=timezone.now())
+
+    def get(self, key):
+        value = self._live(key).values_list('value', flat=True).first()
+        return None if value is None else json.loads(value)
+
+    def pop(self, key, timeout):
+        row = self._live(key).values_list('pk', 'value').first()
+        if row is None:
+            return None
+        # only the caller whose delete removed the row gets the value
+        deleted, _ = self.model().objects.filter(pk=row[0]).delete()
+        return json.loads(row[1]) if deleted else None
+
+    def delete(self, key):
+        self.model().objects.filter(key=key).delete()
+
+    def incr(self, key, timeout):
+        model = self.model()
+        now = timezone.now()
+        with transaction.atomic():
+            model.objects.filter(key=key, expires__lte=now).delete()
+            row, _ = model.objects.get_or_create(
+                key=key, defaults={'expires': now + timedelta(seconds=timeout)})
+            model.objects.filter(pk=row.pk).update(counter=F('counter') + 1)
+            return model.objects.filter(pk=row.pk).values_list('counter', flat=True).get()
+
+
+_cache_backend = CacheBackend()
+_database_backend = DatabaseBackend()
@@ -8,6 +8,7 @@ from django.contrib.auth.password_validation import validate_password
 from django.utils.translation import ugettext_lazy as _
 from apps.fhir.bluebutton.models import Crosswalk
 from apps.fhir.bluebutton.utils import get_resourcerouter
+from .lookups import users_by_email
 from .models import Invitation, RequestInvite, UserProfile, create_activation_key, UserRegisterCode
 from .models import QUESTION_1_CHOICES, QUESTION_2_CHOICES, QUESTION_3_CHOICES, MFA_CHOICES
 from localflavor.us.forms import USPhoneNumberField
@@ -299,8 +300,8 @@ class SignupForm(forms.Form):
         email = self.cleaned_data.get('email', "")
         if email:
             username = self.cleaned_data.get('username')
-            if email and User.objects.filter(email=email).exclude(
-                    username=username).count():
+            if email and users_by_email(email).exclude(
+                    username=username).exists():
                 raise forms.ValidationError(
                     _('This email address is already registered.'))
             return email.rstrip().lstrip().lower()
@@ -399,8 +400,8 @@ class AccountSettingsForm(forms.Form):
     def clean_email(self):
         email = self.cleaned_data.get('email')
         if email:
-            if email and User.objects.filter(
-                    email=email).exclude(email=email).count():
+            if email and users_by_email(email).exclude(
+                    pk=self.request.user.pk).exists():
                 raise forms.ValidationError(_('This email address is '
                                               'already registered.'))
         return email.rstrip().lstrip().lower()
@@ -0,0 +1,110 @@
+import binascii
+import hashlib
+import hmac
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.crypto import pbkdf2
+from django.utils.encoding import force_bytes
+
+
+class HashedUserId(str):
+    """
+    A user id hash, as returned by hash_user_id or loaded from the
+    database by a HashedUserIdMixin model. Other strings, whatever their
+    shape, are raw ids to hash.
+    """
+
+
+class HashedUserIdMixin(object):
+    """
+    Mark the `user_id_hash` of the model instances loaded from the
+    database as hashed, so that saving them again keeps it.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(HashedUserIdMixin, cls).from_db(db, field_names, values)
+        # a deferred value is not loaded here
+        if 'user_id_hash' in instance.__dict__:
+            instance.user_id_hash = instance._stored_user_id_hash = HashedUserId(instance.user_id_hash)
+        return instance
+
+    def hash_user_id_hash(self):
+        """
+        Hash `user_id_hash` before saving, unless it is a HashedUserId
+        or the stored hash, as set back by a model form.
+        """
+        if self.user_id_hash == getattr(self, '_stored_user_id_hash', None):
+            self.user_id_hash = self._stored_user_id_hash
+        self.user_id_hash = self._stored_user_id_hash = hash_user_id(self.user_id_hash)
+
+
+class UserIdHasher(object):
+    """
+    Hash user ids (HICNs) with PBKDF2 using USER_ID_SALT and
+    USER_ID_ITERATIONS.
+
+    The salt is decoded once. Recent results are kept in a bounded LRU
+    cache of USER_ID_HASH_CACHE_SIZE entries, keyed by an HMAC of the
+    user id so that the raw ids are not held in memory. The cache is
+    dropped when the salt or iteration settings change.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._params = None
+        self._salt = None
+        self._cache = OrderedDict()
+
+    def _check_params(self):
+        params = (settings.USER_ID_SALT, settings.USER_ID_ITERATIONS)
+        if params != self._params:
+            with self._lock:
+                self._salt = binascii.unhexlify(params[0])
+                self._cache.clear()
+                self._params = params
+        return self._salt, params[1]
+
+    def salt(self):
+        return self._check_params()[0]
+
+    def hash(self, user_id, iterations=None):
+        """
+        Return the hex PBKDF2 hash of `user_id` as a HashedUserId.
+        HashedUserIds are returned unchanged, so hashing is done exactly
+        once. `iterations` overrides USER_ID_ITERATIONS and bypasses the
+        cache.
+        """
+        if isinstance(user_id, HashedUserId):
+            return user_id
+        salt, default_iterations = self._check_params()
+        if iterations is not None and iterations != default_iterations:
+            return HashedUserId(compute_hash(user_id, salt, iterations))
+
+        key = hmac.new(salt, force_bytes(user_id), hashlib.sha256).digest()
+        with self._lock:
+            value = self._cache.get(key)
+            if value is not None:
+                self._cache.move_to_end(key)
+                return value
+
+        value = HashedUserId(compute_hash(user_id, salt, default_iterations))
+        size = getattr(settings, 'USER_ID_HASH_CACHE_SIZE', 10000)
+        with self._lock:
+            self._cache[key] = value
+            while len(self._cache) > size:
+                self._cache.popitem(last=False)
+        return value
+
+
+def compute_hash(user_id, salt, iterations):
+    return binascii.hexlify(pbkdf2(user_id, salt, iterations)).decode("ascii")
+
+
+user_id_hasher = UserIdHasher()
+
+
+def hash_user_id(user_id, iterations=None):
+    return user_id_hasher.hash(user_id, iterations)
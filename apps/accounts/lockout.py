@@ -0,0 +1,205 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.http import HttpResponse
+from django.utils import timezone
+
+from ..utils import get_client_ip
+from .lookups import normalize
+
+logger = logging.getLogger('hhs_server.%s' % __name__)
+
+# (dimension, limit setting)
+DIMENSIONS = (
+    ('user', 'LOGIN_FAILURE_LIMIT'),
+    ('ip', 'LOGIN_FAILURE_IP_LIMIT'),
+    ('user_ip', 'LOGIN_FAILURE_USER_IP_LIMIT'),
+)
+
+_audit_buffer = deque()
+_audit_lock = threading.Lock()
+_audit_pending = threading.Event()
+_audit_thread = []
+_audit_dropped = [0]
+
+
+def lockout_cache():
+    """
+    The cache of the counters, which must increment atomically, so not a
+    DatabaseCache: its incr() is a get and a set.
+    """
+    return caches[getattr(settings, 'LOGIN_LOCKOUT_CACHE', 'counters')]
+
+
+def _subjects(username, ip_address):
+    """
+    The counted subject of each dimension, hashed so that the cache keys
+    have a bounded length whatever is posted as username.
+    """
+    values = {'user': username, 'ip': ip_address,
+              'user_ip': '%s|%s' % (username, ip_address) if username and ip_address else None}
+    return [(dimension, limit, hashlib.sha1(values[dimension].encode('utf-8')).hexdigest())
+            for dimension, limit in DIMENSIONS
+            if values[dimension] and getattr(settings, limit, 0)]
+
+
+def _lock_key(dimension, subject):
+    return 'lockout:lock:%s:%s' % (dimension, subject)
+
+
+def is_locked_out(username, ip_address):
+    keys = [_lock_key(dimension, subject) for dimension, _, subject in _subjects(username, ip_address)]
+    return bool(keys) and any(lockout_cache().get_many(keys).values())
+
+
+def record_failure(username, ip_address):
+    """
+    Count a failed login of `username` from `ip_address` and lock out
+    the dimensions whose failures reach their limit. Returns True when
+    one of them got locked out.
+
+    Failures are counted in fixed windows of `LOGIN_FAILURE_WINDOW`
+    seconds. The count of the sliding window is the current count plus
+    the previous one weighted by the part of the previous window still
+    covered. Each counter expires after two windows.
+    """
+    cache = lockout_cache()
+    window = getattr(settings, 'LOGIN_FAILURE_WINDOW', 1800)
+    now = time.time()
+    bucket = int(now // window)
+    previous_weight = 1 - (now % window) / window
+
+    locked = False
+    for dimension, limit, subject in _subjects(username, ip_address):
+        key = 'lockout:count:%s:%s:%%s' % (dimension, subject)
+        cache.add(key % bucket, 0, window * 2)
+        try:
+            current = cache.incr(key % bucket)
+        except ValueError:
+            # expired between add() and incr()
+            cache.add(key % bucket, 1, window * 2)
+            current = 1
+        count = current + (cache.get(key % (bucket - 1)) or 0) * previous_weight
+        if count >= getattr(settings, limit):
+            cache.set(_lock_key(dimension, subject), True, getattr(settings, 'LOGIN_LOCKOUT_SECONDS', 1800))
+            logger.warning("Login locked out by %s after %s failures: %s %s",
+                           dimension, int(count), username, ip_address)
+            locked = True
+    return locked
+
+
+def reset(username=None, ip_address=None):
+    """
+    Lift the lockouts of `username` and/or `ip_address`.
+    """
+    lockout_cache().delete_many([_lock_key(dimension, subject)
+                                 for dimension, _, subject in _subjects(username, ip_address)])
+
+
+def lockout_response(request):
+    msg = 'Account locked: too many login attempts. {0}'
+    if getattr(settings, 'LOGIN_LOCKOUT_SECONDS', 1800):
+        msg = msg.format('Please try again later.')
+    else:
+        msg = msg.format('Contact an admin to unlock your account.')
+    return HttpResponse(msg, status=403)
+
+
+def lockout_protected(view):
+    """
+    Answer 403 without calling `view` when the posted username or the
+    client IP address is locked out. The username is normalized as
+    LoginForm does, so that padding it does not get around the lockout.
+    """
+    @wraps(view)
+    def inner(request, *args, **kwargs):
+        if request.method == 'POST' and is_locked_out(
+                normalize(request.POST.get('username')), get_client_ip(request)):
+            return lockout_response(request)
+        return view(request, *args, **kwargs)
+    return inner
+
+
+def login_failed(username, request):
+    """
+    Count the failure and queue its audit record.
+    """
+    ip_address = get_client_ip(request) if request is not None else None
+    record_failure(normalize(username), ip_address)
+    queue_audit(username, ip_address,
+                request.META.get('HTTP_USER_AGENT', '')[:255] if request is not None else '',
+                request.path[:255] if request is not None else '')
+
+
+def queue_audit(username, ip_address, user_agent, path):
+    """
+    Buffer a LoginFailure record. The buffer holds at most
+    `LOGIN_AUDIT_BUFFER_SIZE` records; the oldest are dropped when the
+    database cannot keep up. The records are written in batches by a
+    background thread, or inline when `LOGIN_AUDIT_BACKGROUND` is False.
+    """
+    record = dict(username=(username or '')[:255], ip_address=ip_address or None,
+                  user_agent=user_agent, path=path, created=timezone.now())
+    with _audit_lock:
+        if len(_audit_buffer) >= getattr(settings, 'LOGIN_AUDIT_BUFFER_SIZE', 10000):
+            _audit_buffer.popleft()
+            _audit_dropped[0] += 1
+        _audit_buffer.append(record)
+
+    if not getattr(settings, 'LOGIN_AUDIT_BACKGROUND', True):
+        flush_audit()
+        return
+    if len(_audit_buffer) >= getattr(settings, 'LOGIN_AUDIT_BATCH_SIZE', 500):
+        _audit_pending.set()
+    _start_audit_writer()
+
+
+def flush_audit():
+    """
+    Write the buffered LoginFailure records. Returns the number written.
+    """
+    LoginFailure = apps.get_model('accounts', 'LoginFailure')
+    batch_size = getattr(settings, 'LOGIN_AUDIT_BATCH_SIZE', 500)
+    written = 0
+    while True:
+        with _audit_lock:
+            batch = [_audit_buffer.popleft() for _ in range(min(batch_size, len(_audit_buffer)))]
+            dropped, _audit_dropped[0] = _audit_dropped[0], 0
+        if dropped:
+            logger.warning("%s login failure audit records dropped", dropped)
+        if not batch:
+            return written
+        LoginFailure.objects.bulk_create([LoginFailure(**record) for record in batch])
+        written += len(batch)
+
+
+def _audit_writer():
+    while True:
+        _audit_pending.wait(getattr(settings, 'LOGIN_AUDIT_INTERVAL', 5))
+        _audit_pending.clear()
+        try:
+            flush_audit()
+        except Exception:
+            logger.exception("Login failure audit failed")
+        finally:
+            connection.close()
+
+
+def _start_audit_writer():
+    if _audit_thread:
+        return
+    with _audit_lock:
+        if _audit_thread:
+            return
+        thread = threading.Thread(target=_audit_writer, name='login-audit')
+        thread.daemon = True
+        thread.start()
+        _audit_thread.append(thread)
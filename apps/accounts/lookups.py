@@ -0,0 +1,36 @@
+from django.contrib.auth import get_user_model
+
+# The UserLookup rows are kept up to date by the post_save receiver
+# apps.accounts.models.update_user_lookup. QuerySet.update() and
+# bulk_create() send no signal: the code changing usernames or emails
+# that way must write the UserLookup rows as well, as
+# apps.testclient.synthetic does.
+
+
+def normalize(value):
+    return (value or '').strip().lower()
+
+
+def users_by_email(email):
+    """
+    The users whose email matches `email` whatever the case, looked up
+    through the indexed UserLookup.email_lower column.
+    """
+    return get_user_model().objects.filter(lookup__email_lower=normalize(email))
+
+
+def users_by_username(username):
+    """
+    The users whose username matches `username` whatever the case,
+    looked up through the unique UserLookup.username_lower column.
+    """
+    return get_user_model().objects.filter(lookup__username_lower=normalize(username))
+
+
+def user_by_email(email):
+    """
+    Return the single user with `email`, or None when there is no user or
+    the address is ambiguous.
+    """
+    users = list(users_by_email(email)[:2])
+    return users[0] if len(users) == 1 else None
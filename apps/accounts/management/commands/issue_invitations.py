@@ -0,0 +1,49 @@
+import io
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.accounts.bulk_invitations import (InviteQuotaExceeded, issue_invitations,
+                                            issue_user_codes, read_csv)
+
+
+class Command(BaseCommand):
+    help = ("Issue invitations in bulk from a CSV file. User codes need the email, "
+            "first_name, last_name and username columns and an optional user_id; "
+            "developer invitations only need the email column.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help="Path of the CSV file")
+        parser.add_argument('--kind', choices=('user', 'developer'), default='user',
+                            help="Issue UserRegisterCodes (user) or Invitations (developer)")
+        parser.add_argument('--sender', help="Username whose invite quota is used for user codes")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--processes', type=int, default=None,
+                            help="Processes used to hash the user ids")
+
+    def handle(self, *args, **options):
+        with io.open(options['csv_file'], newline='', encoding='utf-8') as f:
+            rows = read_csv(f)
+        missing = [i for i, row in enumerate(rows, 2) if not row.get('email')]
+        if missing:
+            raise CommandError("Missing email on line(s) %s" % ', '.join(map(str, missing)))
+
+        start = time.time()
+        if options['kind'] == 'developer':
+            issued = issue_invitations([row['email'] for row in rows], options['batch_size'])
+        else:
+            sender = None
+            if options['sender']:
+                try:
+                    sender = User.objects.get(username=options['sender'])
+                except User.DoesNotExist:
+                    raise CommandError("No user %s" % options['sender'])
+            try:
+                issued = issue_user_codes(rows, sender, options['batch_size'], options['processes'])
+            except InviteQuotaExceeded as e:
+                raise CommandError(str(e))
+
+        elapsed = time.time() - start
+        self.stdout.write("Issued %s invitations in %.1f s (%.0f/s)" % (
+            issued, elapsed, issued / elapsed if elapsed else issued))
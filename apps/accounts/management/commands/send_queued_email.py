@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.accounts.outbox import outbox_metrics, send_queued
+
+
+class Command(BaseCommand):
+    help = "Send the emails waiting in the outbox, once or in a loop."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help="Emails sent per connection")
+        parser.add_argument('--loop', action='store_true',
+                            help="Keep polling the outbox")
+        parser.add_argument('--interval', type=float, default=5,
+                            help="Seconds between polls with --loop")
+        parser.add_argument('--stats', action='store_true',
+                            help="Print the outbox metrics and exit")
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            for name, value in sorted(outbox_metrics().items()):
+                self.stdout.write("%s %s" % (name, value))
+            return
+
+        while True:
+            sent, failed = send_queued(options['batch_size'])
+            if sent or failed:
+                self.stdout.write("%s sent, %s failed" % (sent, failed))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
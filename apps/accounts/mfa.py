@@ -0,0 +1,32 @@
+import logging
+import random
+import uuid
+
+from .emails import mfa_via_email
+from .ephemeral import EphemeralStore
+from .models import UserProfile
+
+logger = logging.getLogger('hhs_oauth_server.accounts')
+
+# MFA codes by uid: the user id, the code and the mode
+mfa_codes = EphemeralStore('mfa_code', 'MFA_CODE_SECONDS')
+
+
+def issue_mfa_code(user, mode, profile=None):
+    """
+    Create an MFA code for `user`, send it by `mode` and return its uid.
+    `profile` is the UserProfile of `user` when already loaded.
+    """
+    uid = str(uuid.uuid4())
+    code = str(random.randint(1000, 9999))
+    mfa_codes.set(uid, {'user_id': user.pk, 'code': code, 'mode': mode})
+
+    up = profile or UserProfile.objects.get(user=user)
+    if mode == "SMS" and not up.mobile_phone_number:
+        logger.info("Cannot send SMS. No phone number on file.")
+    elif mode == "EMAIL" and user.email:
+        # "Send SMS to self.user.email
+        mfa_via_email(user, code)
+    elif mode == "EMAIL" and not user.email:
+        logger.info("Cannot send email. No email_on_file.")
+    return uid
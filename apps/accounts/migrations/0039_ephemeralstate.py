@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.9 on 2026-10-19 10:56
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0038_queuedemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EphemeralState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True)),
+                ('value', models.TextField(blank=True, default='')),
+                ('counter', models.IntegerField(default=0)),
+                ('expires', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.RemoveField(
+            model_name='mfacode',
+            name='user',
+        ),
+        migrations.DeleteModel(
+            name='MFACode',
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.9 on 2026-10-19 11:04
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0008_alter_user_username_max_length'),
+        ('accounts', '0040_loginfailure'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserLookup',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='lookup', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('username_lower', models.CharField(max_length=150, null=True, unique=True)),
+                ('email_lower', models.CharField(blank=True, db_index=True, default='', max_length=254)),
+            ],
+        ),
+    ]
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, transaction
+
+BATCH_SIZE = 500
+
+
+def backfill(apps, schema_editor):
+    """
+    Create the UserLookup rows of the existing users, one transaction per
+    batch of BATCH_SIZE users so that a large auth_user table is not
+    locked for the whole run. Usernames equal to a previous one but for
+    the case get no username_lower.
+    """
+    User = apps.get_model('auth', 'User')
+    UserLookup = apps.get_model('accounts', 'UserLookup')
+    last_pk = 0
+    while True:
+        users = list(User.objects.filter(pk__gt=last_pk, lookup__isnull=True)
+                     .order_by('pk').values_list('pk', 'username', 'email')[:BATCH_SIZE])
+        if not users:
+            return
+        lowers = set(username.strip().lower() for _, username, _ in users)
+        taken = set(UserLookup.objects.filter(username_lower__in=lowers)
+                    .values_list('username_lower', flat=True))
+        rows = []
+        for pk, username, email in users:
+            username_lower = username.strip().lower()
+            if username_lower in taken:
+                username_lower = None
+            else:
+                taken.add(username_lower)
+            rows.append(UserLookup(user_id=pk, username_lower=username_lower,
+                                   email_lower=(email or '').strip().lower()))
+        with transaction.atomic():
+            UserLookup.objects.bulk_create(rows)
+        last_pk = users[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('accounts', '0041_userlookup'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
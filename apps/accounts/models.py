@@ -4,20 +4,23 @@ import uuid
 from datetime import datetime, timedelta
 from django.contrib.admin.models import LogEntry
 from django.utils import timezone
-from django.db import models
+from django.core.cache import cache
+from django.db import IntegrityError, models, transaction
 from django.conf import settings
 from django.utils.translation import ugettext_lazy as _
 from django.core.urlresolvers import reverse
+from .hashing import HashedUserIdMixin
+from .lookups import normalize
+from .principal import invalidate_principal
 from .emails import (send_password_reset_url_via_email,
                      send_activation_key_via_email,
-                     mfa_via_email, send_invite_to_create_account,
+                     send_invite_to_create_account,
                      send_invitation_code_to_user,
                      notify_admin_of_invite_request)
 import logging
-from django.utils.crypto import pbkdf2
 import binascii
 from django.utils.translation import ugettext
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
 ADDITION = 1
@@ -219,49 +222,19 @@ class UserProfile(models.Model):
         super(UserProfile, self).save(**kwargs)
 
 
-class MFACode(models.Model):
-    user = models.ForeignKey(settings.AUTH_USER_MODEL)
-    uid = models.CharField(blank=True,
-                           default=uuid.uuid4,
-                           max_length=36, editable=False)
-    tries_counter = models.IntegerField(default=0, editable=False)
-    code = models.CharField(blank=True, max_length=4, editable=False)
-    mode = models.CharField(max_length=5, default="",
-                            choices=MFA_CHOICES)
-    valid = models.BooleanField(default=True)
-    expires = models.DateTimeField(blank=True)
-    added = models.DateField(auto_now_add=True)
+class EphemeralState(models.Model):
+    """
+    A short lived value of the database backend of
+    `apps.accounts.ephemeral.EphemeralStore`. Expired rows are deleted
+    as new ones are written.
+    """
+    key = models.CharField(max_length=255, unique=True)
+    value = models.TextField(blank=True, default='')
+    counter = models.IntegerField(default=0)
+    expires = models.DateTimeField(db_index=True)
 
     def __str__(self):
-        name = 'To %s via %s' % (self.user,
-                                 self.mode)
-        return name
-
-    def endpoint(self):
-        e = ""
-        up = UserProfile.objects.get(user=self.user)
-        if self.mode == "SMS" and up.mobile_phone_number:
-            e = up.mobile_phone_number
-        if self.mode == "EMAIL" and self.user.email:
-            e = self.user.email
-        return e
-
-    def save(self, **kwargs):
-        if not self.id:
-            now = pytz.utc.localize(datetime.utcnow())
-            expires = now + timedelta(days=1)
-            self.expires = expires
-            self.code = str(random.randint(1000, 9999))
-            up = UserProfile.objects.get(user=self.user)
-            if self.mode == "SMS" and not up.mobile_phone_number:
-                logger.info("Cannot send SMS. No phone number on file.")
-            elif self.mode == "EMAIL" and self.user.email:
-                # "Send SMS to self.user.email
-                mfa_via_email(self.user, self.code)
-            elif self.mode == "EMAIL" and not self.user.email:
-                logger.info("Cannot send email. No email_on_file.")
-
-        super(MFACode, self).save(**kwargs)
+        return self.key
 
 
 class RequestInvite(models.Model):
@@ -306,7 +279,7 @@ class RequestInvite(models.Model):
         verbose_name = "Invite Request"
 
 
-class UserRegisterCode(models.Model):
+class UserRegisterCode(HashedUserIdMixin, models.Model):
     user_id_hash = models.CharField(max_length=64, blank=True, default="")
     code = models.CharField(max_length=30, db_index=True)
     valid = models.BooleanField(default=False, blank=True)
@@ -348,9 +321,7 @@ class UserRegisterCode(models.Model):
 
     def save(self, commit=True, **kwargs):
         if commit:
-            self.user_id_hash = binascii.hexlify(pbkdf2(self.user_id_hash,
-                                                        get_user_id_salt(),
-                                                        settings.USER_ID_ITERATIONS)).decode("ascii")
+            self.hash_user_id_hash()
             if self.sender:
                 up = UserProfile.objects.get(user=self.sender)
                 if self.sent is False:
@@ -458,6 +429,73 @@ class ValidPasswordResetKey(models.Model):
             super(ValidPasswordResetKey, self).save(**kwargs)
 
 
+EMAIL_STATUS_CHOICES = (
+    ('queued', 'Queued'),
+    ('sending', 'Sending'),
+    ('sent', 'Sent'),
+    ('failed', 'Failed'),
+)
+
+
+class QueuedEmail(models.Model):
+    """
+    An email waiting in the outbox. Emails are queued on the request
+    path and delivered in batches by `apps.accounts.outbox.send_queued`.
+    """
+    subject = models.CharField(max_length=255)
+    from_email = models.CharField(max_length=254)
+    to = models.TextField(help_text="Recipients, one per line.")
+    text_body = models.TextField()
+    html_body = models.TextField(blank=True, default='')
+    dedup_key = models.CharField(max_length=64, db_index=True)
+    status = models.CharField(max_length=10, choices=EMAIL_STATUS_CHOICES, default='queued')
+    attempts = models.IntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created = models.DateTimeField(auto_now_add=True)
+    sent = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        index_together = (('status', 'next_attempt'),)
+
+    def __str__(self):
+        return '%s to %s (%s)' % (self.subject, ', '.join(self.recipients()), self.status)
+
+    def recipients(self):
+        return self.to.split()
+
+
+class UserLookup(models.Model):
+    """
+    The lower cased username and email of a user, indexed for the case
+    insensitive lookups of `apps.accounts.lookups`. Kept up to date by
+    the `update_user_lookup` receiver.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, primary_key=True,
+                                related_name='lookup')
+    # NULL for the usernames that only differ from another one by case
+    username_lower = models.CharField(max_length=150, unique=True, null=True)
+    email_lower = models.CharField(max_length=254, db_index=True, blank=True, default='')
+
+    def __str__(self):
+        return '%s %s' % (self.username_lower, self.email_lower)
+
+
+class LoginFailure(models.Model):
+    """
+    Audit record of a failed login, written in batches by
+    `apps.accounts.lockout`.
+    """
+    username = models.CharField(max_length=255, db_index=True)
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
+    user_agent = models.CharField(max_length=255, blank=True, default='')
+    path = models.CharField(max_length=255, blank=True, default='')
+    created = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return '%s from %s at %s' % (self.username, self.ip_address, self.created)
+
+
 def random_key_id(y=20):
     return ''.join(random.choice('ABCDEFGHIJKLM'
                                  'NOPQRSTUVWXYZ') for x in range(y))
@@ -511,6 +549,47 @@ def export_admin_log(sender, instance, **kwargs):
         admin_logger.info(msg)
 
 
+def userinfo_cache_key(user_id):
+    return 'accounts.userinfo:%s' % user_id
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+@receiver(post_save, sender='bluebutton.Crosswalk')
+@receiver(post_delete, sender='bluebutton.Crosswalk')
+def invalidate_userinfo(sender, instance, **kwargs):
+    """
+    The cached userinfo response is built from the user and its
+    crosswalk, so drop it when either changes.
+    """
+    cache.delete(userinfo_cache_key(getattr(instance, 'user_id', instance.pk)))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+@receiver(post_save, sender='bluebutton.Crosswalk')
+@receiver(post_delete, sender='bluebutton.Crosswalk')
+def invalidate_principal_cache(sender, instance, **kwargs):
+    invalidate_principal(getattr(instance, 'user_id', instance.pk))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def update_user_lookup(sender, instance, update_fields=None, **kwargs):
+    # last_login updates and the like do not touch the lookup
+    if update_fields is not None and not {'username', 'email'} & set(update_fields):
+        return
+    values = {'username_lower': normalize(instance.username),
+              'email_lower': normalize(instance.email)}
+    try:
+        with transaction.atomic():
+            UserLookup.objects.update_or_create(user_id=instance.pk, defaults=values)
+    except IntegrityError:
+        values['username_lower'] = None
+        UserLookup.objects.update_or_create(user_id=instance.pk, defaults=values)
+
+
 def get_user_id_salt(salt=settings.USER_ID_SALT):
     """
     Assumes `USER_ID_SALT` is a hex encoded value. Decodes the salt val,
@@ -0,0 +1,222 @@
+import hashlib
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import connection, transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+logger = logging.getLogger('hhs_server.%s' % __name__)
+perf_logger = logging.getLogger('performance')
+
+# serializes the background senders of this process
+_sender_lock = threading.Lock()
+# set when emails were queued since the running sender last looked
+_pending = threading.Event()
+
+
+def _queued_email_model():
+    # accounts.models imports the emails module, which queues through here
+    return apps.get_model('accounts', 'QueuedEmail')
+
+
+def make_dedup_key(from_email, to, subject, text_body):
+    key = '\n'.join([from_email, ' '.join(to), subject, text_body])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def queue_email(subject, text_body, from_email, to, html_body=''):
+    """
+    Add an email to the outbox and schedule its delivery once the
+    current transaction commits. An identical email still waiting in
+    the outbox, or sent less than `EMAIL_OUTBOX_DEDUP_SECONDS` ago,
+    is not queued again. Returns the QueuedEmail or None.
+    """
+    QueuedEmail = _queued_email_model()
+    dedup_key = make_dedup_key(from_email, to, subject, text_body)
+    window = timezone.now() - timedelta(seconds=getattr(settings, 'EMAIL_OUTBOX_DEDUP_SECONDS', 300))
+    duplicates = QueuedEmail.objects.filter(dedup_key=dedup_key).exclude(status='failed')
+    if duplicates.filter(created__gte=window).exists() or \
+            duplicates.filter(status__in=('queued', 'sending')).exists():
+        logger.info("Skipped duplicate email '%s' to %s", subject, ', '.join(to))
+        return None
+
+    email = QueuedEmail.objects.create(subject=subject, from_email=from_email, to='\n'.join(to),
+                                       text_body=text_body, html_body=html_body,
+                                       dedup_key=dedup_key)
+    start_sender()
+    return email
+
+
+def queue_emails(emails):
+    """
+    Add many (subject, text, from, to, html) emails to the outbox with
+    one insert, skipping the duplicate check, and schedule their delivery.
+    """
+    QueuedEmail = _queued_email_model()
+    QueuedEmail.objects.bulk_create([
+        QueuedEmail(subject=subject, from_email=from_email, to='\n'.join(to),
+                    text_body=text_body, html_body=html_body,
+                    dedup_key=make_dedup_key(from_email, to, subject, text_body))
+        for subject, text_body, from_email, to, html_body in emails])
+    start_sender()
+
+
+def _claim(batch_size):
+    """
+    Claim up to `batch_size` emails due for delivery. Claimed emails are
+    leased for `EMAIL_OUTBOX_LEASE_SECONDS`; a sender that dies leaves
+    them to be claimed again when the lease expires.
+    """
+    QueuedEmail = _queued_email_model()
+    now = timezone.now()
+    due = QueuedEmail.objects.filter(status__in=('queued', 'sending'), next_attempt__lte=now)
+    ids = list(due.order_by('next_attempt', 'pk').values_list('pk', flat=True)[:batch_size])
+    if not ids:
+        return []
+    lease = now + timedelta(seconds=getattr(settings, 'EMAIL_OUTBOX_LEASE_SECONDS', 300))
+    # only the emails still due are claimed, another sender may have won some
+    due.filter(pk__in=ids).update(status='sending', next_attempt=lease)
+    return list(QueuedEmail.objects.filter(pk__in=ids, status='sending', next_attempt=lease))
+
+
+def _retry_delay(attempts):
+    return getattr(settings, 'EMAIL_OUTBOX_RETRY_SECONDS', 60) * 2 ** (attempts - 1)
+
+
+def send_batch(batch_size=None):
+    """
+    Send one batch of due emails over a single connection.
+    Returns a (sent, failed) tuple.
+    """
+    QueuedEmail = _queued_email_model()
+    batch_size = batch_size or getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', 50)
+    max_attempts = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+    emails = _claim(batch_size)
+    if not emails:
+        return 0, 0
+
+    start = time.time()
+    sent = failed = 0
+    mail_connection = get_connection()
+    try:
+        mail_connection.open()
+        for email in emails:
+            msg = EmailMultiAlternatives(email.subject, email.text_body, email.from_email,
+                                         email.recipients(), connection=mail_connection)
+            if email.html_body:
+                msg.attach_alternative(email.html_body, 'text/html')
+            try:
+                msg.send()
+            except Exception as e:
+                failed += 1
+                attempts = email.attempts + 1
+                status = 'failed' if attempts >= max_attempts else 'queued'
+                logger.warning("Email %s attempt %s failed: %s", email.pk, attempts, e)
+                QueuedEmail.objects.filter(pk=email.pk).update(
+                    status=status, attempts=F('attempts') + 1, last_error=str(e),
+                    next_attempt=timezone.now() + timedelta(seconds=_retry_delay(attempts)))
+            else:
+                sent += 1
+                # the bodies hold MFA codes and reset links: not kept once sent
+                QueuedEmail.objects.filter(pk=email.pk).update(
+                    status='sent', attempts=F('attempts') + 1, last_error='', sent=timezone.now(),
+                    text_body='', html_body='')
+    except Exception as e:
+        # the connection could not be opened: give the whole batch back
+        logger.warning("Email connection failed: %s", e)
+        QueuedEmail.objects.filter(pk__in=[email.pk for email in emails], status='sending').update(
+            status='queued', next_attempt=timezone.now() + timedelta(seconds=_retry_delay(1)),
+            last_error=str(e))
+        failed = len(emails) - sent
+    finally:
+        mail_connection.close()
+
+    perf_logger.info("email_outbox batch sent=%s failed=%s ms=%.1f",
+                     sent, failed, (time.time() - start) * 1000)
+    return sent, failed
+
+
+def purge_failed():
+    """
+    Blank the bodies of the emails that failed and were queued more than
+    `EMAIL_OUTBOX_FAILED_RETENTION_SECONDS` ago. Returns their number.
+    """
+    QueuedEmail = _queued_email_model()
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'EMAIL_OUTBOX_FAILED_RETENTION_SECONDS',
+                                                        7 * 24 * 3600))
+    return QueuedEmail.objects.filter(status='failed', created__lt=cutoff).exclude(
+        text_body='', html_body='').update(text_body='', html_body='')
+
+
+def send_queued(batch_size=None):
+    """
+    Send batches until no email is due, then purge the old failed ones.
+    Returns a (sent, failed) tuple.
+    """
+    total_sent = total_failed = 0
+    while True:
+        sent, failed = send_batch(batch_size)
+        total_sent += sent
+        total_failed += failed
+        if not sent:
+            # nothing due, or everything failed: leave the rest for the retry
+            purge_failed()
+            return total_sent, total_failed
+
+
+def outbox_metrics():
+    """
+    Return the number of emails per status and the age in seconds of
+    the oldest email waiting to be sent.
+    """
+    QueuedEmail = _queued_email_model()
+    metrics = dict((status, 0) for status in ('queued', 'sending', 'sent', 'failed'))
+    for row in QueuedEmail.objects.values('status').annotate(count=Count('pk')):
+        metrics[row['status']] = row['count']
+    oldest = QueuedEmail.objects.filter(status__in=('queued', 'sending')).aggregate(
+        oldest=Min('created'))['oldest']
+    metrics['oldest_pending_seconds'] = (timezone.now() - oldest).total_seconds() if oldest else 0
+    return metrics
+
+
+def _send_in_thread():
+    _pending.set()
+    try:
+        while _pending.is_set():
+            if not _sender_lock.acquire(False):
+                # the running sender will pick up the new emails
+                return
+            try:
+                while _pending.is_set():
+                    _pending.clear()
+                    send_queued()
+            except Exception:
+                logger.exception("Email outbox sender failed")
+            finally:
+                _sender_lock.release()
+    finally:
+        connection.close()
+
+
+def start_sender():
+    """
+    Deliver the outbox in a background thread once the current transaction
+    commits, or inline when `EMAIL_OUTBOX_BACKGROUND` is False. Emails
+    left behind are sent by `manage.py send_queued_email`.
+    """
+    if not getattr(settings, 'EMAIL_OUTBOX_BACKGROUND', True):
+        send_queued()
+        return
+
+    def start():
+        thread = threading.Thread(target=_send_in_thread, name='email-outbox')
+        thread.daemon = True
+        thread.start()
+
+    transaction.on_commit(start)
@@ -0,0 +1,180 @@
+from django.apps import apps
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.core.cache import caches
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import router, transaction
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+
+class Principal(object):
+    """
+    The user with their UserProfile and Crosswalk, None when they have
+    none or the user is anonymous.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.profile = _related(user, 'userprofile') if user.is_authenticated else None
+        self.crosswalk = _related(user, 'crosswalk') if user.is_authenticated else None
+        self.session_auth_hash = user.get_session_auth_hash() if user.is_authenticated else None
+
+    def fields(self):
+        """
+        The field values of the rows, to cache. The password hash is left
+        out: the session is checked against `session_auth_hash`.
+        """
+        return {'user': _fields(self.user, exclude=('password', )),
+                'profile': _fields(self.profile), 'crosswalk': _fields(self.crosswalk),
+                'session_auth_hash': self.session_auth_hash}
+
+    @classmethod
+    def from_fields(cls, fields):
+        """
+        Rebuild the principal of `fields`. The password of the user is
+        deferred: read from the database if used, and left alone by save().
+        """
+        user = _instance(get_user_model(), fields['user'])
+        profile = _instance(apps.get_model('accounts', 'UserProfile'), fields['profile'])
+        crosswalk = _instance(apps.get_model('bluebutton', 'Crosswalk'), fields['crosswalk'])
+        # as select_related would
+        for name, related in (('userprofile', profile), ('crosswalk', crosswalk)):
+            if related is not None:
+                setattr(user, name, related)
+        principal = cls.__new__(cls)
+        principal.user, principal.profile, principal.crosswalk = user, profile, crosswalk
+        principal.session_auth_hash = fields['session_auth_hash']
+        return principal
+
+
+def _related(user, name):
+    try:
+        return getattr(user, name)
+    except ObjectDoesNotExist:
+        return None
+
+
+def _fields(instance, exclude=()):
+    if instance is None:
+        return None
+    return dict((field.attname, getattr(instance, field.attname))
+                for field in instance._meta.concrete_fields if field.attname not in exclude)
+
+
+def _instance(model, fields):
+    if fields is None:
+        return None
+    names = list(fields)
+    return model.from_db(router.db_for_read(model), names, [fields[name] for name in names])
+
+
+def principal_cache():
+    """
+    The cache of the principals and of their versions, not the database
+    backed default one. It is shared by the processes of the server, as
+    the login lockout counters.
+    """
+    return caches[getattr(settings, 'PRINCIPAL_CACHE', 'counters')]
+
+
+def principal_keys(user_id):
+    return ('accounts.principal_version:%s' % user_id,
+            'accounts.principal:%s' % user_id)
+
+
+def load_principal(user_id):
+    """
+    Load the principal of `user_id` with a single query.
+    """
+    user = get_user_model().objects.select_related(
+        'userprofile', 'crosswalk').filter(pk=user_id).first()
+    return Principal(user) if user is not None else None
+
+
+def get_principal(user_id):
+    """
+    Return the principal of `user_id`, whose field values are cached
+    for `PRINCIPAL_CACHE_SECONDS`. The cached copy carries the version of
+    the user's rows, which `invalidate_principal` bumps whenever one of
+    them is saved or deleted.
+    """
+    cache = principal_cache()
+    version_key, key = principal_keys(user_id)
+    cached = cache.get_many([version_key, key])
+    version = cached.get(version_key, 0)
+    entry = cached.get(key)
+    if entry is not None and entry[0] == version:
+        return Principal.from_fields(entry[1])
+    principal = load_principal(user_id)
+    if principal is not None:
+        cache.set(key, (version, principal.fields()), getattr(settings, 'PRINCIPAL_CACHE_SECONDS', 300))
+    return principal
+
+
+def invalidate_principal(user_id):
+    """
+    Invalidate the cached principal of `user_id`, now and once the
+    current transaction commits: until then, concurrent requests still
+    read and may cache the rows as they were.
+    """
+    _bump_version(user_id)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _bump_version(user_id))
+
+
+def _bump_version(user_id):
+    cache = principal_cache()
+    version_key, key = principal_keys(user_id)
+    # the version outlives the copies it invalidates
+    cache.add(version_key, 0, getattr(settings, 'PRINCIPAL_CACHE_SECONDS', 300) * 2)
+    try:
+        cache.incr(version_key)
+    except ValueError:
+        pass
+    cache.delete(key)
+
+
+def get_session_principal(request):
+    """
+    The principal of the user logged in the session, with the checks of
+    `django.contrib.auth.get_user` and of the backend's `get_user`, or
+    None.
+    """
+    user_id = request.session.get(SESSION_KEY)
+    backend_path = request.session.get(BACKEND_SESSION_KEY)
+    if user_id is None or backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return None
+    principal = get_principal(get_user_model()._meta.pk.to_python(user_id))
+    if principal is None:
+        return None
+    # as ModelBackend.get_user, which refuses inactive users
+    user_can_authenticate = getattr(auth.load_backend(backend_path), 'user_can_authenticate', None)
+    if user_can_authenticate is not None and not user_can_authenticate(principal.user):
+        return None
+    session_hash = request.session.get(HASH_SESSION_KEY)
+    if not (session_hash and constant_time_compare(session_hash, principal.session_auth_hash)):
+        return None
+    return principal
+
+
+class PrincipalMiddleware(object):
+    """
+    Set `request.principal` and serve `request.user` from it, so that the
+    user, profile and crosswalk rows are read once until one of them
+    changes. Sessions that do not check out fall back to
+    `django.contrib.auth.get_user`, which logs them out.
+
+    Goes after AuthenticationMiddleware.
+    """
+
+    def process_request(self, request):
+        def principal():
+            if not hasattr(request, '_cached_principal'):
+                request._cached_principal = (get_session_principal(request) or
+                                             Principal(auth.get_user(request)))
+            return request._cached_principal
+
+        request.principal = SimpleLazyObject(principal)
+        request.user = SimpleLazyObject(lambda: request.principal.user)
@@ -1,3 +1,4 @@
+import json
 from django.conf import settings
 from django.core.serializers.json import DjangoJSONEncoder
 from django.core.urlresolvers import reverse
@@ -57,6 +58,29 @@ class TestUserSelfEndpoint(BaseApiTest):
         }
         self.assertJSONEqual(response.content.decode(ENCODED), expected_json)
 
+    def test_user_self_get_conditional(self):
+        """
+        Tests that /connect/userinfo honours If-None-Match until the
+        user changes.
+        """
+        user = self._create_user('john', '123456', first_name='John')
+        access_token = self._get_access_token('john', '123456')
+        auth_headers = {'HTTP_AUTHORIZATION': 'Bearer %s' % access_token}
+        response = self.client.get(reverse('openid_connect_userinfo'), **auth_headers)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        response = self.client.get(reverse('openid_connect_userinfo'),
+                                   HTTP_IF_NONE_MATCH=etag, **auth_headers)
+        self.assertEqual(response.status_code, 304)
+
+        user.first_name = 'Jack'
+        user.save()
+        response = self.client.get(reverse('openid_connect_userinfo'),
+                                   HTTP_IF_NONE_MATCH=etag, **auth_headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content.decode(ENCODED))['given_name'], 'Jack')
+
 
 class TestSingleAccessTokenValidator(BaseApiTest):
 
@@ -0,0 +1,86 @@
+import io
+import os
+import tempfile
+import time
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from ..bulk_invitations import (InviteQuotaExceeded, hash_user_id, issue_requested_invitations,
+                                issue_user_codes, read_csv)
+from ..models import Invitation, QueuedEmail, RequestInvite, UserProfile, UserRegisterCode
+
+CSV = """Email,First_Name,Last_Name,Username,User_Id
+anna@example.com,Anna,Smith,anna,111
+bob@example.com,Bob,Jones,bob,222
+carl@example.com,Carl,Brown,carl,
+"""
+
+
+class BulkInvitationsTestCase(TestCase):
+
+    def setUp(self):
+        self.sender = User.objects.create_user(username='fred', email='fred@example.com', password='foobar')
+        UserProfile.objects.create(user=self.sender, user_type='DEV', remaining_user_invites=5)
+
+    def test_issue_user_codes(self):
+        rows = read_csv(io.StringIO(CSV))
+        self.assertEqual(issue_user_codes(rows, self.sender, batch_size=2), 3)
+
+        codes = UserRegisterCode.objects.order_by('email')
+        self.assertEqual([c.username for c in codes], ['anna', 'bob', 'carl'])
+        self.assertEqual(len(set(c.code for c in codes)), 3)
+        self.assertEqual(codes[0].user_id_hash, hash_user_id('111'))
+        self.assertTrue(all(c.sent for c in codes))
+        self.assertEqual(UserProfile.objects.get(user=self.sender).remaining_user_invites, 2)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox),
+                         ['anna@example.com', 'bob@example.com', 'carl@example.com'])
+
+    def test_quota_is_checked(self):
+        UserProfile.objects.filter(user=self.sender).update(remaining_user_invites=2)
+        with self.assertRaises(InviteQuotaExceeded):
+            issue_user_codes(read_csv(io.StringIO(CSV)), self.sender)
+        self.assertFalse(UserRegisterCode.objects.exists())
+        self.assertEqual(UserProfile.objects.get(user=self.sender).remaining_user_invites, 2)
+
+    def test_issue_requested_invitations(self):
+        for email in ('anna@example.com', 'bob@example.com'):
+            RequestInvite.objects.create(first_name='A', last_name='B', email=email)
+        self.assertEqual(issue_requested_invitations(RequestInvite.objects.all()), 2)
+        self.assertEqual(Invitation.objects.count(), 2)
+        self.assertFalse(RequestInvite.objects.filter(invite_sent=False).exists())
+        # already sent requests are skipped
+        self.assertEqual(issue_requested_invitations(RequestInvite.objects.all()), 0)
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write(CSV)
+        try:
+            out = io.StringIO()
+            call_command('issue_invitations', f.name, kind='developer', stdout=out)
+        finally:
+            os.remove(f.name)
+        self.assertIn('Issued 3 invitations', out.getvalue())
+        self.assertEqual(Invitation.objects.count(), 3)
+
+
+@skipUnless(os.environ.get('RUN_BENCHMARKS'), "Set RUN_BENCHMARKS=1 to run the benchmarks.")
+@override_settings(EMAIL_OUTBOX_BACKGROUND=True)
+class BulkInvitationsBenchmark(TestCase):
+    """
+    Issue 100k user codes, the emails only being queued.
+    """
+    count = 100000
+
+    def test_throughput(self):
+        rows = [{'email': 'user%s@example.com' % i, 'first_name': 'First', 'last_name': 'Last',
+                 'username': 'user%s' % i, 'user_id': str(i)} for i in range(self.count)]
+        start = time.time()
+        issue_user_codes(rows, processes=os.cpu_count())
+        elapsed = time.time() - start
+        print("\n%s user codes issued in %.1f s, %.0f/s" % (self.count, elapsed, self.count / elapsed))
+        self.assertEqual(UserRegisterCode.objects.count(), self.count)
+        self.assertEqual(QueuedEmail.objects.count(), self.count)
@@ -0,0 +1,59 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .. import ephemeral
+from ..ephemeral import EphemeralStore
+from ..models import EphemeralState
+
+
+class CacheStoreTestCase(TestCase):
+
+    def setUp(self):
+        self.store = EphemeralStore('test-%s' % self.id(), 60)
+
+    def test_set_get(self):
+        self.assertIsNone(self.store.get('a'))
+        self.store.set('a', {'next_uri': '/'})
+        self.assertEqual(self.store.get('a'), {'next_uri': '/'})
+
+    def test_pop_is_single_use(self):
+        self.store.set('a', {'next_uri': '/'})
+        self.assertEqual(self.store.pop('a'), {'next_uri': '/'})
+        self.assertIsNone(self.store.pop('a'))
+        self.assertIsNone(self.store.get('a'))
+
+    def test_incr(self):
+        self.assertEqual(self.store.incr('a'), 1)
+        self.assertEqual(self.store.incr('a'), 2)
+        self.store.delete('a')
+        self.assertEqual(self.store.incr('a'), 1)
+
+    def test_counters_of_a_database_cache_are_in_the_table(self):
+        with mock.patch('apps.accounts.ephemeral.cache_increments_atomically', return_value=False):
+            self.store.set('a', 1)
+            self.assertEqual(self.store.incr('a'), 1)
+            self.assertEqual(self.store.incr('a'), 2)
+            self.assertEqual(EphemeralState.objects.get(key=self.store.make_key('a') + ':count').counter, 2)
+            self.store.delete('a')
+            self.assertEqual(self.store.incr('a'), 1)
+
+
+@override_settings(EPHEMERAL_STORE='db')
+class DatabaseStoreTestCase(CacheStoreTestCase):
+
+    def test_expired_values_are_ignored_and_cleaned_up(self):
+        self.store.set('a', 1)
+        self.store.incr('a')
+        EphemeralState.objects.update(expires=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(self.store.get('a'))
+        self.assertIsNone(self.store.pop('a'))
+        self.assertEqual(self.store.incr('a'), 1)
+
+        ephemeral._last_cleanup[0] = 0
+        EphemeralState.objects.update(expires=timezone.now() - timedelta(seconds=1))
+        self.store.set('b', 2)
+        self.assertEqual(list(EphemeralState.objects.values_list('key', flat=True)),
+                         [self.store.make_key('b')])
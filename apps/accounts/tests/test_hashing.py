@@ -0,0 +1,43 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from ..hashing import HashedUserId, UserIdHasher, compute_hash
+
+
+class UserIdHasherTestCase(SimpleTestCase):
+
+    def test_hash_is_applied_once(self):
+        hasher = UserIdHasher()
+        hashed = hasher.hash('1000079035')
+        self.assertIsInstance(hashed, HashedUserId)
+        self.assertEqual(hasher.hash(hashed), hashed)
+
+    def test_raw_id_shaped_as_a_hash_is_hashed(self):
+        hasher = UserIdHasher()
+        raw = compute_hash('1000079035', hasher.salt(), 1)
+        self.assertNotEqual(hasher.hash(raw), raw)
+
+    def test_results_are_cached(self):
+        hasher = UserIdHasher()
+        with mock.patch('apps.accounts.hashing.compute_hash', wraps=compute_hash) as computed:
+            first = hasher.hash('1000079035')
+            self.assertEqual(hasher.hash('1000079035'), first)
+        self.assertEqual(computed.call_count, 1)
+        # the raw id is not a key of the cache
+        self.assertNotIn(b'1000079035', hasher._cache)
+
+    @override_settings(USER_ID_HASH_CACHE_SIZE=2)
+    def test_cache_is_bounded(self):
+        hasher = UserIdHasher()
+        for user_id in ('1', '2', '3'):
+            hasher.hash(user_id)
+        self.assertEqual(len(hasher._cache), 2)
+
+    def test_settings_change_drops_the_cache(self):
+        hasher = UserIdHasher()
+        before = hasher.hash('1000079035')
+        with override_settings(USER_ID_ITERATIONS=3):
+            after = hasher.hash('1000079035')
+        self.assertNotEqual(before, after)
+        self.assertEqual(hasher.hash('1000079035', iterations=3), after)
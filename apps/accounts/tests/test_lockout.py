@@ -0,0 +1,148 @@
+import os
+import random
+import time
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.test import TestCase, override_settings
+
+from .. import lockout
+from ..checks import check_shared_caches
+from ..models import LoginFailure, UserProfile
+
+
+class LockoutTestCase(TestCase):
+
+    def setUp(self):
+        # the cache outlives the tests: the usernames are unique
+        self.username = 'fred-%s' % self._testMethodName
+        user = User.objects.create_user(self.username, password='bedrocks')
+        UserProfile.objects.create(user=user)
+        self.url = reverse('mfa_login')
+
+    def tearDown(self):
+        lockout.reset(self.username, '127.0.0.1')
+
+    def login(self, password, username=None, ip_address='127.0.0.1'):
+        return self.client.post(self.url, {'username': username or self.username, 'password': password},
+                                REMOTE_ADDR=ip_address)
+
+    def test_username_is_locked_out(self):
+        for i in range(4):
+            self.assertEqual(self.login('wrong').status_code, 200)
+        self.assertEqual(self.login('bedrocks').status_code, 302)
+        self.client.logout()
+        self.assertEqual(self.login('wrong').status_code, 200)
+        # the fifth failure locks the username out, from any address
+        with self.assertNumQueries(0):
+            response = self.login('bedrocks', ip_address='10.0.0.1')
+        self.assertEqual(response.status_code, 403)
+        self.assertContains(response, 'too many login attempts', status_code=403)
+
+        self.assertEqual(LoginFailure.objects.filter(username=self.username).count(), 5)
+        lockout.reset(username=self.username)
+        self.assertEqual(self.login('bedrocks').status_code, 302)
+
+    def test_padded_username_is_locked_out(self):
+        for i in range(5):
+            self.login('wrong', username=' %s ' % self.username.upper())
+        self.assertEqual(self.login('bedrocks').status_code, 403)
+        self.assertEqual(self.login('bedrocks', username='%s ' % self.username).status_code, 403)
+
+    @override_settings(LOGIN_FAILURE_IP_LIMIT=3)
+    def test_ip_address_is_locked_out(self):
+        for i in range(3):
+            self.login('wrong', username='nobody%s' % i, ip_address='10.0.0.%s' % random.randint(2, 254))
+        ip_address = '10.1.%s.%s' % (random.randint(0, 255), random.randint(1, 254))
+        for i in range(3):
+            self.login('wrong', username='nobody%s' % i, ip_address=ip_address)
+        self.assertEqual(self.login('bedrocks', ip_address=ip_address).status_code, 403)
+        self.assertEqual(self.login('bedrocks', ip_address='10.2.0.1').status_code, 302)
+        lockout.reset(ip_address=ip_address)
+
+    @override_settings(LOGIN_FAILURE_WINDOW=100)
+    def test_sliding_window(self):
+        start = (time.time() // 100 + 1) * 100
+        with mock.patch('apps.accounts.lockout.time.time', return_value=start + 90):
+            for i in range(4):
+                self.assertFalse(lockout.record_failure(self.username, None))
+        # a quarter into the next window, 3 of the 4 failures still count
+        with mock.patch('apps.accounts.lockout.time.time', return_value=start + 125):
+            self.assertFalse(lockout.record_failure(self.username, None))
+            self.assertTrue(lockout.record_failure(self.username, None))
+
+    @override_settings(LOGIN_AUDIT_BACKGROUND=True, LOGIN_AUDIT_BUFFER_SIZE=3, LOGIN_AUDIT_BATCH_SIZE=2)
+    def test_audit_buffer_is_bounded(self):
+        with mock.patch('apps.accounts.lockout._start_audit_writer'):
+            for i in range(5):
+                lockout.queue_audit('user%s' % i, '127.0.0.1', '', '/')
+        self.assertFalse(LoginFailure.objects.exists())
+        self.assertEqual(lockout.flush_audit(), 3)
+        self.assertEqual(sorted(LoginFailure.objects.values_list('username', flat=True)),
+                         ['user2', 'user3', 'user4'])
+
+
+class SharedCacheCheckTestCase(TestCase):
+
+    def test_per_process_cache_is_refused(self):
+        errors = check_shared_caches(None)
+        self.assertEqual([error.id for error in errors], ['accounts.E002', 'accounts.E002'])
+
+    @override_settings(DEBUG=True)
+    def test_per_process_cache_is_allowed_in_debug(self):
+        self.assertEqual(check_shared_caches(None), [])
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'counters': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                     'LOCATION': '/tmp/counters'},
+    })
+    def test_shared_cache_is_accepted(self):
+        self.assertEqual(check_shared_caches(None), [])
+
+    @override_settings(LOGIN_LOCKOUT_CACHE='missing')
+    def test_missing_cache_is_refused(self):
+        self.assertEqual([error.id for error in check_shared_caches(None)], ['accounts.E001', 'accounts.E002'])
+
+
+@skipUnless(os.environ.get('RUN_BENCHMARKS'), "Set RUN_BENCHMARKS=1 to run the benchmarks.")
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+                   LOGIN_FAILURE_IP_LIMIT=20, LOGIN_AUDIT_BACKGROUND=True)
+class LockoutBenchmark(TestCase):
+    """
+    Compare the login throughput of legitimate traffic with a credential
+    stuffing mix: 95% wrong passwords for 500 usernames from 20 addresses.
+    """
+    count = 2000
+
+    def setUp(self):
+        self.url = reverse('mfa_login')
+        user = User.objects.create_user('fred', password='bedrocks')
+        UserProfile.objects.create(user=user)
+
+    def run_mix(self, attack_ratio):
+        statuses = {}
+        start = time.time()
+        for i in range(self.count):
+            if random.random() < attack_ratio:
+                data = {'username': 'victim%s' % random.randint(0, 499), 'password': 'guess%s' % i}
+                ip_address = '10.9.0.%s' % random.randint(1, 20)
+            else:
+                data = {'username': 'fred', 'password': 'bedrocks'}
+                ip_address = '192.168.0.1'
+            status = self.client.post(self.url, data, REMOTE_ADDR=ip_address).status_code
+            statuses[status] = statuses.get(status, 0) + 1
+            self.client.logout()
+        return self.count / (time.time() - start), statuses
+
+    def test_throughput(self):
+        with mock.patch('apps.accounts.lockout._start_audit_writer'):
+            normal, statuses = self.run_mix(0)
+            print("\nlegitimate logins: %.0f requests/s %s" % (normal, statuses))
+            attack, statuses = self.run_mix(0.95)
+            print("attack mix: %.0f requests/s %s" % (attack, statuses))
+            start = time.time()
+            written = lockout.flush_audit()
+            print("%s audit records written in %.2f s" % (written, time.time() - start))
+        self.assertGreater(statuses.get(403, 0), 0)
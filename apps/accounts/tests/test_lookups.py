@@ -0,0 +1,63 @@
+from importlib import import_module
+from unittest import skipUnless
+
+from django.apps import apps
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+
+from ..lookups import user_by_email, users_by_email, users_by_username
+from ..models import UserLookup
+
+
+def query_plan(queryset):
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return ' '.join(str(row[-1]) for row in cursor.fetchall())
+
+
+class UserLookupTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('Fred', email='Fred@Example.com ', password='bedrocks')
+
+    def test_lookup_follows_the_user(self):
+        self.assertEqual(users_by_email('fred@example.COM').get(), self.user)
+        self.assertEqual(users_by_username(' FRED').get(), self.user)
+        self.user.email = 'wilma@example.com'
+        self.user.save()
+        self.assertFalse(users_by_email('fred@example.com').exists())
+        self.assertEqual(user_by_email('WILMA@example.com'), self.user)
+        self.user.delete()
+        self.assertFalse(UserLookup.objects.exists())
+
+    def test_email_authentication_ignores_case(self):
+        self.assertEqual(authenticate(username='FRED@example.com', password='bedrocks'), self.user)
+        self.assertIsNone(authenticate(username='FRED@example.com', password='wrong'))
+        # an ambiguous address authenticates nobody
+        User.objects.create_user('fred2', email='fred@example.com', password='bedrocks')
+        self.assertIsNone(authenticate(username='fred@example.com', password='bedrocks'))
+
+    def test_username_differing_by_case(self):
+        user = User.objects.create_user('FRED', email='other@example.com')
+        self.assertIsNone(UserLookup.objects.get(user=user).username_lower)
+        self.assertEqual(users_by_username('fred').get(), self.user)
+
+    def test_backfill(self):
+        User.objects.create_user('fred')
+        UserLookup.objects.all().delete()
+        import_module('apps.accounts.migrations.0042_backfill_userlookup').backfill(apps, None)
+        self.assertEqual(UserLookup.objects.count(), 2)
+        self.assertEqual(users_by_username('fred').get(), self.user)
+        self.assertEqual(users_by_email('fred@example.com').get(), self.user)
+
+    @skipUnless(connection.vendor == 'sqlite', "The query plan assertions are written for SQLite.")
+    def test_lookups_use_the_indexes(self):
+        for queryset in (users_by_email('fred@example.com'), users_by_username('fred')):
+            plan = query_plan(queryset)
+            # "SEARCH TABLE x" before SQLite 3.36, "SEARCH x" since
+            self.assertRegex(plan, r'SEARCH (TABLE )?accounts_userlookup USING (COVERING )?INDEX')
+            self.assertRegex(plan, r'SEARCH (TABLE )?auth_user USING INTEGER PRIMARY KEY')
+            self.assertNotIn('SCAN', plan)
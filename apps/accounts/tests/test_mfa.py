@@ -2,7 +2,8 @@ from django.test import TestCase
 from django.contrib.auth.models import User, Group
 from django.test.client import Client
 from django.core.urlresolvers import reverse
-from apps.accounts.models import UserProfile, MFACode
+from apps.accounts.mfa import mfa_codes
+from apps.accounts.models import UserProfile
 
 
 class MFALoginTestCase(TestCase):
@@ -43,13 +44,13 @@ class MFALoginTestCase(TestCase):
         # Get the UID from the URL
         url_parts = last_url.split("/")
         uid = url_parts[-2]
-        mfac = MFACode.objects.get(uid=uid)
+        mfac = mfa_codes.get(uid)
         # complete the MFA process w/ valid code.
         response = self.client.post(
             reverse(
                 'mfa_code_confirm', args=(
                     uid,)), {
-                'code': mfac.code}, follow=True)
+                'code': mfac['code']}, follow=True)
         # Now that a valid code is provided, the user is logged in (sees
         # Logout)
         self.assertContains(response, 'Logout')
@@ -72,13 +73,50 @@ class MFALoginTestCase(TestCase):
         # Get the UID from the URL
         url_parts = last_url.split("/")
         uid = url_parts[-2]
-        mfac = MFACode.objects.get(uid=uid)
+        mfac = mfa_codes.get(uid)
         # complete the MFA process w/ valid code.
         response = self.client.post(
             reverse(
                 'mfa_code_confirm', args=(
                     uid,)), {
-                'code': mfac.code}, follow=True)
+                'code': mfac['code']}, follow=True)
         # Now that a valid code is provided, the user is logged in (sees
         # Logout)
         self.assertContains(response, 'Logout')
+
+    def test_mfa_code_is_single_use(self):
+        form_data = {'username': 'fred', 'password': 'bedrocks'}
+        response = self.client.post(self.url, form_data, follow=True)
+        uid = response.redirect_chain[-1][0].split("/")[-2]
+        code = mfa_codes.get(uid)['code']
+        confirm_url = reverse('mfa_code_confirm', args=(uid,))
+        self.client.post(confirm_url, {'code': code})
+        self.client.get(reverse('mylogout'))
+        response = self.client.post(confirm_url, {'code': code})
+        self.assertEqual(response.status_code, 404)
+
+    def test_mfa_code_is_invalidated_after_four_wrong_tries(self):
+        form_data = {'username': 'fred', 'password': 'bedrocks'}
+        response = self.client.post(self.url, form_data, follow=True)
+        uid = response.redirect_chain[-1][0].split("/")[-2]
+        code = mfa_codes.get(uid)['code']
+        wrong = '0000' if code != '0000' else '1111'
+        confirm_url = reverse('mfa_code_confirm', args=(uid,))
+        for i in range(4):
+            self.assertEqual(self.client.post(confirm_url, {'code': wrong}).status_code, 200)
+        self.assertEqual(self.client.post(confirm_url, {'code': code}).status_code, 404)
+
+    def test_right_code_is_rejected_after_three_wrong_tries(self):
+        form_data = {'username': 'fred', 'password': 'bedrocks'}
+        response = self.client.post(self.url, form_data, follow=True)
+        uid = response.redirect_chain[-1][0].split("/")[-2]
+        code = mfa_codes.get(uid)['code']
+        wrong = '0000' if code != '0000' else '1111'
+        confirm_url = reverse('mfa_code_confirm', args=(uid,))
+        for i in range(3):
+            self.client.post(confirm_url, {'code': wrong})
+        response = self.client.post(confirm_url, {'code': code})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Maximum tries reached')
+        self.assertNotIn('_auth_user_id', self.client.session)
+        self.assertIsNone(mfa_codes.get(uid))
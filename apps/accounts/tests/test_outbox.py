@@ -0,0 +1,86 @@
+from datetime import timedelta
+from smtplib import SMTPException
+
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from ..models import QueuedEmail
+from ..outbox import outbox_metrics, purge_failed, queue_email, send_batch
+
+
+class FailingBackend(BaseEmailBackend):
+    def send_messages(self, messages):
+        raise SMTPException('connection refused')
+
+
+class CountingBackend(BaseEmailBackend):
+    opened = 0
+
+    def open(self):
+        CountingBackend.opened += 1
+        return True
+
+    def send_messages(self, messages):
+        mail.outbox.extend(messages)
+        return len(messages)
+
+
+class OutboxTestCase(TestCase):
+
+    def test_queued_email_is_sent(self):
+        queue_email('Hello', 'text', 'from@example.com', ['to@example.com'], '<p>html</p>')
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].alternatives, [('<p>html</p>', 'text/html')])
+        email = QueuedEmail.objects.get()
+        self.assertEqual(email.status, 'sent')
+        self.assertEqual(email.attempts, 1)
+        # the body is not kept
+        self.assertEqual((email.text_body, email.html_body), ('', ''))
+
+    def test_duplicates_are_skipped(self):
+        queue_email('Hello', 'text', 'from@example.com', ['to@example.com'])
+        self.assertIsNone(queue_email('Hello', 'text', 'from@example.com', ['to@example.com']))
+        queue_email('Hello', 'other text', 'from@example.com', ['to@example.com'])
+        self.assertEqual(QueuedEmail.objects.count(), 2)
+        self.assertEqual(len(mail.outbox), 2)
+
+    @override_settings(EMAIL_OUTBOX_BACKGROUND=True,
+                       EMAIL_BACKEND='apps.accounts.tests.test_outbox.CountingBackend')
+    def test_batch_uses_one_connection(self):
+        for i in range(5):
+            queue_email('Hello %s' % i, 'text', 'from@example.com', ['to@example.com'])
+        # nothing is sent before the transaction commits
+        self.assertEqual(len(mail.outbox), 0)
+
+        CountingBackend.opened = 0
+        self.assertEqual(send_batch(batch_size=3), (3, 0))
+        self.assertEqual(send_batch(batch_size=3), (2, 0))
+        self.assertEqual(CountingBackend.opened, 2)
+        self.assertEqual(outbox_metrics()['sent'], 5)
+
+    @override_settings(EMAIL_OUTBOX_BACKGROUND=True, EMAIL_OUTBOX_MAX_ATTEMPTS=2,
+                       EMAIL_BACKEND='apps.accounts.tests.test_outbox.FailingBackend')
+    def test_failures_are_retried_with_backoff(self):
+        queue_email('Hello', 'text', 'from@example.com', ['to@example.com'])
+
+        self.assertEqual(send_batch(), (0, 1))
+        email = QueuedEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), ('queued', 1))
+        self.assertIn('connection refused', email.last_error)
+        self.assertGreater(email.next_attempt, timezone.now())
+        # not due yet
+        self.assertEqual(send_batch(), (0, 0))
+
+        QueuedEmail.objects.update(next_attempt=timezone.now())
+        self.assertEqual(send_batch(), (0, 1))
+        email = QueuedEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), ('failed', 2))
+        self.assertEqual(outbox_metrics()['failed'], 1)
+
+        # kept for a while to be sent again, then purged
+        self.assertEqual(purge_failed(), 0)
+        QueuedEmail.objects.update(created=timezone.now() - timedelta(days=8))
+        self.assertEqual(purge_failed(), 1)
+        self.assertEqual(QueuedEmail.objects.get().text_body, '')
@@ -0,0 +1,84 @@
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.db.models.signals import post_save
+from django.test import TestCase
+
+from apps.fhir.bluebutton.models import Crosswalk
+
+from ..models import UserProfile
+from ..principal import get_principal, principal_cache, principal_keys
+
+
+class PrincipalTestCase(TestCase):
+
+    def setUp(self):
+        principal_cache().clear()
+        self.user = User.objects.create_user('fred', email='fred@example.com', password='bedrocks')
+        self.profile = UserProfile.objects.create(user=self.user, user_type='BEN')
+        Crosswalk.objects.create(user=self.user, fhir_id='20140000008325')
+        self.client.login(username='fred', password='bedrocks')
+
+    def test_cached_principal_saves_queries(self):
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['fhir_id'], '20140000008325')
+        # the session and the principal both come from the cache
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['fhir_id'], '20140000008325')
+
+    def test_password_hash_is_not_cached(self):
+        get_principal(self.user.pk)
+        version, fields = principal_cache().get(principal_keys(self.user.pk)[1])
+        self.assertNotIn('password', fields['user'])
+        self.assertNotIn(self.user.password, repr(fields))
+
+    def test_saving_the_cached_user_keeps_the_password(self):
+        get_principal(self.user.pk)
+        user = get_principal(self.user.pk).user
+        user.first_name = 'Fred'
+        user.save()
+        self.assertTrue(User.objects.get(pk=self.user.pk).check_password('bedrocks'))
+
+    def test_saves_invalidate_the_principal(self):
+        self.assertEqual(get_principal(self.user.pk).profile.organization_name, '')
+        self.profile.organization_name = 'Bedrock Inc'
+        self.profile.save()
+        self.assertEqual(get_principal(self.user.pk).profile.organization_name, 'Bedrock Inc')
+        Crosswalk.objects.filter(user=self.user).get().delete()
+        self.assertIsNone(get_principal(self.user.pk).crosswalk)
+
+    def test_password_change_logs_the_session_out(self):
+        self.client.get(reverse('home'))
+        self.user.set_password('pebbles')
+        self.user.save()
+        response = self.client.get(reverse('home'))
+        self.assertFalse(response.wsgi_request.user.is_authenticated())
+
+    def test_deactivation_logs_the_session_out(self):
+        self.client.get(reverse('home'))
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(reverse('home'))
+        self.assertFalse(response.wsgi_request.user.is_authenticated())
+
+    def test_anonymous_principal(self):
+        self.client.logout()
+        response = self.client.get(reverse('home'))
+        self.assertFalse(response.wsgi_request.user.is_authenticated())
+        self.assertIsNone(response.wsgi_request.principal.profile)
+        self.assertIsNone(response.wsgi_request.principal.crosswalk)
+
+    def test_login_does_not_rewrite_the_aal(self):
+        self.client.logout()
+        saved = []
+
+        def profile_saved(sender, instance, **kwargs):
+            saved.append(instance)
+
+        post_save.connect(profile_saved, sender=UserProfile)
+        try:
+            self.client.post(reverse('mfa_login'), {'username': 'fred', 'password': 'bedrocks'})
+        finally:
+            post_save.disconnect(profile_saved, sender=UserProfile)
+        self.assertEqual(saved, [])
+        self.assertEqual(UserProfile.objects.get(user=self.user).aal, '1')
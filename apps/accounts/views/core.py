@@ -142,7 +142,9 @@ def create_account(request):
 @login_required
 def account_settings(request):
     name = _('Account Settings')
-    up, created = UserProfile.objects.get_or_create(user=request.user)
+    up = request.principal.profile
+    if up is None:
+        up, created = UserProfile.objects.get_or_create(user=request.user)
 
     if settings.DEBUG:
         # Display all the groups the user is in.
@@ -1,11 +1,16 @@
 from django.shortcuts import render, get_object_or_404
+from django.contrib.auth.models import User
+from django.http import Http404
 from django.conf import settings
 from django.http import HttpResponseRedirect
 from django.core.urlresolvers import reverse
 from django.contrib.auth import authenticate, login
 from django.contrib import messages
+from django.utils.crypto import constant_time_compare
 from django.utils.translation import ugettext_lazy as _
-from ..models import UserProfile, MFACode
+from ..models import UserProfile
+from ..lockout import login_failed, lockout_protected
+from ..mfa import issue_mfa_code, mfa_codes
 from ..mfa_forms import LoginForm, MFACodeForm
 import logging
 from django.contrib.auth.signals import user_login_failed
@@ -13,36 +18,42 @@ from django.dispatch import receiver
 from ...utils import get_client_ip
 import sys
 from django.views.decorators.cache import never_cache
-from axes.decorators import axes_dispatch
 
 logger = logging.getLogger('hhs_oauth_server.accounts')
 failed_login_log = logging.getLogger('unsuccessful_logins')
 
 
 @receiver(user_login_failed)
-def user_login_failed_callback(sender, credentials, **kwargs):
+def user_login_failed_callback(sender, credentials, request=None, **kwargs):
     lw = "Login failed for %s." % (credentials['username'])
     failed_login_log.warning(lw)
+    login_failed(credentials['username'], request)
 
 
 @never_cache
 def mfa_code_confirm(request, uid):
-    mfac = get_object_or_404(MFACode, uid=uid)
-    user = mfac.user
+    mfac = mfa_codes.get(uid)
+    if mfac is None:
+        raise Http404("No MFA code matches the given query.")
+    user = get_object_or_404(User, pk=mfac['user_id'])
     if request.method == 'POST':
         form = MFACodeForm(request.POST)
         if form.is_valid():
             code = form.cleaned_data['code']
 
-            if code != mfac.code:
-                mfac.tries_counter = mfac.tries_counter + 1
-                if mfac.tries_counter > 3:
-                    messages.error(
-                        request,
-                        _('Maximum tries reached. The authentication attempt has been invalidated.'))
-                    mfac.delete()
-                else:
-                    mfac.save()
+            # count the attempt before comparing, so that concurrent
+            # guesses cannot all be checked against the same code. The
+            # counter outlives the code, so the guesses still in flight
+            # stay rejected.
+            if mfa_codes.incr(uid) > 3:
+                mfa_codes.pop(uid)
+                messages.error(
+                    request,
+                    _('Maximum tries reached. The authentication attempt has been invalidated.'))
+                return render(
+                    request, 'generic/bootstrapform.html', {'form': form})
+
+            if not constant_time_compare(code, mfac['code']):
                 messages.error(
                     request, _('The code supplied did not match what was sent. Please try again.'))
 
@@ -50,14 +61,17 @@ def mfa_code_confirm(request, uid):
                     request, 'generic/bootstrapform.html', {'form': form})
 
             if user.is_active:
+                # the code is used once
+                if mfa_codes.pop(uid) is None:
+                    raise Http404("No MFA code matches the given query.")
                 # Fake backend here since its not needed.
                 user.backend = 'django.contrib.auth.backends.ModelBackend'
                 # User's AAL is 2 factor
                 up = UserProfile.objects.get(user=user)
-                up.aal = '2'
-                up.save()
+                if up.aal != '2':
+                    up.aal = '2'
+                    up.save(update_fields=['aal'])
                 login(request, user)
-                mfac.delete()
                 next_param = request.GET.get('next', '')
                 if next_param:
                     # If a next is in the URL, then go there
@@ -81,7 +95,7 @@ def mfa_code_confirm(request, uid):
 
 
 @never_cache
-@axes_dispatch
+@lockout_protected
 def mfa_login(request):
     if request.method == 'POST':
         form = LoginForm(request.POST)
@@ -98,8 +112,7 @@ def mfa_login(request):
                     # If MFA, send code and redirect
                     if up.mfa_login_mode in ("SMS", "EMAIL") and settings.MFA:
                         # Create an MFA message
-                        mfac = MFACode.objects.create(
-                            user=up.user, mode=up.mfa_login_mode)
+                        uid = issue_mfa_code(user, up.mfa_login_mode, up)
                         # Send code and redirect
                         if up.mfa_login_mode == "SMS":
                             messages.info(
@@ -108,7 +121,7 @@ def mfa_login(request):
                         if up.mfa_login_mode == "EMAIL":
                             messages.info(
                                 request, _('An access code was sent to your email. Please enter it here.'))
-                        rev = reverse('mfa_code_confirm', args=(mfac.uid,))
+                        rev = reverse('mfa_code_confirm', args=(uid,))
                         # Fetch the next and urlencode
                         if request.GET.get('next', ''):
                             if sys.version_info[0] == 3:
@@ -123,8 +136,9 @@ def mfa_login(request):
                         return HttpResponseRedirect(rev)
                     # Else, just login as normal without MFA
                     # User's AAL is single factor
-                    up.aal = '1'
-                    up.save()
+                    if up.aal != '1':
+                        up.aal = '1'
+                        up.save(update_fields=['aal'])
                     login(request, user)
                     logger.info(
                         "Successful login from {}".format(
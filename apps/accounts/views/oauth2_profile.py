@@ -1,6 +1,15 @@
-from django.http import JsonResponse
-from django.views.decorators.http import require_GET
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition, require_GET
+from apps.accounts.models import userinfo_cache_key
+from apps.dot_ext.oauth2_validators import SingleAccessTokenValidator
 from apps.fhir.bluebutton.models import Crosswalk
+from hhs_oauth_server.timing import timed
 from oauth2_provider.decorators import protected_resource
 from collections import OrderedDict
 
@@ -25,18 +34,35 @@ def get_userinfo(user):
     return data
 
 
+@timed('serialize')
+def cached_userinfo(user):
+    """
+    Return the JSON encoded userinfo of `user` and its ETag. The result
+    is cached until the user or its crosswalk changes.
+    """
+    key = userinfo_cache_key(user.pk)
+    userinfo = cache.get(key)
+    if userinfo is None:
+        body = json.dumps(get_userinfo(user), cls=DjangoJSONEncoder).encode('utf-8')
+        userinfo = (body, '"%s"' % hashlib.md5(body).hexdigest())
+        cache.set(key, userinfo, getattr(settings, 'USERINFO_CACHE_SECONDS', 300))
+    return userinfo
+
+
+def userinfo_etag(request):
+    return cached_userinfo(request.resource_owner)[1]
+
+
 @require_GET
-@protected_resource()
+@protected_resource(validator_cls=SingleAccessTokenValidator)
+@condition(etag_func=userinfo_etag)
 def openidconnect_userinfo(request):
-    user = request.resource_owner
-    data = get_userinfo(user)
-    return JsonResponse(data)
+    body, etag = cached_userinfo(request.resource_owner)
+    response = HttpResponse(body, content_type='application/json')
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ('Authorization',))
+    return response
 
 
 def get_fhir_id(user):
-
-    r = None
-    if Crosswalk.objects.filter(user=user).exists():
-        c = Crosswalk.objects.get(user=user)
-        r = c.fhir_id
-    return r
+    return Crosswalk.objects.filter(user=user).values_list('fhir_id', flat=True).first()
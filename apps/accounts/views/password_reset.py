@@ -2,13 +2,13 @@ from django.shortcuts import render, get_object_or_404
 from django.http import HttpResponseRedirect
 from django.core.urlresolvers import reverse
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth.models import User
 from django.contrib.auth import logout
 from django.contrib import messages
 from django.utils.translation import ugettext_lazy as _
 from random import randint
 from ..forms import (ChangeSecretQuestionsForm, PasswordResetForm,
                      PasswordResetRequestForm, SecretQuestionForm)
+from ..lookups import user_by_email
 from ..models import UserProfile, ValidPasswordResetKey
 from django.contrib.auth import authenticate, login
 
@@ -70,9 +70,8 @@ def forgot_password(request):
 
         if form.is_valid():
             data = form.cleaned_data
-            try:
-                u = User.objects.get(email=data['email'])
-            except(User.DoesNotExist):
+            u = user_by_email(data['email'])
+            if u is None:
                 messages.error(request,
                                'A user with the email supplied '
                                'does not exist.')
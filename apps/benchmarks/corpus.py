@@ -0,0 +1,67 @@
+import json
+from collections import OrderedDict
+
+from django.contrib.auth.models import User
+from django.test import RequestFactory
+from requests import Response
+
+from apps.capabilities.models import ProtectedCapability
+from apps.fhir.bluebutton.models import Crosswalk
+from apps.fhir.bluebutton.tests.data_conformance import CONFORMANCE
+from apps.fhir.bluebutton.utils import build_rewrite_list, get_resourcerouter
+from apps.fhir.server.stub import StubFhirBackend, bundle
+
+# size: (claims in the bundle, padding of each claim in bytes)
+SIZES = OrderedDict([
+    ('small', (5, 0)),
+    ('medium', (50, 500)),
+    ('huge', (2000, 2000)),
+])
+PATIENT_ID = '-20140000008325'
+HICN_HASH = '96228a57f37efea543f4f370f96f1dbf01c3e3129041dba3ea4367545507c6e7'
+FHIR_PREFIX = '/v1/fhir/'
+
+
+class Corpus(object):
+    """
+    The fixed inputs of the benchmarks, built from the ResourceRouter of
+    the test fixture: the conformance statement of the tests, and for
+    each of `SIZES` a searchset Bundle of a patient and their claims, as
+    the backend would send it, made by the stub FHIR backend. A
+    beneficiary with a crosswalk is created when missing.
+    """
+
+    def __init__(self):
+        self.resource_router = get_resourcerouter()
+        self.rewrite_list = build_rewrite_list()
+        self.host_path = 'http://testserver%s' % FHIR_PREFIX
+        self.bundles = OrderedDict()
+        for size, (claims, padding) in SIZES.items():
+            backend = StubFhirBackend(eob_count='fixed:%s' % claims, eob_bytes=str(padding))
+            resources = [backend.patient(PATIENT_ID)] + backend.eobs(PATIENT_ID)
+            self.bundles[size] = json.dumps(bundle(self.resource_router.fhir_url, resources))
+        self.conformance = CONFORMANCE
+
+        self.user, created = User.objects.get_or_create(username='benchmark-beneficiary')
+        if created:
+            Crosswalk.objects.create(user=self.user, fhir_source=self.resource_router,
+                                     fhir_id=PATIENT_ID, user_id_hash=HICN_HASH)
+        self.capability = ProtectedCapability(slug='patient/ExplanationOfBenefit.read', protected_resources=json.dumps([
+            ['GET', '%sPatient/' % FHIR_PREFIX], ['GET', '%sPatient/[id]' % FHIR_PREFIX],
+            ['GET', '%sCoverage/' % FHIR_PREFIX], ['GET', '%sCoverage/[id]' % FHIR_PREFIX],
+            ['GET', '%sExplanationOfBenefit/' % FHIR_PREFIX],
+            ['GET', '%sExplanationOfBenefit/[id]' % FHIR_PREFIX],
+        ]))
+
+    def request(self, path='%sExplanationOfBenefit/' % FHIR_PREFIX, **params):
+        request = RequestFactory().get(path, params)
+        request.user = self.user
+        request.resource_owner = self.user
+        return request
+
+    def response(self, size):
+        response = Response()
+        response.status_code = 200
+        response.encoding = 'utf-8'
+        response._content = self.bundles[size].encode('utf-8')
+        return response
@@ -0,0 +1,68 @@
+import json
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from apps.benchmarks.suite import baseline, best_of, compare, run
+
+
+class Command(BaseCommand):
+    help = ("Measure the ops/s, peak and retained memory of the FHIR proxy hot paths on fixed "
+            "inputs, and fail when they regress from a baseline. Runs in a throwaway test "
+            "database loaded with the test fixture; use --settings=hhs_oauth_server.settings.test "
+            "to run offline on SQLite.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help="Only run the benchmarks whose name contains one of these")
+        parser.add_argument('--min-time', type=float, default=1.0,
+                            help="Seconds spent timing each benchmark")
+        parser.add_argument('--repeat', type=int, default=5,
+                            help="Timings per benchmark, the best one is kept")
+        parser.add_argument('--baseline', default=None, help="Compare with the results in this JSON file")
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help="Fraction of ops/s lost or memory gained that is a regression")
+        parser.add_argument('--speed-threshold', type=float, default=None,
+                            help="Fraction of ops/s lost that is a regression, --threshold by default. "
+                                 "Timings on shared machines vary more than the memory figures")
+        parser.add_argument('--save', default=None, help="Write the results as a baseline JSON file")
+
+    def handle(self, *args, **options):
+        base = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                base = json.load(f)
+
+        def progress(name, result):
+            self.stdout.write('%-40s %12.1f ops/s %10d peak B %8d retained B %6d blocks' % (
+                name, result['ops_per_s'], result['peak_bytes'], result['retained_bytes'],
+                result['retained_blocks']))
+
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            # queries are not logged, as with DEBUG off in production
+            with override_settings(DEBUG=False):
+                call_command('loaddata', 'testfixture', verbosity=0)
+                results = run(options['names'], options['min_time'], options['repeat'], progress)
+                if base is not None:
+                    # the timings are noisy: the regressed benchmarks are
+                    # measured once more, keeping their best figures
+                    again = [name for name, result in results.items()
+                             if compare({name: result}, base['results'], options['threshold'],
+                                        options['speed_threshold'])]
+                    if again:
+                        self.stdout.write("Measuring again: %s" % ', '.join(again))
+                        for name, result in run(again, options['min_time'], options['repeat'], progress).items():
+                            results[name] = best_of(results[name], result)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump(baseline(results), f, indent=2, sort_keys=True)
+        if base is not None:
+            regressions = compare(results, base['results'], options['threshold'], options['speed_threshold'])
+            if regressions:
+                raise CommandError("Regressions from %s:\n%s" % (options['baseline'], '\n'.join(regressions)))
+            self.stdout.write("No regression from %s." % options['baseline'])
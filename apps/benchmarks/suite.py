@@ -0,0 +1,224 @@
+import gc
+import json
+import platform
+import sys
+import time
+import timeit
+import tracemalloc
+from collections import OrderedDict
+
+from apps.capabilities.models import _match
+from apps.fhir.bluebutton.utils import (build_fhir_response, generate_info_headers,
+                                        mask_list_with_host, post_process_request)
+from apps.fhir.bluebutton.views.home import conformance_filter, get_supported_resources
+from apps.fhir.bluebutton.views.search import get_paging_links
+from apps.fhir.server.utils import text_to_list
+from hhs_oauth_server import metrics
+from hhs_oauth_server.timing import RequestTimer
+from .corpus import PATIENT_ID, SIZES, Corpus
+
+# name: function of the corpus returning the callable to measure
+BENCHMARKS = OrderedDict()
+# regressions of the memory figures below these are noise
+MEMORY_SLACK = {'peak_bytes': 4096, 'retained_bytes': 4096, 'retained_blocks': 16}
+
+
+def benchmark(name, sized=False):
+    """
+    Register the decorated function as benchmark `name`, once for each
+    of `SIZES` as `name[size]` when `sized`.
+    """
+    def register(func):
+        if sized:
+            for size in SIZES:
+                BENCHMARKS['%s[%s]' % (name, size)] = (lambda f, s: lambda corpus: f(corpus, s))(func, size)
+        else:
+            BENCHMARKS[name] = func
+        return func
+    return register
+
+
+@benchmark('mask_list_with_host', sized=True)
+def bench_mask_list_with_host(corpus, size):
+    request, text = corpus.request(), corpus.bundles[size]
+    # mask_list_with_host appends to the list it is given
+    return lambda: mask_list_with_host(request, corpus.host_path, text, list(corpus.rewrite_list))
+
+
+@benchmark('post_process_request', sized=True)
+def bench_post_process_request(corpus, size):
+    request, text = corpus.request(), corpus.bundles[size]
+    return lambda: post_process_request(request, corpus.host_path, text, list(corpus.rewrite_list))
+
+
+@benchmark('build_fhir_response', sized=True)
+def bench_build_fhir_response(corpus, size):
+    request, response = corpus.request(), corpus.response(size)
+    crosswalk = corpus.user.crosswalk
+    call_url = corpus.resource_router.fhir_url + 'ExplanationOfBenefit/'
+    return lambda: build_fhir_response(request, call_url, crosswalk, r=response)
+
+
+@benchmark('get_paging_links')
+def bench_get_paging_links(corpus):
+    base_url = corpus.host_path + 'ExplanationOfBenefit/'
+    return lambda: get_paging_links(base_url, 20, 10, 1000, {'patient': PATIENT_ID})
+
+
+@benchmark('conformance_filter')
+def bench_conformance_filter(corpus):
+    # the statement is filtered in place, so each run parses it as the view does
+    text, resource_router = corpus.conformance, corpus.resource_router
+    return lambda: conformance_filter(json.loads(text, object_pairs_hook=OrderedDict), resource_router)
+
+
+@benchmark('get_supported_resources')
+def bench_get_supported_resources(corpus):
+    resources = json.loads(corpus.conformance)['rest'][0]['resource']
+    resource_names = ['Patient', 'Coverage', 'ExplanationOfBenefit']
+    return lambda: get_supported_resources(resources, resource_names)
+
+
+@benchmark('generate_info_headers')
+def bench_generate_info_headers(corpus):
+    request = corpus.request()
+    return lambda: generate_info_headers(request)
+
+
+@benchmark('text_to_list')
+def bench_text_to_list(corpus):
+    return lambda: text_to_list('["Patient", "patient", "beneficiary", "_id"]')
+
+
+@benchmark('capability_allow')
+def bench_capability_allow(corpus):
+    capability = corpus.capability
+    return lambda: capability.allow('GET', '/v1/fhir/ExplanationOfBenefit/%s' % PATIENT_ID)
+
+
+@benchmark('capability_match_uncached')
+def bench_capability_match(corpus):
+    # _match is memoized, time the match itself
+    match = _match.__wrapped__
+    return lambda: match('/v1/fhir/ExplanationOfBenefit/carrier-%s-1' % PATIENT_ID,
+                         '/v1/fhir/ExplanationOfBenefit/[id]')
+
+
+@benchmark('request_timing')
+def bench_request_timing(corpus):
+    # the timing overhead of an API request: its phases and their histograms
+    phases = ('token', 'crosswalk', 'backend_ttfb', 'backend_download', 'localize', 'serialize', 'db')
+
+    def time_request():
+        timer = RequestTimer()
+        for name in phases:
+            timer.add(name, 0.002)
+        timer.add('total', 0.02)
+        metrics.observe(('bb_oauth_fhir_search', 'ExplanationOfBenefit', 'benchmark'), timer.phases)
+        return timer.server_timing()
+    return time_request
+
+
+def measure_speed(func, min_time=1.0, repeat=5):
+    """
+    The operations per second of `func`, from the best of `repeat`
+    timings of about `min_time` / `repeat` seconds each.
+    """
+    timer = timeit.Timer(func)
+    target = min_time / repeat
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= target:
+            break
+        number = max(number * 2, int(number * target / max(elapsed, 1e-9)))
+    best = min([elapsed] + timer.repeat(repeat - 1, number))
+    return number / best
+
+
+def measure_memory(func):
+    """
+    The peak memory allocated while `func` runs, and the memory and the
+    number of blocks still allocated when it returns, with its result.
+    """
+    gc.collect()
+    gc.disable()
+    tracemalloc.start()
+    try:
+        blocks = sys.getallocatedblocks()
+        before = tracemalloc.get_traced_memory()[0]
+        result = func()
+        current, peak = tracemalloc.get_traced_memory()
+        retained_blocks = sys.getallocatedblocks() - blocks
+    finally:
+        tracemalloc.stop()
+        gc.enable()
+    del result
+    return {
+        'peak_bytes': peak - before,
+        'retained_bytes': current - before,
+        'retained_blocks': retained_blocks,
+    }
+
+
+def run(names=None, min_time=1.0, repeat=5, progress=None):
+    """
+    Run the benchmarks whose name contains one of `names`, all of them by
+    default, and return their results by name. Needs the test fixture in
+    the database.
+    """
+    corpus = Corpus()
+    results = OrderedDict()
+    for name, factory in BENCHMARKS.items():
+        if names and not any(part in name for part in names):
+            continue
+        func = factory(corpus)
+        # warm the caches up before measuring
+        func()
+        result = {'ops_per_s': measure_speed(func, min_time, repeat)}
+        result.update(measure_memory(func))
+        results[name] = result
+        if progress:
+            progress(name, result)
+    return results
+
+
+def baseline(results):
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'machine': '%s %s' % (platform.system(), platform.machine()),
+        'results': results,
+    }
+
+
+def best_of(result, other):
+    """
+    The best figures of two results of a benchmark.
+    """
+    best = dict((key, min(result[key], other[key])) for key in MEMORY_SLACK)
+    best['ops_per_s'] = max(result['ops_per_s'], other['ops_per_s'])
+    return best
+
+
+def compare(results, baseline_results, threshold=0.2, speed_threshold=None):
+    """
+    The regressions of `results` from `baseline_results`: an ops/s drop
+    of more than the `speed_threshold` fraction, `threshold` by default,
+    or a memory growth of more than the `threshold` fraction.
+    Benchmarks missing from the baseline are not compared.
+    """
+    if speed_threshold is None:
+        speed_threshold = threshold
+    regressions = []
+    for name, result in results.items():
+        base = baseline_results.get(name)
+        if base is None:
+            continue
+        if result['ops_per_s'] < base['ops_per_s'] * (1 - speed_threshold):
+            regressions.append('%s: %.0f ops/s, baseline %.0f ops/s'
+                               % (name, result['ops_per_s'], base['ops_per_s']))
+        for key, slack in sorted(MEMORY_SLACK.items()):
+            if result[key] > base[key] * (1 + threshold) + slack:
+                regressions.append('%s: %s %s, baseline %s' % (name, key, result[key], base[key]))
+    return regressions
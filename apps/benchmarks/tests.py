@@ -0,0 +1,37 @@
+from django.test import TestCase
+
+from .suite import BENCHMARKS, best_of, compare, run
+
+
+class MicrobenchmarkTest(TestCase):
+
+    fixtures = ['testfixture']
+
+    def test_run(self):
+        self.assertIn('mask_list_with_host[huge]', BENCHMARKS)
+        results = run(['[small]', 'capability'], min_time=0.001, repeat=1)
+        self.assertEqual(list(results), [
+            'mask_list_with_host[small]', 'post_process_request[small]', 'build_fhir_response[small]',
+            'capability_allow', 'capability_match_uncached'])
+        for result in results.values():
+            self.assertGreater(result['ops_per_s'], 0)
+            self.assertGreater(result['peak_bytes'], 0)
+        self.assertEqual(compare(results, results), [])
+
+    def test_compare(self):
+        base = {'a': {'ops_per_s': 1000, 'peak_bytes': 100000, 'retained_bytes': 0, 'retained_blocks': 10}}
+        self.assertEqual(compare({'a': dict(base['a'], ops_per_s=850),
+                                  'b': dict(base['a'], ops_per_s=1)}, base), [])
+        self.assertEqual(compare({'a': dict(base['a'], ops_per_s=700, peak_bytes=200000, retained_blocks=20)},
+                                 base), [
+            'a: 700 ops/s, baseline 1000 ops/s',
+            'a: peak_bytes 200000, baseline 100000',
+        ])
+        self.assertEqual(len(compare({'a': dict(base['a'], ops_per_s=850)}, base, threshold=0.1)), 1)
+        self.assertEqual(compare({'a': dict(base['a'], ops_per_s=700)}, base, speed_threshold=0.4), [])
+
+    def test_best_of(self):
+        result = {'ops_per_s': 1000, 'peak_bytes': 100, 'retained_bytes': 10, 'retained_blocks': 2}
+        other = {'ops_per_s': 800, 'peak_bytes': 90, 'retained_bytes': 20, 'retained_blocks': 2}
+        self.assertEqual(best_of(result, other),
+                         {'ops_per_s': 1000, 'peak_bytes': 90, 'retained_bytes': 10, 'retained_blocks': 2})
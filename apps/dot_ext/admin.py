@@ -2,6 +2,9 @@ from django.contrib import admin
 from oauth2_provider.models import AccessToken
 from oauth2_provider.models import get_application_model
 
+from .models import TokenRevocation
+from .revocation import start_revocation
+
 
 Application = get_application_model()
 
@@ -31,6 +34,21 @@ class MyApplicationAdmin(admin.ModelAdmin):
         "authorization_grant_type": admin.VERTICAL,
     }
     raw_id_fields = ("user", )
+    actions = ["deactivate_and_revoke_tokens"]
+
+    def deactivate_and_revoke_tokens(self, request, queryset):
+        """
+        Deactivate the selected applications and revoke all their
+        tokens in the background.
+        """
+        queryset.update(active=False)
+        for application in queryset:
+            start_revocation(TokenRevocation.objects.create(
+                application=application, requested_by=request.user))
+        self.message_user(request, "%s application(s) deactivated. Token revocation "
+                                   "progress is available under Token revocations." % len(queryset))
+
+    deactivate_and_revoke_tokens.short_description = "Deactivate and revoke all tokens"
 
 
 admin.site.register(MyApplication, MyApplicationAdmin)
@@ -45,3 +63,23 @@ class MyAccessTokenAdmin(admin.ModelAdmin):
 
 
 admin.site.register(MyAccessToken, MyAccessTokenAdmin)
+
+
+class TokenRevocationAdmin(admin.ModelAdmin):
+
+    list_display = ('id', 'application', 'user', 'scope', 'status',
+                    'revoked', 'total', 'progress', 'created', 'finished')
+    list_filter = ('status', )
+    raw_id_fields = ('application', 'user', 'requested_by')
+    readonly_fields = ('requested_by', 'status', 'total', 'revoked', 'error',
+                       'started', 'updated', 'finished')
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            obj.requested_by = request.user
+        super(TokenRevocationAdmin, self).save_model(request, obj, form, change)
+        if not change:
+            start_revocation(obj)
+
+
+admin.site.register(TokenRevocation, TokenRevocationAdmin)
@@ -1,10 +1,38 @@
+import hashlib
+
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from oauth2_provider.oauth2_validators import OAuth2Validator
 from rest_framework import authentication
 from rest_framework import exceptions
 from apps.fhir.authentication import extract_username
 
 
+def authenticate_client(request):
+    """
+    Authenticate the client with OAuth2Validator, populating request.client.
+
+    Successful results for a given Authorization header are cached for
+    SLS_CLIENT_AUTH_CACHE_SECONDS. The cache key is a hash of the header
+    so the client secret is never stored.
+    """
+    timeout = getattr(settings, 'SLS_CLIENT_AUTH_CACHE_SECONDS', 60)
+    auth = request.META.get('HTTP_AUTHORIZATION')
+    cache_key = None
+    if auth and timeout:
+        cache_key = 'sls_client_auth:%s' % hashlib.sha256(auth.encode('utf-8')).hexdigest()
+        client = cache.get(cache_key)
+        if client is not None:
+            request.client = client
+            return True
+
+    authenticated = OAuth2Validator().authenticate_client(request)
+    if authenticated and cache_key:
+        cache.set(cache_key, request.client, timeout)
+    return authenticated
+
+
 class SLSAuthentication(authentication.BaseAuthentication):
     def authenticate(self, request):
         auth = request.META.get('HTTP_X_AUTHENTICATION')
@@ -28,8 +56,7 @@ class SLSAuthentication(authentication.BaseAuthentication):
             request.client = None
 
         # populates request.client with Application if successful
-        validator = OAuth2Validator()
-        authenticated = validator.authenticate_client(request)
+        authenticated = authenticate_client(request)
         if not authenticated:
             raise exceptions.AuthenticationFailed('No such application')
 
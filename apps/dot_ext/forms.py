@@ -125,7 +125,7 @@ class AllowForm(DotAllowForm):
                                         label="Access to this application expires in")
 
     def __init__(self, *args, **kwargs):
-        application = kwargs.pop('application', None)
+        application = self.application = kwargs.pop('application', None)
 
         if application is None:
             super(AllowForm, self).__init__(*args, **kwargs)
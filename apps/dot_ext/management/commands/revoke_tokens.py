@@ -0,0 +1,52 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from oauth2_provider.models import get_application_model
+
+from apps.dot_ext.models import TokenRevocation
+from apps.dot_ext.revocation import claimable_revocations, run_revocation
+
+
+class Command(BaseCommand):
+    help = ('Revoke in bulk the tokens of an application, a user and/or a scope, '
+            'or run the pending token revocations and resume the stale ones.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--application', help="Client ID of the application")
+        parser.add_argument('--user', help="Username of the token owner")
+        parser.add_argument('--scope', default='', help="Scope slug granted to the tokens")
+        parser.add_argument('--pending', action='store_true',
+                            help="Run the pending revocations, and resume the running ones without progress "
+                                 "for TOKEN_REVOCATION_STALE_SECONDS, instead of creating a new one")
+
+    def handle(self, *args, **options):
+        if options['pending']:
+            for revocation_id in claimable_revocations().order_by('pk').values_list('pk', flat=True):
+                self._run(revocation_id)
+            return
+
+        application = None
+        user = None
+        if options['application']:
+            Application = get_application_model()
+            try:
+                application = Application.objects.get(client_id=options['application'])
+            except Application.DoesNotExist:
+                raise CommandError("No application with client_id %s" % options['application'])
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError("No user %s" % options['user'])
+        if application is None and user is None and not options['scope']:
+            raise CommandError("One of --application, --user, --scope or --pending is required.")
+
+        revocation = TokenRevocation.objects.create(
+            application=application, user=user, scope=options['scope'])
+        self._run(revocation.pk)
+
+    def _run(self, revocation_id):
+        run_revocation(revocation_id)
+        revocation = TokenRevocation.objects.get(pk=revocation_id)
+        self.stdout.write("Revocation %s %s: %s of %s tokens revoked. %s" % (
+            revocation.pk, revocation.status, revocation.revoked,
+            revocation.total, revocation.error))
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.9 on 2026-10-19 12:46
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill(apps, schema_editor):
+    # the running jobs get their last heartbeat from their start
+    TokenRevocation = apps.get_model('dot_ext', 'TokenRevocation')
+    TokenRevocation.objects.filter(status='running').update(updated=F('started'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dot_ext', '0008_consent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tokenrevocation',
+            name='updated',
+            field=models.DateTimeField(blank=True, help_text='Last heartbeat of the worker running the job.', null=True),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
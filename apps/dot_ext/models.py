@@ -1,16 +1,24 @@
 import sys
 import hashlib
 import logging
+from datetime import timedelta
 
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
 from apps.capabilities.models import ProtectedCapability
 from oauth2_provider.models import AbstractApplication
+from oauth2_provider.settings import oauth2_settings
 from django.conf import settings
 
 from apps.dot_ext.oauth2_validators import validate_uris
+from apps.dot_ext.scopes import scope_catalog, scope_filter
+from apps.dot_ext.signals import tokens_revoked
 
 logger = logging.getLogger('hhs_server.%s' % __name__)
 
@@ -41,10 +49,8 @@ class Application(AbstractApplication):
     active = models.BooleanField(default=True)
 
     def scopes(self):
-        scope_list = []
-        for s in self.scope.all():
-            scope_list.append(s.slug)
-        return " ".join(scope_list).strip()
+        app_scopes = scope_catalog.application_scopes(self)
+        return " ".join(slug for slug in scope_catalog.all_scopes() if slug in app_scopes)
 
     def is_valid(self, scopes=None):
         return self.active and self.allow_scopes(scopes)
@@ -57,10 +63,7 @@ class Application(AbstractApplication):
         if not scopes:
             return True
 
-        provided_scopes = set(self.scopes().split())
-        resource_scopes = set(scopes)
-
-        return resource_scopes.issubset(provided_scopes)
+        return scope_catalog.application_scopes(self).issuperset(scopes)
 
     def get_absolute_url(self):
         return reverse('oauth2_provider:detail', args=[str(self.id)])
@@ -75,6 +78,24 @@ class Application(AbstractApplication):
             logger.info(logmsg)
 
 
+@receiver(m2m_changed, sender=Application.scope.through)
+@receiver(post_save, sender=Application)
+@receiver(post_delete, sender=Application)
+@receiver(post_save, sender=ProtectedCapability)
+@receiver(post_delete, sender=ProtectedCapability)
+def invalidate_scope_catalog(sender, **kwargs):
+    """
+    Any change to the capabilities or to the scopes bound to an
+    application invalidates the in-memory scope catalog, now and once the
+    transaction commits: until then, the other processes reload the
+    scopes as they were.
+    """
+    if kwargs.get('action', 'post_').startswith('post_'):
+        scope_catalog.invalidate()
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(scope_catalog.invalidate)
+
+
 class ExpiresInManager(models.Manager):
     """
     Provide a `set_expires_in` and `get_expires_in` methods that
@@ -126,3 +147,150 @@ class ExpiresIn(models.Model):
     expires_in = models.IntegerField()
 
     objects = ExpiresInManager()
+
+
+REVOCATION_STATUS_CHOICES = (
+    ('pending', 'Pending'),
+    ('running', 'Running'),
+    ('done', 'Done'),
+    ('failed', 'Failed'),
+)
+
+
+class TokenRevocation(models.Model):
+    """
+    A bulk revocation of the access tokens matching an application,
+    a user and/or a scope. The job is executed in batches by
+    `apps.dot_ext.revocation.run_revocation`, which reports its
+    progress in `total` and `revoked` and bumps `updated` after each
+    batch.
+    """
+    application = models.ForeignKey(Application, null=True, blank=True, on_delete=models.SET_NULL)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True,
+                             on_delete=models.SET_NULL, related_name='+')
+    scope = models.CharField(max_length=255, blank=True, default='',
+                             help_text="Revoke only the tokens granted this scope.")
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True,
+                                     on_delete=models.SET_NULL, related_name='+')
+    status = models.CharField(max_length=10, choices=REVOCATION_STATUS_CHOICES, default='pending',
+                              db_index=True)
+    total = models.IntegerField(default=0, help_text="Matching tokens when the job started.")
+    revoked = models.IntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    updated = models.DateTimeField(null=True, blank=True,
+                                   help_text="Last heartbeat of the worker running the job.")
+    finished = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return 'Revocation %s (%s)' % (self.pk, self.status)
+
+    def progress(self):
+        if not self.total:
+            return 100 if self.status == 'done' else 0
+        return min(100, int(self.revoked * 100 / self.total))
+
+
+class ConsentManager(models.Manager):
+    """
+    Provide cached lookups of the consent a user gave to an application.
+    The cache key is generated from the user id and the client_id.
+    """
+
+    @staticmethod
+    def make_key(user_id, client_id):
+        return 'dot_ext.consent:%s:%s' % (user_id, client_id)
+
+    def get_valid(self, user, application):
+        """
+        Return the unexpired Consent of `user` for `application`,
+        or None. Missing consents are not cached, so that a new approval
+        is seen at once.
+        """
+        key = self.make_key(user.pk, application.client_id)
+        consent = cache.get(key)
+        if consent is None:
+            consent = self.filter(user=user, application=application).first()
+            if consent is not None:
+                cache.set(key, consent, getattr(settings, 'CONSENT_CACHE_SECONDS', 300))
+
+        if consent is not None and consent.expires > timezone.now():
+            return consent
+        return None
+
+    def remember(self, user, application, scopes, expires_in=None):
+        """
+        Record that `user` approved `scopes` for `application`. The consent
+        lasts `expires_in` seconds, the expiry chosen on the approval form.
+        """
+        lifetime = expires_in or oauth2_settings.ACCESS_TOKEN_EXPIRE_SECONDS
+        consent, _ = self.update_or_create(
+            user=user, application=application,
+            defaults={
+                'scope': ' '.join(sorted(set(scopes))),
+                'expires_in': expires_in,
+                'expires': timezone.now() + timedelta(seconds=lifetime),
+            })
+        key = self.make_key(user.pk, application.client_id)
+        cache.delete(key)
+        # a concurrent request may cache the previous consent until commit
+        transaction.on_commit(lambda: cache.delete(key))
+        return consent
+
+    def revoke(self, application=None, user=None, scope=''):
+        """
+        Delete the consents matching `application`, `user` and `scope`
+        and drop them from the cache.
+        """
+        consents = self.all()
+        if application is not None:
+            consents = consents.filter(application=application)
+        if user is not None:
+            consents = consents.filter(user=user)
+        if scope:
+            consents = consents.filter(scope_filter(scope))
+
+        keys = [self.make_key(user_id, client_id) for user_id, client_id in
+                consents.values_list('user_id', 'application__client_id')]
+        consents.delete()
+        cache.delete_many(keys)
+
+
+class Consent(models.Model):
+    """
+    The scopes a user approved for an application on the authorization
+    page, and the access expiry chosen there. While the consent is valid
+    a new authorization request for the same or fewer scopes is approved
+    without showing the page again.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    application = models.ForeignKey(Application, on_delete=models.CASCADE)
+    scope = models.TextField(blank=True, default='')
+    expires_in = models.IntegerField(null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    expires = models.DateTimeField()
+
+    objects = ConsentManager()
+
+    class Meta:
+        unique_together = ('user', 'application')
+
+    def __str__(self):
+        return '%s: %s' % (self.user, self.application)
+
+    def allows(self, scopes):
+        """
+        Check if the consent covers all the provided scopes
+        :param scopes: An iterable containing the scopes to check
+        """
+        return set(scopes).issubset(self.scope.split())
+
+
+@receiver(tokens_revoked)
+def revoke_consents(sender, application=None, user=None, scope='', **kwargs):
+    """
+    Revoking tokens also revokes the matching consents, so the user
+    is asked again on the next authorization.
+    """
+    Consent.objects.revoke(application=application, user=user, scope=scope)
@@ -12,13 +12,46 @@ from oauth2_provider.validators import URIValidator
 from oauth2_provider.settings import oauth2_settings
 from oauth2_provider.validators import urlsplit
 
+from hhs_oauth_server.timing import set_label, timed
+
 
 class SingleAccessTokenValidator(OAuth2Validator):
     """
     This custom oauth2 validator checks if a valid token
     exists for the current user/application and return
     it instead of creating a new one.
+
+    The token validation and the steps of the token endpoint are timed
+    as phases of the request.
     """
+
+    @timed('token')
+    def validate_bearer_token(self, token, scopes, request):
+        valid = super(SingleAccessTokenValidator, self).validate_bearer_token(token, scopes, request)
+        if valid:
+            set_label('application', request.client.name)
+        return valid
+
+    @timed('client_auth')
+    def authenticate_client(self, request, *args, **kwargs):
+        authenticated = super(SingleAccessTokenValidator, self).authenticate_client(request, *args, **kwargs)
+        if authenticated:
+            set_label('application', request.client.name)
+        return authenticated
+
+    @timed('client_auth')
+    def authenticate_client_id(self, client_id, request, *args, **kwargs):
+        authenticated = super(SingleAccessTokenValidator, self).authenticate_client_id(
+            client_id, request, *args, **kwargs)
+        if authenticated:
+            set_label('application', request.client.name)
+        return authenticated
+
+    @timed('grant')
+    def validate_code(self, client_id, code, client, request, *args, **kwargs):
+        return super(SingleAccessTokenValidator, self).validate_code(
+            client_id, code, client, request, *args, **kwargs)
+
     def confirm_redirect_uri(self, client_id, code, redirect_uri, client, *args, **kwargs):
         if redirect_uri is None:
             # Set to default
@@ -32,6 +65,7 @@ class SingleAccessTokenValidator(OAuth2Validator):
             *args,
             **kwargs)
 
+    @timed('token_save')
     def save_bearer_token(self, token, request, *args, **kwargs):
         """
         Check if an access_token exists for the couple user/application
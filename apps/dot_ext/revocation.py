@@ -0,0 +1,159 @@
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, RefreshToken
+
+from .models import ExpiresIn, TokenRevocation
+from .scopes import scope_filter
+from .signals import tokens_revoked
+
+logger = logging.getLogger('hhs_server.%s' % __name__)
+
+
+def matching_tokens(application=None, user=None, scope=''):
+    """
+    Return the AccessToken queryset matching all the given criteria.
+    """
+    tokens = AccessToken.objects.all()
+    if application is not None:
+        tokens = tokens.filter(application=application)
+    if user is not None:
+        tokens = tokens.filter(user=user)
+    if scope:
+        tokens = tokens.filter(scope_filter(scope))
+    return tokens
+
+
+def revoke_tokens(application=None, user=None, scope='', batch_size=None, progress=None):
+    """
+    Delete the access tokens matching `application`, `user` and `scope`
+    along with their refresh tokens, and the ExpiresIn records of the
+    application and user pairs left without tokens.
+
+    Tokens are deleted with set-based DELETE statements, one short
+    transaction per batch of `batch_size` tokens. `progress` is called
+    with the size of each batch once it is committed, and may raise to
+    stop. Returns the number of revoked tokens.
+    """
+    if application is None and user is None and not scope:
+        raise ValueError('An application, a user or a scope is required.')
+
+    batch_size = batch_size or getattr(settings, 'TOKEN_REVOCATION_BATCH_SIZE', 1000)
+    tokens = matching_tokens(application, user, scope).order_by('pk')
+
+    revoked = 0
+    last_pk = 0
+    while True:
+        batch = list(tokens.filter(pk__gt=last_pk).values_list(
+            'pk', 'user_id', 'application__client_id')[:batch_size])
+        if not batch:
+            break
+        last_pk = batch[-1][0]
+        token_ids = [pk for pk, user_id, client_id in batch]
+        pairs = set((user_id, client_id) for pk, user_id, client_id in batch)
+
+        with transaction.atomic():
+            # the refresh tokens first, so that nothing is left to cascade
+            # from the access tokens
+            RefreshToken.objects.filter(access_token_id__in=token_ids).delete()
+            AccessToken.objects.filter(pk__in=token_ids).delete()
+            # the pairs keeping tokens, as those outside of the scope, keep their ExpiresIn
+            pairs -= set(AccessToken.objects.filter(
+                user_id__in=set(user_id for user_id, client_id in pairs),
+                application__client_id__in=set(client_id for user_id, client_id in pairs)).values_list(
+                'user_id', 'application__client_id').distinct())
+            ExpiresIn.objects.filter(key__in=[ExpiresIn.objects.make_key(client_id, user_id)
+                                              for user_id, client_id in pairs]).delete()
+
+        revoked += len(token_ids)
+        if progress:
+            progress(len(token_ids))
+
+    tokens_revoked.send(sender=AccessToken, application=application, user=user, scope=scope)
+    logger.info("Revoked %s tokens (application=%s, user=%s, scope=%s)",
+                revoked, application, user, scope)
+    return revoked
+
+
+class RevocationClaimLost(Exception):
+    """
+    The job was resumed by another worker, which took over its progress.
+    """
+
+
+def claimable_revocations():
+    """
+    The pending TokenRevocations, and the running ones whose worker has
+    not reported progress for `TOKEN_REVOCATION_STALE_SECONDS`: it
+    presumably died.
+    """
+    stale = timezone.now() - timedelta(seconds=getattr(settings, 'TOKEN_REVOCATION_STALE_SECONDS', 3600))
+    return TokenRevocation.objects.filter(Q(status='pending') | Q(status='running', updated__lt=stale))
+
+
+def run_revocation(revocation_id):
+    """
+    Execute the TokenRevocation `revocation_id`, if pending or stale,
+    recording its progress. Does nothing if the job was already claimed
+    by another worker. A stale job resumes with the tokens left.
+
+    Each batch bumps `updated`, the heartbeat of the job. The claim is
+    identified by `started`: once another worker resumes the job, the
+    progress of this one updates nothing and it stops.
+    """
+    now = timezone.now()
+    claimed = claimable_revocations().filter(pk=revocation_id).update(
+        status='running', started=now, updated=now)
+    if not claimed:
+        return
+
+    revocation = TokenRevocation.objects.select_related('application', 'user').get(pk=revocation_id)
+    jobs = TokenRevocation.objects.filter(pk=revocation_id, started=now)
+    jobs.update(total=F('revoked') + matching_tokens(
+        revocation.application, revocation.user, revocation.scope).count())
+
+    def progress(count):
+        if not jobs.update(revoked=F('revoked') + count, updated=timezone.now()):
+            raise RevocationClaimLost()
+
+    try:
+        revoke_tokens(revocation.application, revocation.user, revocation.scope, progress=progress)
+    except RevocationClaimLost:
+        logger.warning("Token revocation %s was resumed by another worker", revocation_id)
+    except Exception as e:
+        logger.exception("Token revocation %s failed", revocation_id)
+        jobs.update(status='failed', error=str(e), finished=timezone.now())
+    else:
+        jobs.update(status='done', finished=timezone.now())
+
+
+def _run_in_thread(revocation_id):
+    try:
+        run_revocation(revocation_id)
+    finally:
+        connection.close()
+
+
+def start_revocation(revocation):
+    """
+    Run `revocation` in a background thread once the current transaction
+    commits, or inline when `TOKEN_REVOCATION_BACKGROUND` is False.
+    Jobs left pending or running by a stopped process are picked up by
+    `manage.py revoke_tokens --pending`.
+    """
+    if not getattr(settings, 'TOKEN_REVOCATION_BACKGROUND', True):
+        run_revocation(revocation.pk)
+        return
+
+    def start():
+        thread = threading.Thread(target=_run_in_thread, args=(revocation.pk,),
+                                  name='token-revocation-%s' % revocation.pk)
+        thread.daemon = True
+        thread.start()
+
+    transaction.on_commit(start)
@@ -1,9 +1,142 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
 from django.db.models import Q
 
+from oauth2_provider.models import get_application_model
 from oauth2_provider.scopes import BaseScopes
 
 from apps.capabilities.models import ProtectedCapability
 
+SCOPE_CATALOG_VERSION_KEY = 'dot_ext.scope_catalog.version'
+
+
+class ScopeCatalog(object):
+    """
+    In-memory catalog of the ProtectedCapability scopes and of the scopes
+    bound to each Application.
+
+    The catalog is rebuilt lazily after an invalidation. Invalidations bump
+    a version number stored in the default cache so that every process
+    drops its copy; processes compare their version with the shared one
+    at most every `SCOPE_CATALOG_VERSION_CHECK_SECONDS` seconds.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked_at = 0
+        # (version, scopes, defaults, application scopes) swapped as a whole
+        # so readers never see a half-built catalog.
+        self._state = None
+
+    def _shared_version(self):
+        version = cache.get(SCOPE_CATALOG_VERSION_KEY)
+        if version is None:
+            cache.add(SCOPE_CATALOG_VERSION_KEY, _new_version(), None)
+            version = cache.get(SCOPE_CATALOG_VERSION_KEY)
+        return version
+
+    def _load(self):
+        state = self._state
+        now = time.time()
+        interval = getattr(settings, 'SCOPE_CATALOG_VERSION_CHECK_SECONDS', 5)
+        if state is not None and now - self._checked_at < interval:
+            return state
+
+        with self._lock:
+            version = self._shared_version()
+            state = self._state
+            if state is None or state[0] != version:
+                scopes = OrderedDict()
+                defaults = []
+                rows = ProtectedCapability.objects.order_by('pk').values_list('slug', 'title', 'default')
+                for slug, title, default in rows:
+                    scopes[slug] = title
+                    if default:
+                        defaults.append(slug)
+                state = (version, scopes, frozenset(defaults), {})
+                self._state = state
+            self._checked_at = now
+        return state
+
+    def all_scopes(self):
+        """
+        Return an OrderedDict mapping each scope slug to its title.
+        """
+        return self._load()[1]
+
+    def default_scopes(self):
+        """
+        Return the list of the default scope slugs.
+        """
+        _, scopes, defaults, _ = self._load()
+        return [slug for slug in scopes if slug in defaults]
+
+    def application_scopes(self, application):
+        """
+        Return a frozenset with the slugs of the scopes bound to `application`.
+        """
+        if application is None or application.pk is None:
+            return frozenset()
+
+        application_scopes = self._load()[3]
+        scopes = application_scopes.get(application.pk)
+        if scopes is None:
+            Application = get_application_model()
+            scopes = frozenset(Application.scope.through.objects.filter(
+                application_id=application.pk).values_list('protectedcapability__slug', flat=True))
+            application_scopes[application.pk] = scopes
+        return scopes
+
+    def available_scopes(self, application):
+        """
+        Return the list of default scopes plus the scopes of `application`,
+        ordered as in `all_scopes`.
+        """
+        app_scopes = self.application_scopes(application)
+        _, scopes, defaults, _ = self._load()
+        return [slug for slug in scopes if slug in app_scopes or slug in defaults]
+
+    def invalidate(self):
+        """
+        Drop the local catalog and bump the shared version so that the
+        other processes reload theirs.
+        """
+        with self._lock:
+            self._state = None
+            if cache.add(SCOPE_CATALOG_VERSION_KEY, _new_version(), None):
+                return
+            try:
+                cache.incr(SCOPE_CATALOG_VERSION_KEY)
+            except ValueError:
+                # the key was evicted between `add` and `incr`
+                cache.set(SCOPE_CATALOG_VERSION_KEY, _new_version(), None)
+
+
+def _new_version():
+    """
+    Seed versions from the clock so that a version key evicted from
+    the cache is never re-created with a value a process already holds.
+    """
+    return int(time.time() * 1000)
+
+
+scope_catalog = ScopeCatalog()
+
+
+def scope_filter(scope):
+    """
+    Return a Q object matching the rows whose space separated
+    `scope` field contains `scope`.
+    """
+    return (Q(scope=scope) |
+            Q(scope__startswith=scope + ' ') |
+            Q(scope__endswith=' ' + scope) |
+            Q(scope__contains=' ' + scope + ' '))
+
 
 class CapabilitiesScopes(BaseScopes):
     """
@@ -14,16 +147,14 @@ class CapabilitiesScopes(BaseScopes):
         Returns a dict-like object that contains all the scopes
         in the ProtectedCapability model.
         """
-        return dict(ProtectedCapability.objects.values_list('slug', 'title'))
+        return dict(scope_catalog.all_scopes())
 
     def get_available_scopes(self, application=None, request=None, *args, **kwargs):
         """
         Returns a list that contains all the capabilities related
         to the current application.
         """
-        app_scopes = list(
-            ProtectedCapability.objects.filter(Q(default=True) | Q(application=application)).values_list('slug', flat=True))
-        return app_scopes
+        return scope_catalog.available_scopes(application)
 
     def get_default_scopes(self, application=None, request=None, *args, **kwargs):
         """
@@ -31,4 +162,4 @@ class CapabilitiesScopes(BaseScopes):
         to the current application.
         """
         # at the moment we assume that the default scopes are all those availables
-        return list(ProtectedCapability.objects.filter(default=True).values_list('slug', flat=True))
+        return scope_catalog.default_scopes()
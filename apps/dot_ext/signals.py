@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent once when tokens are revoked in bulk or by their owner, so that
+# anything caching token or consent data can drop it in a single step.
+tokens_revoked = Signal(providing_args=['application', 'user', 'scope'])
@@ -0,0 +1,73 @@
+import os
+import time
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.test import Client
+from django.test.utils import override_settings
+from oauth2_provider.compat import parse_qs, urlparse
+
+from apps.test import BaseApiTest
+from ..models import Application
+
+FLOWS = 100
+ENGINES = (
+    ('database', 'django.contrib.sessions.backends.db'),
+    ('cache with write-through', 'django.contrib.sessions.backends.cached_db'),
+    ('cache', 'django.contrib.sessions.backends.cache'),
+    ('signed cookies', 'django.contrib.sessions.backends.signed_cookies'),
+)
+
+
+@skipUnless(os.environ.get('RUN_BENCHMARKS'), "Set RUN_BENCHMARKS=1 to run the benchmarks.")
+# a fast hasher, so that the login does not hide the cost of the sessions
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class AuthorizationFlowBenchmark(BaseApiTest):
+    """
+    Run the authorization code flow, from the login to the token
+    request, under each session engine.
+    """
+
+    def setUp(self):
+        self._create_user('anna', '123456')
+        capability = self._create_capability('Capability A', [])
+        self.application = self._create_application(
+            'an app', grant_type=Application.GRANT_AUTHORIZATION_CODE,
+            redirect_uris='http://example.it')
+        self.application.scope.add(capability)
+
+    def _flow(self):
+        client = Client()
+        response = client.post(reverse('mfa_login'), {'username': 'anna', 'password': '123456'})
+        self.assertEqual(response.status_code, 302)
+        payload = {
+            'client_id': self.application.client_id,
+            'response_type': 'code',
+            'redirect_uri': 'http://example.it',
+        }
+        # the consent page, or a redirect once the user approved the application
+        response = client.get(reverse('oauth2_provider:authorize'), payload)
+        self.assertIn(response.status_code, (200, 302))
+        payload.update({'scope': ['capability-a'], 'expires_in': 86400, 'allow': True})
+        response = client.post(reverse('oauth2_provider:authorize'), data=payload)
+        self.assertEqual(response.status_code, 302)
+        code = parse_qs(urlparse(response['Location']).query)['code']
+        response = client.post(reverse('oauth2_provider:token'), data={
+            'grant_type': 'authorization_code',
+            'code': code,
+            'redirect_uri': 'http://example.it',
+            'client_id': self.application.client_id,
+        })
+        self.assertEqual(response.status_code, 200)
+
+    def test_benchmark_session_engines(self):
+        for label, engine in ENGINES:
+            with override_settings(SESSION_ENGINE=engine):
+                cache.clear()
+                self._flow()
+                start = time.perf_counter()
+                for i in range(FLOWS):
+                    self._flow()
+                elapsed = time.perf_counter() - start
+            print("\n%-30s %8.1f flows/s" % (label, FLOWS / elapsed))
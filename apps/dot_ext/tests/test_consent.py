@@ -0,0 +1,118 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core.urlresolvers import reverse
+from django.test import override_settings
+from django.utils import timezone
+from oauth2_provider.compat import parse_qs, urlparse
+
+from apps.test import BaseApiTest
+from ..models import Application, Consent, ExpiresIn
+from ..revocation import revoke_tokens
+
+
+class TestRememberedConsent(BaseApiTest):
+    def setUp(self):
+        self.user = self._create_user('anna', '123456')
+        capability_a = self._create_capability('Capability A', [])
+        capability_b = self._create_capability('Capability B', [])
+        self.application = self._create_application(
+            'an app', grant_type=Application.GRANT_AUTHORIZATION_CODE,
+            redirect_uris='http://example.it')
+        self.application.scope.add(capability_a, capability_b)
+        self.client.login(username='anna', password='123456')
+
+    def _authorize(self, scopes, **extra):
+        params = {
+            'client_id': self.application.client_id,
+            'response_type': 'code',
+            'redirect_uri': 'http://example.it',
+            'scope': ' '.join(scopes),
+        }
+        params.update(extra)
+        return self.client.get(reverse('oauth2_provider:scope_authorize'), params)
+
+    def _approve(self, scopes, expires_in=86400):
+        payload = {
+            'client_id': self.application.client_id,
+            'response_type': 'code',
+            'redirect_uri': 'http://example.it',
+            'scope': scopes,
+            'expires_in': expires_in,
+            'allow': True,
+        }
+        response = self.client.post(reverse('oauth2_provider:scope_authorize'), data=payload)
+        self.assertEqual(response.status_code, 302)
+        return response
+
+    def assertRedirectsWithCode(self, response):
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('code', parse_qs(urlparse(response['Location']).query))
+
+    def test_approval_is_remembered(self):
+        self.assertEqual(self._authorize(['capability-a']).status_code, 200)
+        self._approve(['capability-a', 'capability-b'], expires_in=86400 * 7)
+
+        consent = Consent.objects.get(user=self.user, application=self.application)
+        self.assertEqual(consent.scope, 'capability-a capability-b')
+        self.assertEqual(consent.expires_in, 86400 * 7)
+
+        # equal or smaller scope sets go straight through
+        self.assertRedirectsWithCode(self._authorize(['capability-a', 'capability-b']))
+        self.assertRedirectsWithCode(self._authorize(['capability-b']))
+        self.assertEqual(ExpiresIn.objects.get_expires_in(self.application.client_id, self.user.pk),
+                         86400 * 7)
+
+    def test_remembered_expiry_is_restored(self):
+        self._approve(['capability-a', 'capability-b'], expires_in=86400 * 7)
+        # as deleted by a revocation
+        ExpiresIn.objects.all().delete()
+        self.assertRedirectsWithCode(self._authorize(['capability-a']))
+        self.assertEqual(ExpiresIn.objects.get_expires_in(self.application.client_id, self.user.pk),
+                         86400 * 7)
+
+    def test_repeat_authorization_does_not_write_the_expiry(self):
+        self._approve(['capability-a'], expires_in=86400 * 7)
+        with mock.patch.object(ExpiresIn.objects, 'set_expires_in') as set_expires_in:
+            self.assertRedirectsWithCode(self._authorize(['capability-a']))
+        set_expires_in.assert_not_called()
+
+    def test_approval_reuses_the_application_of_the_form(self):
+        with mock.patch.object(Application.objects, 'get', wraps=Application.objects.get) as get:
+            self._approve(['capability-a'])
+        # by get_form_kwargs and by the validator of the request
+        self.assertEqual(get.call_count, 2)
+
+    def test_missing_consent_is_not_cached(self):
+        self.assertIsNone(Consent.objects.get_valid(self.user, self.application))
+        Consent.objects.create(user=self.user, application=self.application, scope='capability-a',
+                               expires=timezone.now() + timedelta(days=1))
+        self.assertIsNotNone(Consent.objects.get_valid(self.user, self.application))
+
+    def test_larger_scope_set_shows_the_page(self):
+        self._approve(['capability-a'])
+        self.assertEqual(self._authorize(['capability-a', 'capability-b']).status_code, 200)
+
+    def test_forced_prompt_shows_the_page(self):
+        self._approve(['capability-a'])
+        self.assertEqual(self._authorize(['capability-a'], approval_prompt='force').status_code, 200)
+
+    @override_settings(REMEMBER_CONSENT=False)
+    def test_disabled(self):
+        self._approve(['capability-a'])
+        self.assertEqual(self._authorize(['capability-a']).status_code, 200)
+
+    def test_remembered_consent_is_cached(self):
+        self._approve(['capability-a'])
+        self._authorize(['capability-a'])
+        with self.assertNumQueries(0):
+            self.assertIsNotNone(Consent.objects.get_valid(self.user, self.application))
+
+    def test_revoking_tokens_revokes_consent(self):
+        self._approve(['capability-a'])
+        self.assertRedirectsWithCode(self._authorize(['capability-a']))
+
+        revoke_tokens(application=self.application)
+
+        self.assertFalse(Consent.objects.exists())
+        self.assertEqual(self._authorize(['capability-a']).status_code, 200)
@@ -0,0 +1,135 @@
+import io
+from datetime import timedelta
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, RefreshToken
+
+from apps.test import BaseApiTest
+from ..models import ExpiresIn, TokenRevocation
+from ..revocation import revoke_tokens, run_revocation, tokens_revoked
+
+
+class TestBulkRevocation(BaseApiTest):
+    def setUp(self):
+        self.anna = self._create_user('anna', '123456')
+        self.bob = self._create_user('bob', '123456')
+        self.app = self._create_application('an app', user=self.anna)
+        self.other_app = self._create_application('another app', user=self.bob)
+
+    def _create_token(self, user, application, scope='read'):
+        token = AccessToken.objects.create(user=user, application=application,
+                                           token='%s-%s-%s' % (user.pk, application.pk, AccessToken.objects.count()),
+                                           expires=timezone.now() + timedelta(days=1),
+                                           scope=scope)
+        RefreshToken.objects.create(user=user, application=application,
+                                    token='refresh-%s' % token.token, access_token=token)
+        ExpiresIn.objects.set_expires_in(application.client_id, user.pk, 86400)
+        return token
+
+    def test_revoke_by_application(self):
+        for i in range(5):
+            self._create_token(self.anna, self.app)
+        kept = self._create_token(self.anna, self.other_app)
+
+        revoked = revoke_tokens(application=self.app, batch_size=2)
+
+        self.assertEqual(revoked, 5)
+        self.assertEqual(list(AccessToken.objects.values_list('pk', flat=True)), [kept.pk])
+        self.assertEqual(list(RefreshToken.objects.values_list('access_token', flat=True)), [kept.pk])
+        self.assertIsNone(ExpiresIn.objects.get_expires_in(self.app.client_id, self.anna.pk))
+        self.assertEqual(ExpiresIn.objects.get_expires_in(self.other_app.client_id, self.anna.pk), 86400)
+
+    def test_revoke_by_user_and_scope(self):
+        self._create_token(self.anna, self.app, scope='read write')
+        self._create_token(self.anna, self.app, scope='read')
+        self._create_token(self.bob, self.app, scope='write')
+
+        self.assertEqual(revoke_tokens(user=self.anna, scope='write'), 1)
+        self.assertEqual(AccessToken.objects.filter(user=self.anna).get().scope, 'read')
+        self.assertTrue(AccessToken.objects.filter(user=self.bob).exists())
+        # anna keeps a token of the app, and its ExpiresIn
+        self.assertEqual(ExpiresIn.objects.get_expires_in(self.app.client_id, self.anna.pk), 86400)
+
+    def test_stale_revocation_is_resumed(self):
+        for i in range(3):
+            self._create_token(self.anna, self.app)
+        started = timezone.now() - timedelta(hours=2)
+        job = TokenRevocation.objects.create(application=self.app, status='running', started=started,
+                                             updated=timezone.now() - timedelta(minutes=10),
+                                             total=5, revoked=2)
+        # started long ago, but still making progress
+        call_command('revoke_tokens', pending=True, stdout=io.StringIO())
+        self.assertEqual(AccessToken.objects.count(), 3)
+
+        TokenRevocation.objects.filter(pk=job.pk).update(updated=started)
+        call_command('revoke_tokens', pending=True, stdout=io.StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.revoked, job.total), ('done', 5, 5))
+        self.assertFalse(AccessToken.objects.exists())
+
+    def test_resumed_revocation_stops_the_previous_worker(self):
+        for i in range(4):
+            self._create_token(self.anna, self.app)
+        job = TokenRevocation.objects.create(application=self.app)
+
+        def revoke_resumed(*args, progress, **kwargs):
+            def resumed(count):
+                # another worker resumes the job before the batch is reported
+                TokenRevocation.objects.filter(pk=job.pk).update(started=timezone.now())
+                progress(count)
+            return revoke_tokens(*args, progress=resumed, batch_size=1, **kwargs)
+
+        with mock.patch('apps.dot_ext.revocation.revoke_tokens', revoke_resumed):
+            run_revocation(job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.revoked), ('running', 0))
+        self.assertEqual(AccessToken.objects.count(), 3)
+
+    def test_revoke_requires_a_filter(self):
+        with self.assertRaises(ValueError):
+            revoke_tokens()
+
+    def test_revoked_signal_sent_once(self):
+        for i in range(3):
+            self._create_token(self.anna, self.app)
+        calls = []
+
+        def receiver(sender, **kwargs):
+            calls.append(kwargs['application'])
+
+        tokens_revoked.connect(receiver)
+        try:
+            revoke_tokens(application=self.app, batch_size=1)
+        finally:
+            tokens_revoked.disconnect(receiver)
+        self.assertEqual(calls, [self.app])
+
+    def test_revocation_api_requires_staff(self):
+        self.client.login(username='anna', password='123456')
+        response = self.client.post(reverse('token_management:token-revocation-list'),
+                                    {'application': self.app.pk})
+        self.assertEqual(response.status_code, 403)
+
+    def test_revocation_api_reports_progress(self):
+        for i in range(3):
+            self._create_token(self.bob, self.app)
+        self.anna.is_staff = True
+        self.anna.save()
+        self.client.login(username='anna', password='123456')
+
+        response = self.client.post(reverse('token_management:token-revocation-list'),
+                                    {'application': self.app.pk})
+        self.assertEqual(response.status_code, 201)
+        content = response.json()
+        self.assertEqual(content['status'], 'done')
+        self.assertEqual(content['total'], 3)
+        self.assertEqual(content['revoked'], 3)
+        self.assertEqual(content['progress'], 100)
+        self.assertEqual(TokenRevocation.objects.get().requested_by, self.anna)
+        self.assertFalse(AccessToken.objects.exists())
+
+        response = self.client.post(reverse('token_management:token-revocation-list'), {})
+        self.assertEqual(response.status_code, 400)
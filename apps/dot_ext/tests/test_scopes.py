@@ -1,7 +1,11 @@
 from django.conf import settings
+from django.contrib.auth.models import Group
+from django.db import transaction
+from django.test import TransactionTestCase
 from oauth2_provider.scopes import get_scopes_backend
 
-from apps.dot_ext.scopes import CapabilitiesScopes
+from apps.capabilities.models import ProtectedCapability
+from apps.dot_ext.scopes import CapabilitiesScopes, ScopeCatalog
 from apps.test import BaseApiTest
 
 
@@ -78,3 +82,85 @@ class TestScopesBackendClass(BaseApiTest):
         # retrieve the list of the scopes available for the application
         default_scopes = CapabilitiesScopes().get_default_scopes(application=application)
         assert default_scopes == []
+
+
+class TestScopeCatalog(BaseApiTest):
+    def setUp(self):
+        self.capability_a = self._create_capability('Capability A', [])
+        self.capability_b = self._create_capability('Capability B', [], default=False)
+        self.application = self._create_application('an app')
+        self.application.scope.add(self.capability_b)
+
+    def test_warm_catalog_does_not_query(self):
+        """
+        Test that once loaded the scopes backend and the application
+        scope checks are served from memory.
+        """
+        backend = CapabilitiesScopes()
+        backend.get_available_scopes(application=self.application)
+        with self.assertNumQueries(0):
+            assert backend.get_all_scopes() == {
+                'capability-a': 'Capability A',
+                'capability-b': 'Capability B',
+            }
+            assert backend.get_default_scopes() == ['capability-a']
+            assert backend.get_available_scopes(application=self.application) == ['capability-a', 'capability-b']
+            assert self.application.scopes() == 'capability-b'
+            assert self.application.allow_scopes(['capability-b'])
+            assert not self.application.allow_scopes(['capability-a'])
+
+    def test_application_scope_change_invalidates_catalog(self):
+        """
+        Test that adding or removing scopes of an application is
+        visible immediately.
+        """
+        assert self.application.scopes() == 'capability-b'
+        self.application.scope.add(self.capability_a)
+        assert self.application.scopes() == 'capability-a capability-b'
+        self.application.scope.remove(self.capability_b)
+        assert self.application.scopes() == 'capability-a'
+
+    def test_capability_change_invalidates_catalog(self):
+        """
+        Test that saving a capability reloads the catalog.
+        """
+        assert CapabilitiesScopes().get_default_scopes() == ['capability-a']
+        self.capability_b.default = True
+        self.capability_b.save()
+        assert CapabilitiesScopes().get_default_scopes() == ['capability-a', 'capability-b']
+
+    def test_shared_version_invalidates_other_catalogs(self):
+        """
+        Test that an invalidation in one catalog is picked up by another
+        catalog instance sharing the same cache version key.
+        """
+        other = ScopeCatalog()
+        assert list(other.all_scopes()) == ['capability-a', 'capability-b']
+        # bypass the signals so that only the version key tells `other`
+        ProtectedCapability.objects.filter(pk=self.capability_b.pk).update(title='Renamed')
+        with self.settings(SCOPE_CATALOG_VERSION_CHECK_SECONDS=0):
+            assert other.all_scopes()['capability-b'] == 'Capability B'
+            ScopeCatalog().invalidate()
+            assert other.all_scopes()['capability-b'] == 'Renamed'
+
+
+class TestScopeCatalogTransaction(TransactionTestCase):
+    def setUp(self):
+        self.capability = ProtectedCapability.objects.create(
+            title='Capability A', slug='capability-a', protected_resources='[]',
+            group=Group.objects.create(name='test'))
+
+    def test_catalog_is_invalidated_again_on_commit(self):
+        """
+        Test that a catalog loaded while a change is still uncommitted is
+        reloaded once the change commits.
+        """
+        other = ScopeCatalog()
+        with self.settings(SCOPE_CATALOG_VERSION_CHECK_SECONDS=0):
+            with transaction.atomic():
+                self.capability.save()
+                # another process reloading before the commit
+                assert list(other.all_scopes()) == ['capability-a']
+            # bypass the signals so that only the version key tells `other`
+            ProtectedCapability.objects.filter(pk=self.capability.pk).update(title='Renamed')
+            assert other.all_scopes()['capability-a'] == 'Renamed'
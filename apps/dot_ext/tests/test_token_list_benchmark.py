@@ -0,0 +1,75 @@
+import base64
+import os
+import time
+from datetime import timedelta
+from unittest import skipUnless
+
+from django.core.urlresolvers import reverse
+from django.utils import timezone
+from oauth2_provider.models import AccessToken
+
+from apps.test import BaseApiTest
+from ..models import Application
+from ..views.token import AccessTokenSerializer
+
+TOKENS_PER_USER = 10000
+SLS_UUID = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+@skipUnless(os.environ.get('RUN_BENCHMARKS'), "Set RUN_BENCHMARKS=1 to run the benchmarks.")
+class TokenListBenchmark(BaseApiTest):
+    """
+    Compare the paginated token listing against serializing every
+    token of a user with 10k tokens, a quarter of them expired.
+    """
+
+    def setUp(self):
+        self.user = self._create_user(SLS_UUID[9:36], '123456')
+        capability = self._create_capability('token_management', [['GET', '/v1/o/tokens/']], default=False)
+        self.application = self._create_application(
+            'an app', grant_type=Application.GRANT_AUTHORIZATION_CODE,
+            redirect_uris='http://example.it')
+        self.application.scope.add(capability)
+        now = timezone.now()
+        AccessToken.objects.bulk_create(
+            [AccessToken(user=self.user, application=self.application, token='token-%s' % i,
+                         expires=now + timedelta(days=-1 if i % 4 == 0 else 1), scope='token_management')
+             for i in range(TOKENS_PER_USER)])
+        credentials = "%s:%s" % (self.application.client_id, self.application.client_secret)
+        self.headers = {
+            'HTTP_AUTHORIZATION': "Basic %s" % base64.b64encode(credentials.encode('utf-8')).decode('utf-8'),
+            'HTTP_X_AUTHENTICATION': "SLS %s" % base64.b64encode(SLS_UUID.encode('utf-8')).decode('utf-8'),
+        }
+
+    def _timed(self, label, func, repeat=5):
+        start = time.perf_counter()
+        for i in range(repeat):
+            result = func()
+        elapsed = (time.perf_counter() - start) / repeat
+        print("\n%-45s %8.2f ms" % (label, elapsed * 1000))
+        return result
+
+    def test_benchmark_token_listing(self):
+        url = reverse('token_management:token-list')
+
+        def serialize_all():
+            tokens = AccessToken.objects.select_related("application").filter(user=self.user)
+            return AccessTokenSerializer(tokens, many=True).data
+
+        def first_page():
+            return self.client.get(url, **self.headers)
+
+        def all_pages():
+            pages = 0
+            # the next links keep the `count` parameter
+            next_url = url + '?count=1000'
+            while next_url:
+                response = self.client.get(next_url, **self.headers)
+                pages += 1
+                link = response.get('Link', '')
+                next_url = link.split('>')[0][1:] if 'rel="next"' in link else None
+            return pages
+
+        self.assertEqual(len(self._timed('unpaginated serializer (all tokens)', serialize_all)), TOKENS_PER_USER)
+        self.assertEqual(len(self._timed('first page (100 valid tokens)', first_page).json()), 100)
+        self.assertEqual(self._timed('walk all valid tokens, 1000 per page', all_pages, repeat=1), 8)
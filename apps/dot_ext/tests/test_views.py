@@ -200,3 +200,38 @@ class TestTokenView(BaseApiTest):
                                                                                         application.client_secret),
                                    HTTP_X_AUTHENTICATION=self._create_authentication_header(self.test_uuid))
         self.assertEqual(response.status_code, 403)
+
+    def test_get_tokens_paginated_without_expired(self):
+        anna = self._create_user(self.test_username, '123456')
+        capability_a = self._create_capability('token_management', [['GET', '/v1/o/tokens/']], default=False)
+        application = self._create_application(
+            'an app', grant_type=Application.GRANT_AUTHORIZATION_CODE,
+            redirect_uris='http://example.it')
+        application.scope.add(capability_a)
+        now = timezone.now()
+        AccessToken.objects.bulk_create(
+            [AccessToken(user=anna, application=application, token='token-%s' % i,
+                         expires=now + timedelta(days=1 if i % 2 else -1), scope='token_management')
+             for i in range(10)])
+        valid_ids = list(AccessToken.objects.filter(expires__gt=now).order_by('id').values_list('id', flat=True))
+        headers = {
+            'HTTP_AUTHORIZATION': self._create_authorization_header(application.client_id,
+                                                                    application.client_secret),
+            'HTTP_X_AUTHENTICATION': self._create_authentication_header(self.test_uuid),
+        }
+
+        response = self.client.get(reverse('token_management:token-list'), {'count': 3}, **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([t['id'] for t in response.json()], valid_ids[:3])
+        self.assertEqual(response.json()[0]['application']['name'], 'an app')
+        next_url = response['Link'].split('>')[0][1:]
+
+        # the client authentication is cached: only the user and token queries remain
+        with self.assertNumQueries(2):
+            response = self.client.get(next_url, **headers)
+        self.assertEqual([t['id'] for t in response.json()], valid_ids[3:])
+        self.assertIn('rel="prev"', response['Link'])
+        self.assertNotIn('rel="next"', response['Link'])
+
+        response = self.client.get(reverse('token_management:token-list'), {'include_expired': 'true'}, **headers)
+        self.assertEqual(len(response.json()), 10)
@@ -12,6 +12,7 @@ oauth2_provider_urls = ([
 
 router = DefaultRouter()
 router.register(r'tokens', views.AuthorizedTokens, base_name='token')
+router.register(r'token-revocations', views.TokenRevocations, base_name='token-revocation')
 
 urlpatterns = [
     url(r'', include(oauth2_provider_urls)),
@@ -2,3 +2,4 @@ from .application import ApplicationRegistration, ApplicationUpdate  # NOQA
 from .authorization import AuthorizationView  # NOQA
 from .authorization import ScopeAuthorizationView   # NOQA
 from .token import AuthorizedTokens  # NOQA
+from .revocation import TokenRevocations  # NOQA
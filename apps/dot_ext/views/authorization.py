@@ -1,15 +1,69 @@
 import logging
+from django.conf import settings
 from oauth2_provider.views.base import AuthorizationView as DotAuthorizationView
 from oauth2_provider.models import get_application_model
 from oauth2_provider.exceptions import OAuthToolkitError
 from oauth2_provider.http import HttpResponseUriRedirect
 from ..forms import AllowForm, SimpleAllowForm
-from ..models import ExpiresIn
+from ..models import Consent, ExpiresIn
 
 logger = logging.getLogger('hhs_server.%s' % __name__)
 
 
-class AuthorizationView(DotAuthorizationView):
+class RememberedConsentMixin(object):
+    """
+    Skip the authorization page when the user has a valid Consent
+    for the application covering all the requested scopes, and remember
+    the consent whenever the user approves the page.
+
+    Clients can still force the page with `approval_prompt=force`.
+    """
+
+    def get(self, request, *args, **kwargs):
+        if (getattr(settings, 'REMEMBER_CONSENT', True) and
+                request.GET.get('approval_prompt') != 'force'):
+            response = self.remembered_consent_response(request)
+            if response is not None:
+                return response
+        return super(RememberedConsentMixin, self).get(request, *args, **kwargs)
+
+    def remembered_consent_response(self, request):
+        """
+        Return a redirect carrying the authorization response, or None
+        when the page must be shown.
+        """
+        try:
+            scopes, credentials = self.validate_authorization_request(request)
+        except OAuthToolkitError:
+            # let the page report the error
+            return None
+
+        # the validator loaded the application while checking the client_id
+        application = credentials['request'].client
+        consent = Consent.objects.get_valid(request.user, application)
+        if consent is None or not consent.allows(scopes):
+            return None
+        # the token lifetime chosen with the consent, whose ExpiresIn a
+        # revocation may have deleted since: only written when it differs
+        if consent.expires_in and ExpiresIn.objects.get_expires_in(
+                application.client_id, request.user.pk) != consent.expires_in:
+            ExpiresIn.objects.set_expires_in(application.client_id, request.user.pk, consent.expires_in)
+
+        try:
+            uri, headers, body, status = self.get_oauthlib_core().create_authorization_response(
+                request, scopes, credentials, True)
+        except OAuthToolkitError as error:
+            return self.error_response(error)
+
+        logger.debug("Remembered consent of %s for %s", request.user, application.client_id)
+        return HttpResponseUriRedirect(uri)
+
+    def remember_consent(self, application, scopes, expires_in=None):
+        if application is not None:
+            Consent.objects.remember(self.request.user, application, scopes, expires_in)
+
+
+class AuthorizationView(RememberedConsentMixin, DotAuthorizationView):
     """
     Override the base authorization view from dot to
     use the custom AllowForm.
@@ -18,8 +72,16 @@ class AuthorizationView(DotAuthorizationView):
     login_url = "/mymedicare/login"
     template_name = "design_system/authorize.html"
 
+    def create_authorization_response(self, request, scopes, credentials, allow):
+        response = super(AuthorizationView, self).create_authorization_response(
+            request, scopes, credentials, allow)
+        # only reached when the user approved a valid request
+        application = get_application_model().objects.filter(client_id=credentials['client_id']).first()
+        self.remember_consent(application, scopes.split())
+        return response
+
 
-class ScopeAuthorizationView(DotAuthorizationView):
+class ScopeAuthorizationView(RememberedConsentMixin, DotAuthorizationView):
     """
     Override the base authorization view from dot to
     use the custom AllowForm.
@@ -49,6 +111,8 @@ class ScopeAuthorizationView(DotAuthorizationView):
             client_id = form.cleaned_data.get('client_id')
             user_id = self.request.user.pk
             ExpiresIn.objects.set_expires_in(client_id, user_id, expires_in)
+            # the application loaded by get_form_kwargs
+            self.remember_consent(form.application, scopes, expires_in)
 
             logger.debug(
                 "Success url for the request: {0}".format(self.success_url))
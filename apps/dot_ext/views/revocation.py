@@ -0,0 +1,40 @@
+from rest_framework import mixins
+from rest_framework import permissions
+from rest_framework import serializers
+from rest_framework import viewsets
+
+from ..models import TokenRevocation
+from ..revocation import start_revocation
+
+
+class TokenRevocationSerializer(serializers.ModelSerializer):
+    progress = serializers.ReadOnlyField()
+
+    class Meta:
+        model = TokenRevocation
+        fields = ('id', 'application', 'user', 'scope', 'status', 'total', 'revoked',
+                  'progress', 'error', 'created', 'started', 'updated', 'finished')
+        read_only_fields = ('status', 'total', 'revoked', 'error', 'created', 'started', 'updated',
+                            'finished')
+
+    def validate(self, data):
+        if not (data.get('application') or data.get('user') or data.get('scope')):
+            raise serializers.ValidationError('An application, a user or a scope is required.')
+        return data
+
+
+class TokenRevocations(viewsets.GenericViewSet,
+                       mixins.CreateModelMixin,
+                       mixins.ListModelMixin,
+                       mixins.RetrieveModelMixin):
+    """
+    Staff-only API to start bulk token revocations and follow their progress.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    serializer_class = TokenRevocationSerializer
+    queryset = TokenRevocation.objects.order_by('-pk')
+
+    def perform_create(self, serializer):
+        revocation = serializer.save(requested_by=self.request.user)
+        start_revocation(revocation)
+        revocation.refresh_from_db()
@@ -1,9 +1,14 @@
+from django.utils import timezone
 from rest_framework import viewsets
 from rest_framework import mixins
 from rest_framework import serializers
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
 from oauth2_provider.models import AccessToken
 from oauth2_provider.ext.rest_framework import TokenHasScope
 from apps.dot_ext.authentication import SLSAuthentication
+from apps.dot_ext.signals import tokens_revoked
+from hhs_oauth_server.utils import bool_env
 from ..models import Application
 
 
@@ -21,6 +26,43 @@ class AccessTokenSerializer(serializers.ModelSerializer):
         fields = ('id', 'user', 'application')
 
 
+# The values() columns used to build the same output as
+# AccessTokenSerializer without instantiating the models.
+TOKEN_LIST_FIELDS = ('id', 'user_id',) + tuple(
+    'application__%s' % f for f in ApplicationSerializer.Meta.fields)
+
+
+def token_from_values(row):
+    return {
+        'id': row['id'],
+        'user': row['user_id'],
+        'application': dict(
+            (f, row['application__%s' % f]) for f in ApplicationSerializer.Meta.fields),
+    }
+
+
+class TokenCursorPagination(CursorPagination):
+    """
+    Keyset pagination on the token id. The page body stays a plain list
+    of tokens; the next and previous page links are sent in the `Link` header.
+    """
+    ordering = 'id'
+    page_size = 100
+    page_size_query_param = 'count'
+    max_page_size = 1000
+
+    def get_paginated_response(self, data):
+        links = []
+        next_link = self.get_next_link()
+        if next_link:
+            links.append('<%s>; rel="next"' % next_link)
+        previous_link = self.get_previous_link()
+        if previous_link:
+            links.append('<%s>; rel="prev"' % previous_link)
+        headers = {'Link': ', '.join(links)} if links else None
+        return Response(data, headers=headers)
+
+
 class AuthorizedTokens(viewsets.GenericViewSet,
                        mixins.ListModelMixin,
                        mixins.RetrieveModelMixin,
@@ -30,6 +72,23 @@ class AuthorizedTokens(viewsets.GenericViewSet,
     permission_classes = [TokenHasScope]
     required_scopes = ['token_management']
     serializer_class = AccessTokenSerializer
+    pagination_class = TokenCursorPagination
 
     def get_queryset(self):
         return AccessToken.objects.select_related("application").filter(user=self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        """
+        List the user's tokens, skipping the expired ones unless
+        `include_expired` is set.
+        """
+        tokens = AccessToken.objects.filter(user=request.user)
+        if not bool_env(request.query_params.get('include_expired')):
+            tokens = tokens.filter(expires__gt=timezone.now())
+        page = self.paginate_queryset(tokens.values(*TOKEN_LIST_FIELDS))
+        return self.get_paginated_response([token_from_values(row) for row in page])
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        tokens_revoked.send(sender=AccessToken, application=instance.application,
+                            user=instance.user, scope='')
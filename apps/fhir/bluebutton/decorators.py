@@ -5,6 +5,7 @@ from oauthlib.oauth2 import Server
 from oauth2_provider.oauth2_validators import OAuth2Validator
 from oauth2_provider.oauth2_backends import OAuthLibCore
 
+from hhs_oauth_server.timing import phase, set_label
 from .errors import build_error_response
 
 
@@ -13,8 +14,11 @@ def require_valid_token():
         @wraps(view_func)
         def _validate(request, *args, **kwargs):
             core = OAuthLibCore(Server(OAuth2Validator()))
-            valid, oauthlib_req = core.verify_request(request, scopes=[])
+            with phase('token'):
+                valid, oauthlib_req = core.verify_request(request, scopes=[])
             if valid:
+                # the id: names are chosen freely, each a new series of histograms
+                set_label('application', str(oauthlib_req.client.pk))
                 # Note, resource_owner is not a very good name for this
                 request.resource_owner = oauthlib_req.user
                 request.oauth = oauthlib_req
@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db.models import Case, CharField, Value, When
+
+from apps.accounts.models import userinfo_cache_key
+from apps.accounts.principal import invalidate_principal
+from apps.fhir.bluebutton.models import Crosswalk
+from apps.mymedicare_cb.models import lookup_fhir_id
+
+
+class RateLimiter(object):
+    """
+    Space the calls of all the threads `1 / rate` seconds apart.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self._lock = threading.Lock()
+        self._next = time.time()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.time()
+            at = max(now, self._next)
+            self._next = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+
+class Command(BaseCommand):
+    help = ("Search the backend for the patient of the crosswalks without fhir_id, "
+            "or of all the crosswalks with --all, and save the fhir_ids found. "
+            "The progress is saved in the --checkpoint file and an interrupted run "
+            "resumes where it stopped.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help="Verify the crosswalks that have a fhir_id too")
+        parser.add_argument('--workers', type=int, default=8,
+                            help="Concurrent backend searches, at most MEDICARE_HTTP_POOL_SIZE "
+                                 "to reuse the connections")
+        parser.add_argument('--rate', type=float, default=20,
+                            help="Maximum backend searches per second, 0 for no limit")
+        parser.add_argument('--timeout', type=float, default=None,
+                            help="Seconds per search, defaults to the resource router wait time")
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--checkpoint', default=None,
+                            help="Progress file holding the last crosswalk id processed")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Search and report without saving")
+
+    def handle(self, *args, **options):
+        crosswalks = Crosswalk.objects.select_related('fhir_source').exclude(user_id_hash='')
+        if not options['all']:
+            crosswalks = crosswalks.filter(fhir_id='')
+        checkpoint = options['checkpoint']
+        last_pk = 0
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                last_pk = int(f.read().strip() or 0)
+            self.stdout.write("Resuming after crosswalk %s" % last_pk)
+
+        limiter = RateLimiter(options['rate'])
+        timeout = options['timeout']
+
+        def search(crosswalk):
+            limiter.wait()
+            try:
+                return lookup_fhir_id(crosswalk, timeout or crosswalk.fhir_source.wait_time)[0], None
+            except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+                return None, e
+
+        self.counts = dict.fromkeys(('processed', 'matched', 'updated', 'mismatches',
+                                     'unmatched', 'failures'), 0)
+        start = time.time()
+        with ThreadPoolExecutor(options['workers']) as pool:
+            while True:
+                batch = list(crosswalks.filter(pk__gt=last_pk).order_by('pk')[:options['batch_size']])
+                if not batch:
+                    break
+                results = list(pool.map(search, batch))
+                self._save(batch, results, options['dry_run'])
+                last_pk = batch[-1].pk
+                if checkpoint and not options['dry_run']:
+                    with open(checkpoint, 'w') as f:
+                        f.write(str(last_pk))
+                elapsed = time.time() - start
+                self.stdout.write("%s crosswalks, %.1f searches/s" % (
+                    self.counts['processed'], self.counts['processed'] / elapsed if elapsed else 0))
+
+        elapsed = time.time() - start
+        self.stdout.write(
+            "%(processed)s crosswalks searched: %(matched)s matched, %(updated)s updated, "
+            "%(mismatches)s mismatches, %(unmatched)s unmatched, %(failures)s failures" % self.counts)
+        self.stdout.write("%.1f s, %.1f searches/s%s" % (
+            elapsed, self.counts['processed'] / elapsed if elapsed else 0,
+            " (dry run, nothing saved)" if options['dry_run'] else ""))
+
+    def _save(self, batch, results, dry_run):
+        updates = {}
+        for crosswalk, (fhir_id, error) in zip(batch, results):
+            self.counts['processed'] += 1
+            if error is not None:
+                self.counts['failures'] += 1
+                self.stderr.write("Crosswalk %s: %s" % (crosswalk.pk, error))
+            elif not fhir_id:
+                self.counts['unmatched'] += 1
+            else:
+                self.counts['matched'] += 1
+                if crosswalk.fhir_id and crosswalk.fhir_id != fhir_id:
+                    self.counts['mismatches'] += 1
+                    self.stdout.write("Crosswalk %s: fhir_id %s, backend has %s" % (
+                        crosswalk.pk, crosswalk.fhir_id, fhir_id))
+                if crosswalk.fhir_id != fhir_id:
+                    updates[crosswalk] = fhir_id
+
+        self.counts['updated'] += len(updates)
+        if dry_run or not updates:
+            return
+        # a single UPDATE per batch; update() skips Crosswalk.save and its signals
+        Crosswalk.objects.filter(pk__in=[c.pk for c in updates]).update(fhir_id=Case(
+            *[When(pk=c.pk, then=Value(fhir_id)) for c, fhir_id in updates.items()],
+            output_field=CharField()))
+        cache.delete_many([userinfo_cache_key(c.user_id) for c in updates])
+        for crosswalk in updates:
+            invalidate_principal(crosswalk.user_id)
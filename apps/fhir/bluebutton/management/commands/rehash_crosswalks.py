@@ -0,0 +1,86 @@
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from apps.accounts.bulk_invitations import read_csv
+from apps.accounts.hashing import compute_hash, user_id_hasher
+from apps.fhir.bluebutton.models import Crosswalk
+
+
+class Command(BaseCommand):
+    help = ("Re-hash the crosswalk user ids, for instance before raising USER_ID_ITERATIONS. "
+            "Stored hashes cannot be re-derived, so the raw ids are read from a CSV file "
+            "with the username and user_id columns. The progress is saved in a checkpoint "
+            "file and an interrupted run resumes where it stopped.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help="CSV file with the username and user_id columns")
+        parser.add_argument('--iterations', type=int, default=None,
+                            help="PBKDF2 iterations, defaults to USER_ID_ITERATIONS")
+        parser.add_argument('--processes', type=int, default=None,
+                            help="Processes used to hash, defaults to the number of CPUs")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--checkpoint', default=None,
+                            help="Progress file, defaults to the CSV path with a .checkpoint suffix")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Hash and match the rows without saving them")
+
+    def handle(self, *args, **options):
+        iterations = options['iterations'] or settings.USER_ID_ITERATIONS
+        batch_size = options['batch_size']
+        checkpoint = options['checkpoint'] or options['csv_file'] + '.checkpoint'
+        with io.open(options['csv_file'], newline='', encoding='utf-8') as f:
+            rows = read_csv(f)
+        if rows and not ('username' in rows[0] and 'user_id' in rows[0]):
+            raise CommandError("The CSV file needs the username and user_id columns.")
+
+        offset = 0
+        if not options['dry_run'] and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                offset = int(f.read().strip() or 0)
+            self.stdout.write("Resuming after row %s" % offset)
+
+        hasher = partial(compute_hash, salt=user_id_hasher.salt(), iterations=iterations)
+        processes = options['processes'] or os.cpu_count()
+        pool = ProcessPoolExecutor(processes) if processes > 1 else None
+        start = time.time()
+        updated = missing = 0
+        try:
+            for batch_start in range(offset, len(rows), batch_size):
+                batch = rows[batch_start:batch_start + batch_size]
+                user_ids = [row['user_id'] for row in batch]
+                if pool:
+                    hashes = list(pool.map(hasher, user_ids, chunksize=max(1, len(batch) // processes)))
+                else:
+                    hashes = [hasher(user_id) for user_id in user_ids]
+
+                crosswalks = dict(Crosswalk.objects.filter(
+                    user__username__in=[row['username'] for row in batch]).values_list('user__username', 'pk'))
+                missing += len(batch) - len(crosswalks)
+                if not options['dry_run']:
+                    with transaction.atomic():
+                        for row, user_id_hash in zip(batch, hashes):
+                            pk = crosswalks.get(row['username'])
+                            if pk is not None:
+                                # update() skips Crosswalk.save, which would hash again
+                                Crosswalk.objects.filter(pk=pk).update(user_id_hash=user_id_hash)
+                    with open(checkpoint, 'w') as f:
+                        f.write(str(batch_start + len(batch)))
+                updated += len(crosswalks)
+
+                done = batch_start + len(batch)
+                elapsed = time.time() - start
+                self.stdout.write("%s/%s rows, %.0f rows/s" % (
+                    done, len(rows), (done - offset) / elapsed if elapsed else 0))
+        finally:
+            if pool:
+                pool.shutdown()
+
+        self.stdout.write("%s crosswalks %s with %s iterations, %s rows without crosswalk." % (
+            updated, 'matched' if options['dry_run'] else 're-hashed', iterations, missing))
@@ -2,15 +2,13 @@ import logging
 from requests import Response
 from django.conf import settings
 from django.db import models
-from apps.accounts.models import get_user_id_salt
+from apps.accounts.hashing import HashedUserIdMixin
 from apps.fhir.server.models import ResourceRouter
-from django.utils.crypto import pbkdf2
-import binascii
 
 logger = logging.getLogger('hhs_server.%s' % __name__)
 
 
-class Crosswalk(models.Model):
+class Crosswalk(HashedUserIdMixin, models.Model):
     """
     HICN/BeneID to User to FHIR Source Crosswalk and back.
     Linked to User Account
@@ -40,9 +38,8 @@ class Crosswalk(models.Model):
 
     def save(self, commit=True, **kwargs):
         if commit:
-            self.user_id_hash = binascii.hexlify(pbkdf2(self.user_id_hash,
-                                                        get_user_id_salt(),
-                                                        settings.USER_ID_ITERATIONS)).decode("ascii")
+            # hashed values, as loaded from the database, are kept as they are
+            self.hash_user_id_hash()
             super(Crosswalk, self).save(**kwargs)
 
     def __str__(self):
@@ -0,0 +1,80 @@
+import io
+import os
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from httmock import HTTMock, urlmatch
+
+from apps.accounts.hashing import hash_user_id
+from apps.mymedicare_cb.tests.responses import patient_response
+
+from ..models import Crosswalk
+from ...server.models import ResourceRouter
+
+
+class MatchCrosswalksTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        fhir_source = ResourceRouter.objects.create(pk=settings.FHIR_SERVER_DEFAULT,
+                                                    fhir_url="http://bogus.com/")
+        self.crosswalks = {}
+        for name, hicn, fhir_id in (('found', '1', ''), ('missing', '2', ''),
+                                    ('failing', '3', ''), ('stale', '1', '42')):
+            user = User.objects.create(username=name)
+            self.crosswalks[name] = Crosswalk.objects.create(
+                user=user, fhir_source=fhir_source, fhir_id=fhir_id, user_id_hash=hicn).pk
+
+        @urlmatch(netloc='bogus.com', path='/Patient/')
+        def backend(url, request):
+            if hash_user_id('1') in url.query:
+                return {'status_code': 200, 'content': patient_response}
+            if hash_user_id('2') in url.query:
+                return {'status_code': 200, 'content': {'resourceType': 'Bundle', 'total': 0}}
+            return {'status_code': 500, 'content': {}}
+        self.backend = backend
+
+    def fhir_id(self, name):
+        return Crosswalk.objects.get(pk=self.crosswalks[name]).fhir_id
+
+    def test_missing_fhir_ids_are_matched(self):
+        out = io.StringIO()
+        with HTTMock(self.backend):
+            call_command('match_crosswalks', workers=2, rate=0, batch_size=2, stdout=out, stderr=io.StringIO())
+        self.assertIn('3 crosswalks searched: 1 matched, 1 updated, 0 mismatches, 1 unmatched, 1 failures',
+                      out.getvalue())
+        self.assertEqual(self.fhir_id('found'), '19990000000001')
+        self.assertEqual(self.fhir_id('missing'), '')
+        self.assertEqual(self.fhir_id('stale'), '42')
+
+    def test_all_reports_mismatches(self):
+        out = io.StringIO()
+        with HTTMock(self.backend):
+            call_command('match_crosswalks', all=True, dry_run=True, rate=0, stdout=out, stderr=io.StringIO())
+        self.assertIn('2 matched, 2 updated, 1 mismatches', out.getvalue())
+        self.assertIn('fhir_id 42, backend has 19990000000001', out.getvalue())
+        # dry run
+        self.assertEqual(self.fhir_id('found'), '')
+        self.assertEqual(self.fhir_id('stale'), '42')
+
+        with HTTMock(self.backend):
+            call_command('match_crosswalks', all=True, rate=0, stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual(self.fhir_id('stale'), '19990000000001')
+
+    def test_checkpoint(self):
+        with tempfile.NamedTemporaryFile('w', delete=False) as f:
+            f.write(str(self.crosswalks['missing']))
+        try:
+            out = io.StringIO()
+            with HTTMock(self.backend):
+                call_command('match_crosswalks', checkpoint=f.name, rate=0, stdout=out, stderr=io.StringIO())
+            self.assertIn('1 crosswalks searched', out.getvalue())
+            self.assertEqual(self.fhir_id('found'), '')
+            with open(f.name) as progress:
+                self.assertEqual(progress.read(), str(self.crosswalks['failing']))
+        finally:
+            os.remove(f.name)
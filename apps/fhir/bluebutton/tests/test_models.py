@@ -1,3 +1,10 @@
+import io
+import os
+import tempfile
+
+from django.core.management import call_command
+
+from apps.accounts.hashing import hash_user_id
 from apps.test import BaseApiTest
 
 from ..models import Crosswalk
@@ -51,3 +58,53 @@ class TestModels(BaseApiTest):
 
         invalid_match = "http://localhost:8000/fhir/" + "Practitioner/123456"
         self.assertNotEqual(url_info, invalid_match)
+
+    def test_user_id_is_hashed_once(self):
+        user = self._create_user('john', 'password')
+        cw = Crosswalk.objects.create(user=user, fhir_id="123456", user_id_hash="1000079035")
+        self.assertEqual(cw.user_id_hash, hash_user_id("1000079035"))
+        cw.save()
+        cw.refresh_from_db()
+        self.assertEqual(cw.user_id_hash, hash_user_id("1000079035"))
+
+    def test_user_id_shaped_as_a_hash_is_hashed(self):
+        user = self._create_user('john', 'password')
+        raw = "a" * 64
+        cw = Crosswalk.objects.create(user=user, fhir_id="123456", user_id_hash=raw)
+        self.assertEqual(cw.user_id_hash, hash_user_id(raw))
+        # saving the loaded crosswalk keeps its hash
+        cw = Crosswalk.objects.get(pk=cw.pk)
+        cw.save()
+        self.assertEqual(Crosswalk.objects.get().user_id_hash, hash_user_id(raw))
+        # so does a form setting back the stored hash, as a plain string
+        cw.user_id_hash = str(cw.user_id_hash)
+        cw.save()
+        self.assertEqual(Crosswalk.objects.get().user_id_hash, hash_user_id(raw))
+
+    def test_rehash_crosswalks(self):
+        user = self._create_user('john', 'password')
+        Crosswalk.objects.create(user=user, fhir_id="123456", user_id_hash="1000079035")
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write("username,user_id\njohn,1000079035\nnobody,1\n")
+        checkpoint = f.name + '.checkpoint'
+        try:
+            out = io.StringIO()
+            call_command('rehash_crosswalks', f.name, iterations=3, processes=1, dry_run=True, stdout=out)
+            self.assertIn('1 crosswalks matched', out.getvalue())
+            self.assertEqual(Crosswalk.objects.get().user_id_hash, hash_user_id("1000079035"))
+            self.assertFalse(os.path.exists(checkpoint))
+
+            call_command('rehash_crosswalks', f.name, iterations=3, processes=1, stdout=out)
+            self.assertEqual(Crosswalk.objects.get().user_id_hash, hash_user_id("1000079035", iterations=3))
+            with open(checkpoint) as progress:
+                self.assertEqual(progress.read(), '2')
+
+            # a finished run resumes after the last row and changes nothing
+            out = io.StringIO()
+            call_command('rehash_crosswalks', f.name, processes=1, stdout=out)
+            self.assertIn('Resuming after row 2', out.getvalue())
+            self.assertEqual(Crosswalk.objects.get().user_id_hash, hash_user_id("1000079035", iterations=3))
+        finally:
+            os.remove(f.name)
+            if os.path.exists(checkpoint):
+                os.remove(checkpoint)
@@ -17,6 +17,7 @@ from apps.fhir.server.models import (SupportedResourceType,
 from oauth2_provider.models import AccessToken
 
 from apps.wellknown.views import (base_issuer, build_endpoint_info)
+from hhs_oauth_server.tracing import backend_call, propagation_headers
 from .models import Crosswalk, Fhir_Response
 
 logger = logging.getLogger('hhs_server.%s' % __name__)
@@ -228,19 +229,22 @@ def request_call(request, call_url, crosswalk=None, timeout=None, get_parameters
     logger_perf.info(header_detail)
 
     try:
-        if timeout:
-            r = requests.get(call_url,
-                             cert=cert,
-                             params=get_parameters,
-                             timeout=timeout,
-                             headers=header_info,
-                             verify=verify_state)
-        else:
-            r = requests.get(call_url,
-                             cert=cert,
-                             params=get_parameters,
-                             headers=header_info,
-                             verify=verify_state)
+        with backend_call(call_url) as call:
+            header_info.update(propagation_headers())
+            if timeout:
+                r = requests.get(call_url,
+                                 cert=cert,
+                                 params=get_parameters,
+                                 timeout=timeout,
+                                 headers=header_info,
+                                 verify=verify_state)
+            else:
+                r = requests.get(call_url,
+                                 cert=cert,
+                                 params=get_parameters,
+                                 headers=header_info,
+                                 verify=verify_state)
+            call.finished(r)
 
         logger.debug("Request.get:%s" % call_url)
         logger.debug("Status of Request:%s" % r.status_code)
@@ -348,19 +352,22 @@ def request_get_with_params(request,
     logger_perf.info(header_detail)
 
     try:
-        if timeout:
-            r = requests.get(call_url,
-                             params=search_params,
-                             cert=cert,
-                             headers=header_info,
-                             timeout=timeout,
-                             verify=verify_state)
-        else:
-            r = requests.get(call_url,
-                             params=search_params,
-                             cert=cert,
-                             headers=header_info,
-                             verify=verify_state)
+        with backend_call(call_url) as call:
+            header_info.update(propagation_headers())
+            if timeout:
+                r = requests.get(call_url,
+                                 params=search_params,
+                                 cert=cert,
+                                 headers=header_info,
+                                 timeout=timeout,
+                                 verify=verify_state)
+            else:
+                r = requests.get(call_url,
+                                 params=search_params,
+                                 cert=cert,
+                                 headers=header_info,
+                                 verify=verify_state)
+            call.finished(r)
 
         logger.debug("Request.get:%s" % call_url)
         logger.debug("Status of Request:%s" % r.status_code)
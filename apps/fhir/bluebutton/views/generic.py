@@ -1,16 +1,18 @@
 import requests
 import logging
+import time
 from django.utils.decorators import method_decorator
 from rest_framework import exceptions
 from rest_framework.parsers import JSONParser
-from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from apps.fhir.parsers import FHIRParser
-from apps.fhir.renderers import FHIRRenderer
+from apps.fhir.renderers import FHIRRenderer, JSONRenderer
 from apps.dot_ext.throttling import TokenRateThrottle
 from apps.fhir.server import connection as backend_connection
+from hhs_oauth_server.timing import add_phase, phase, set_label
+from hhs_oauth_server.tracing import backend_call
 from ..constants import ALLOWED_RESOURCE_TYPES
 from ..serializers import localize
 from ..decorators import require_valid_token
@@ -61,7 +63,9 @@ class FhirDataView(APIView):
             logger.info('User requested read access to the %s resource type' % resource_type)
             raise exceptions.NotFound('The requested resource type, %s, is not supported' % resource_type)
 
-        self.crosswalk = self.check_resource_permission(request, resource_type, *args, **kwargs)
+        set_label('resource_type', resource_type)
+        with phase('crosswalk'):
+            self.crosswalk = self.check_resource_permission(request, resource_type, *args, **kwargs)
         if self.crosswalk is None:
             raise exceptions.PermissionDenied(
                 'No access information was found for the authenticated user')
@@ -89,12 +93,24 @@ class FhirDataView(APIView):
                      'GET parameters %s' % (target_url, get_parameters))
 
         # Now make the call to the backend API
-        r = requests.get(target_url,
-                         params=get_parameters,
-                         cert=backend_connection.certs(crosswalk=self.crosswalk),
-                         headers=backend_connection.headers(request, url=target_url),
-                         timeout=resource_router.wait_time,
-                         verify=FhirServerVerify(crosswalk=self.crosswalk))
+        cert = backend_connection.certs(crosswalk=self.crosswalk)
+        verify = FhirServerVerify(crosswalk=self.crosswalk)
+        with backend_call(target_url) as call:
+            # in the span, whose context the headers carry
+            headers = backend_connection.headers(request, url=target_url)
+            # streamed, to time the wait for the headers apart from the body
+            start = time.perf_counter()
+            r = requests.get(target_url,
+                             params=get_parameters,
+                             cert=cert,
+                             headers=headers,
+                             timeout=resource_router.wait_time,
+                             verify=verify,
+                             stream=True)
+            add_phase('backend_ttfb', time.perf_counter() - start)
+            with phase('backend_download'):
+                r.content
+            call.finished(r)
         response = build_fhir_response(request._request, target_url, self.crosswalk, r=r, e=None)
 
         if response.status_code == 404:
@@ -106,8 +122,9 @@ class FhirDataView(APIView):
 
         self.validate_response(response)
 
-        out_data = localize(request=request,
-                            response=response,
-                            crosswalk=self.crosswalk,
-                            resource_type=resource_type)
+        with phase('localize'):
+            out_data = localize(request=request,
+                                response=response,
+                                crosswalk=self.crosswalk,
+                                resource_type=resource_type)
         return out_data
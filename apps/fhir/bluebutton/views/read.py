@@ -12,6 +12,12 @@ logger = logging.getLogger('hhs_server.%s' % __name__)
 
 class ReadView(FhirDataView):
 
+    # token, application, user, and the crosswalk and resource router
+    # looked up by the permission check, the headers and the rewrite list
+    query_budget = 10
+    # peak Python allocation: a 20KB EOB peaks at about 1.5MB
+    memory_budget = 4 * 1024 * 1024
+
     def validate_response(self, response):
         # Now check that the user has permission to access the data
         # Patient resources were taken care of above
@@ -16,6 +16,13 @@ SIZE_PARAMETER = 'count'
 
 class SearchView(FhirDataView):
 
+    # token, application, user, and the crosswalk and resource router
+    # looked up by the permission check, the headers and the rewrite list
+    query_budget = 10
+    # peak Python allocation: a page of MAX_PAGE_SIZE 20KB EOBs peaks at
+    # about 8MB, parsed, localized and rendered
+    memory_budget = 16 * 1024 * 1024
+
     def get(self, request, resource_type, *args, **kwargs):
         # Verify paging inputs. Casting an invalid int will throw a ValueError
         try:
@@ -1,4 +1,13 @@
-from rest_framework.renderers import JSONRenderer
+from rest_framework import renderers
+
+from hhs_oauth_server.timing import phase
+
+
+class JSONRenderer(renderers.JSONRenderer):
+
+    def render(self, *args, **kwargs):
+        with phase('serialize'):
+            return super().render(*args, **kwargs)
 
 
 class FHIRRenderer(JSONRenderer):
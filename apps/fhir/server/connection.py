@@ -1,8 +1,13 @@
+import logging
+
 from apps.fhir.bluebutton.utils import (
     FhirServerAuth,
     generate_info_headers,
     set_default_header,
 )
+from hhs_oauth_server.tracing import propagation_headers
+
+logger_perf = logging.getLogger('performance')
 
 
 # return certs
@@ -19,4 +24,8 @@ def headers(request, url=None):
     header_info['BlueButton-OriginalUrl'] = request.path
     header_info['BlueButton-OriginalQuery'] = request.META['QUERY_STRING']
     header_info['BlueButton-BackendCall'] = url
+    header_info.update(propagation_headers())
+
+    # as request_call does, for the replay of the performance logs
+    logger_perf.info(header_info)
     return header_info
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.fhir.server.stub import StubFhirBackend, make_server
+
+
+class Command(BaseCommand):
+    help = ("Serve synthetic FHIR data in place of the backend, for load tests. "
+            "Point the fhir_url of a ResourceRouter at http://HOST:PORT/baseDstu3/, without "
+            "client certificate. "
+            "Distributions are given as 'fixed:N', 'uniform:LOW:HIGH', 'exponential:MEAN', "
+            "'lognormal:MU:SIGMA' or 'normal:MEAN:SIGMA'.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8080)
+        parser.add_argument('--latency', default='0',
+                            help="Distribution of the response latency, in milliseconds")
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help="Fraction of the requests answered with a 500")
+        parser.add_argument('--unmatched-rate', type=float, default=0.0,
+                            help="Fraction of the hicnHash searches matching no patient")
+        parser.add_argument('--eob-count', default='lognormal:3:1',
+                            help="Distribution of the number of claims per patient")
+        parser.add_argument('--eob-bytes', default='0',
+                            help="Distribution of the padding added to each claim, in bytes")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            app = StubFhirBackend(latency=options['latency'], error_rate=options['error_rate'],
+                                  unmatched_rate=options['unmatched_rate'], eob_count=options['eob_count'],
+                                  eob_bytes=options['eob_bytes'], seed=options['seed'])
+        except ValueError as e:
+            raise CommandError(e)
+        server = make_server(app, options['host'], options['port'], quiet=options['verbosity'] < 2)
+        self.stdout.write("Stub FHIR backend at http://%s:%s/baseDstu3/" % server.server_address[:2])
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,254 @@
+import json
+import math
+import random
+import threading
+import time
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs
+from wsgiref import simple_server
+
+HICN_HASH_SYSTEM = 'http://bluebutton.cms.hhs.gov/identifier#hicnHash'
+RESOURCE_TYPES = ('Patient', 'Coverage', 'ExplanationOfBenefit')
+COVERAGE_PARTS = ('A', 'B', 'D')
+EOB_TYPES = ('carrier', 'inpatient', 'outpatient', 'pde', 'snf', 'dme')
+CONTENT_TYPE = 'application/json+fhir;charset=UTF-8'
+
+_conformance = []
+
+
+class Distribution(object):
+    """
+    A distribution of non negative numbers parsed from `spec`:
+
+        "20" or "fixed:20"     always 20
+        "uniform:10:50"        uniform between 10 and 50
+        "exponential:30"       exponential with a mean of 30
+        "lognormal:3:0.5"      exp() of a normal with mean 3, sigma 0.5
+        "normal:30:5"          normal with mean 30, sigma 5
+    """
+
+    KINDS = {
+        'fixed': (1, lambda rng, value: value),
+        'uniform': (2, lambda rng, low, high: rng.uniform(low, high)),
+        'exponential': (1, lambda rng, mean: rng.expovariate(1.0 / mean) if mean else 0),
+        'lognormal': (2, lambda rng, mu, sigma: rng.lognormvariate(mu, sigma)),
+        'normal': (2, lambda rng, mu, sigma: rng.normalvariate(mu, sigma)),
+    }
+
+    def __init__(self, spec):
+        self.spec = str(spec)
+        parts = self.spec.split(':')
+        if len(parts) == 1:
+            parts.insert(0, 'fixed')
+        self.kind, args = parts[0], parts[1:]
+        if self.kind not in self.KINDS or len(args) != self.KINDS[self.kind][0]:
+            raise ValueError("Invalid distribution %r" % self.spec)
+        try:
+            self.args = [float(arg) for arg in args]
+        except ValueError:
+            raise ValueError("Invalid distribution %r" % self.spec)
+
+    def sample(self, rng=random):
+        return max(0.0, self.KINDS[self.kind][1](rng, *self.args))
+
+    def sample_int(self, rng=random):
+        return int(math.floor(self.sample(rng) + 0.5))
+
+    def __repr__(self):
+        return 'Distribution(%r)' % self.spec
+
+
+def patient_id_for_hash(hicn_hash):
+    """
+    The fhir_id that the stub gives to the beneficiary with `hicn_hash`.
+    """
+    return str(int(hicn_hash[:12], 16))
+
+
+def conformance():
+    if not _conformance:
+        from apps.fhir.bluebutton.tests.data_conformance import CONFORMANCE
+        _conformance.append(json.loads(CONFORMANCE))
+    return _conformance[0]
+
+
+def bundle(base_url, resources):
+    return {
+        'resourceType': 'Bundle',
+        'type': 'searchset',
+        'total': len(resources),
+        'entry': [{'fullUrl': '%s%s/%s' % (base_url, resource['resourceType'], resource['id']),
+                   'resource': resource} for resource in resources],
+    }
+
+
+class StubFhirBackend(object):
+    """
+    A WSGI application standing in for the FHIR backend of a
+    ResourceRouter, for load tests and local runs.
+
+    It serves the conformance statement at `metadata`, reads of Patient,
+    Coverage and ExplanationOfBenefit, and the searches the API sends:
+    Patient by hicnHash identifier or `_id`, Coverage by `beneficiary`
+    and ExplanationOfBenefit by `patient`. Any hicnHash matches a
+    patient, except for the `unmatched_rate` fraction of them.
+
+    The documents are synthetic and derived from the patient id and
+    `seed`, so a run is reproducible. The number of claims of a patient
+    follows `eob_count` and each claim is padded to `eob_bytes`. Each
+    response is delayed by `latency` milliseconds, and fails with a 500
+    for the `error_rate` fraction of the requests.
+    """
+
+    def __init__(self, latency='0', error_rate=0.0, unmatched_rate=0.0,
+                 eob_count='lognormal:3:1', eob_bytes='0', seed=0):
+        self.latency = Distribution(latency)
+        self.error_rate = error_rate
+        self.unmatched_rate = unmatched_rate
+        self.eob_count = Distribution(eob_count)
+        self.eob_bytes = Distribution(eob_bytes)
+        self.seed = seed
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _rng(self, *key):
+        return random.Random('%s:%s' % (self.seed, ':'.join(str(k) for k in key)))
+
+    # Documents
+
+    def patient(self, patient_id):
+        rng = self._rng('patient', patient_id)
+        return {
+            'resourceType': 'Patient',
+            'id': patient_id,
+            'identifier': [{'system': 'https://bluebutton.cms.gov/resources/variables/bene_id',
+                            'value': patient_id}],
+            'name': [{'use': 'usual', 'family': 'Doe%s' % patient_id[-4:],
+                      'given': [rng.choice(('Jane', 'John', 'Alex', 'Sam'))]}],
+            'gender': rng.choice(('female', 'male', 'unknown')),
+            'birthDate': '%04d-%02d-%02d' % (rng.randint(1920, 1955), rng.randint(1, 12), rng.randint(1, 28)),
+            'address': [{'state': '%02d' % rng.randint(1, 54), 'postalCode': '%05d' % rng.randint(0, 99999)}],
+        }
+
+    def coverages(self, patient_id):
+        return [{
+            'resourceType': 'Coverage',
+            'id': 'part-%s-%s' % (part.lower(), patient_id),
+            'status': 'active',
+            'beneficiary': {'reference': 'Patient/%s' % patient_id},
+            'grouping': {'subGroup': 'Medicare', 'subPlan': 'Part %s' % part},
+        } for part in COVERAGE_PARTS]
+
+    def eobs(self, patient_id):
+        rng = self._rng('eob', patient_id)
+        return [self._eob(patient_id, index, rng) for index in range(self.eob_count.sample_int(rng))]
+
+    def _eob(self, patient_id, index, rng):
+        start = '%04d-%02d-%02d' % (rng.randint(2010, 2017), rng.randint(1, 12), rng.randint(1, 28))
+        eob = {
+            'resourceType': 'ExplanationOfBenefit',
+            'id': '%s-%s-%s' % (rng.choice(EOB_TYPES), patient_id, index),
+            'status': 'active',
+            'patient': {'reference': 'Patient/%s' % patient_id},
+            'billablePeriod': {'start': start},
+            'payment': {'amount': {'value': round(rng.uniform(5, 5000), 2), 'code': 'USD'}},
+        }
+        padding = self.eob_bytes.sample_int(rng)
+        if padding:
+            eob['extension'] = [{'url': 'https://bluebutton.cms.gov/resources/variables/padding',
+                                 'valueString': 'x' * padding}]
+        return eob
+
+    def read(self, resource_type, resource_id):
+        if resource_type == 'Patient':
+            return self.patient(resource_id)
+        prefix, _, rest = resource_id.partition('-')
+        if resource_type == 'Coverage':
+            part, _, patient_id = rest.partition('-')
+            resources = self.coverages(patient_id)
+        else:
+            patient_id, _, index = rest.rpartition('-')
+            resources = self.eobs(patient_id)
+        for resource in resources:
+            if resource['id'] == resource_id:
+                return resource
+        return None
+
+    def search(self, resource_type, params):
+        if resource_type == 'Patient':
+            if 'identifier' in params:
+                system, _, hicn_hash = params['identifier'].partition('|')
+                if system != HICN_HASH_SYSTEM or not hicn_hash or self._unmatched(hicn_hash):
+                    return []
+                return [self.patient(patient_id_for_hash(hicn_hash))]
+            if '_id' in params:
+                return [self.patient(params['_id'])]
+            return []
+        if resource_type == 'Coverage':
+            patient_id = params.get('beneficiary', '').rpartition('/')[2]
+            return self.coverages(patient_id) if patient_id else []
+        patient_id = params.get('patient', '').rpartition('/')[2]
+        return self.eobs(patient_id) if patient_id else []
+
+    def _unmatched(self, hicn_hash):
+        try:
+            return int(hicn_hash[12:16], 16) / 65536.0 < self.unmatched_rate
+        except ValueError:
+            return True
+
+    # WSGI
+
+    def __call__(self, environ, start_response):
+        with self._lock:
+            delay = self.latency.sample(self._random) / 1000.0
+            failed = self._random.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+        if failed:
+            return self._respond(start_response, 500, {'resourceType': 'OperationOutcome',
+                                                       'issue': [{'severity': 'error', 'code': 'exception'}]})
+
+        parts = [part for part in environ.get('PATH_INFO', '').split('/') if part]
+        params = dict((k, v[-1]) for k, v in parse_qs(environ.get('QUERY_STRING', '')).items())
+
+        if parts and parts[-1] == 'metadata':
+            return self._respond(start_response, 200, conformance())
+        if parts and parts[-1] in RESOURCE_TYPES:
+            base_url = self._base_url(environ, parts[:-1])
+            return self._respond(start_response, 200, bundle(base_url, self.search(parts[-1], params)))
+        if len(parts) >= 2 and parts[-2] in RESOURCE_TYPES:
+            resource = self.read(parts[-2], parts[-1])
+            if resource is not None:
+                return self._respond(start_response, 200, resource)
+        return self._respond(start_response, 404, {'resourceType': 'OperationOutcome',
+                                                   'issue': [{'severity': 'error', 'code': 'not-found'}]})
+
+    def _base_url(self, environ, prefix):
+        return '%s://%s/%s' % (environ.get('wsgi.url_scheme', 'http'), environ.get('HTTP_HOST', 'localhost'),
+                               ''.join(part + '/' for part in prefix))
+
+    def _respond(self, start_response, status, data):
+        body = json.dumps(data).encode('utf-8')
+        start_response('%s %s' % (status, {200: 'OK', 404: 'Not Found'}.get(status, 'Internal Server Error')),
+                       [('Content-Type', CONTENT_TYPE), ('Content-Length', str(len(body)))])
+        return [body]
+
+
+class ThreadingWSGIServer(ThreadingMixIn, simple_server.WSGIServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class QuietRequestHandler(simple_server.WSGIRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+
+def make_server(app, host='127.0.0.1', port=8080, quiet=True):
+    """
+    A threaded wsgiref server of `app`; port 0 picks a free port.
+    """
+    handler = QuietRequestHandler if quiet else simple_server.WSGIRequestHandler
+    return simple_server.make_server(host, port, app, server_class=ThreadingWSGIServer,
+                                     handler_class=handler)
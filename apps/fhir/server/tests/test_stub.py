@@ -0,0 +1,270 @@
+import glob
+import io
+import json
+import random
+import threading
+from io import BytesIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from hhs_oauth_server import memory
+from hhs_oauth_server.tests.helpers import TemporaryDirectoryMixin
+from hhs_oauth_server.tracing import flush
+
+from apps.mymedicare_cb.models import lookup_fhir_id
+from apps.test import BaseApiTest
+from apps.fhir.bluebutton.models import Crosswalk
+from ..models import ResourceRouter
+from ..stub import Distribution, StubFhirBackend, make_server, patient_id_for_hash
+
+HICN_HASH = '96228a57f37efea543f4f370f96f1dbf01c3e3129041dba3ea4367545507c6e7'
+
+
+def call(app, path, query=''):
+    status = []
+    environ = {'PATH_INFO': path, 'QUERY_STRING': query, 'HTTP_HOST': 'stub',
+               'wsgi.url_scheme': 'http', 'wsgi.input': BytesIO()}
+    body = b''.join(app(environ, lambda s, headers: status.append(int(s.split()[0]))))
+    return status[0], json.loads(body.decode('utf-8'))
+
+
+class DistributionTest(TestCase):
+
+    def test_distributions(self):
+        rng = random.Random(1)
+        self.assertEqual(Distribution('20').sample(rng), 20)
+        self.assertEqual(Distribution('fixed:2.6').sample_int(rng), 3)
+        self.assertTrue(all(10 <= Distribution('uniform:10:50').sample(rng) <= 50 for i in range(100)))
+        # negative samples are clipped
+        self.assertTrue(all(Distribution('normal:0:5').sample(rng) >= 0 for i in range(100)))
+        for spec in ('lognormal:3', 'poisson:3', 'uniform:a:b'):
+            with self.assertRaises(ValueError):
+                Distribution(spec)
+
+
+class StubFhirBackendTest(TestCase):
+
+    def setUp(self):
+        self.app = StubFhirBackend(eob_count='uniform:5:20', eob_bytes='100', seed=7)
+
+    def test_hicn_hash_search(self):
+        status, data = call(self.app, '/baseDstu3/Patient/',
+                            'identifier=http://bluebutton.cms.hhs.gov/identifier%23hicnHash|' + HICN_HASH)
+        self.assertEqual(status, 200)
+        self.assertEqual(data['total'], 1)
+        self.assertEqual(data['entry'][0]['resource']['id'], patient_id_for_hash(HICN_HASH))
+        self.assertEqual(data['entry'][0]['fullUrl'],
+                         'http://stub/baseDstu3/Patient/%s' % patient_id_for_hash(HICN_HASH))
+        unmatched = StubFhirBackend(unmatched_rate=1)
+        status, data = call(unmatched, '/baseDstu3/Patient/',
+                            'identifier=http://bluebutton.cms.hhs.gov/identifier%23hicnHash|' + HICN_HASH)
+        self.assertEqual(data['total'], 0)
+
+    def test_documents_are_reproducible(self):
+        status, eobs = call(self.app, '/baseDstu3/ExplanationOfBenefit/', 'patient=-20140000008325')
+        self.assertTrue(5 <= eobs['total'] <= 20)
+        self.assertEqual(call(StubFhirBackend(eob_count='uniform:5:20', eob_bytes='100', seed=7),
+                              '/baseDstu3/ExplanationOfBenefit/', 'patient=-20140000008325')[1], eobs)
+        eob = eobs['entry'][-1]['resource']
+        self.assertEqual(len(eob['extension'][0]['valueString']), 100)
+        self.assertEqual(call(self.app, '/baseDstu3/ExplanationOfBenefit/%s/' % eob['id']), (200, eob))
+
+        status, coverages = call(self.app, '/baseDstu3/Coverage/', 'beneficiary=Patient/-20140000008325')
+        self.assertEqual(coverages['total'], 3)
+        coverage = coverages['entry'][0]['resource']
+        self.assertEqual(call(self.app, '/baseDstu3/Coverage/%s/' % coverage['id']), (200, coverage))
+        self.assertEqual(call(self.app, '/baseDstu3/Coverage/part-x-1/')[0], 404)
+
+    def test_metadata_and_errors(self):
+        status, data = call(self.app, '/baseDstu3/metadata', '_format=json')
+        self.assertEqual((status, data['resourceType']), (200, 'Conformance'))
+        self.assertEqual(call(StubFhirBackend(error_rate=1), '/baseDstu3/metadata')[0], 500)
+        self.assertEqual(call(self.app, '/baseDstu3/Nothing/1/')[0], 404)
+
+
+class StubServerTestCase(BaseApiTest):
+    """
+    Serve the stub on a free port and route the default ResourceRouter
+    to it.
+    """
+
+    fixtures = ['testfixture']
+    backend_options = {'eob_count': 'fixed:25'}
+
+    def setUp(self):
+        self.server = make_server(StubFhirBackend(**self.backend_options), port=0)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        ResourceRouter.objects.update(fhir_url='http://127.0.0.1:%s/baseDstu3/' % self.server.server_address[1],
+                                      client_auth=False, cert_file=None, key_file=None)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class StubServerTest(StubServerTestCase):
+
+    def test_api_reads_from_the_stub(self):
+        self.read_capability = self._create_capability('Read', [])
+        self.write_capability = self._create_capability('Write', [])
+        token = self.create_token('John', 'Smith')
+        auth = {'HTTP_AUTHORIZATION': 'Bearer %s' % token}
+
+        response = self.client.get('/v1/fhir/Patient/20140000008325', **auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['id'], '20140000008325')
+        with override_settings(SERVER_TIMING_PUBLIC=True):
+            response = self.client.get('/v1/fhir/ExplanationOfBenefit/?patient=20140000008325', **auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total'], 25)
+        self.assertEqual(len(response.json()['entry']), 10)
+        phases = [entry.split(';')[0] for entry in response['Server-Timing'].split(', ')]
+        self.assertEqual(phases, ['token', 'crosswalk', 'backend_ttfb', 'backend_download', 'localize',
+                                  'serialize', 'db', 'total'])
+
+    def test_hicn_hash_lookup(self):
+        user = self._create_user('jane', '123456')
+        crosswalk = Crosswalk.objects.create(user=user, fhir_source=ResourceRouter.objects.get(pk=1),
+                                             user_id_hash='1000079036')
+        fhir_id, _ = lookup_fhir_id(crosswalk, timeout=5)
+        self.assertEqual(fhir_id, patient_id_for_hash(crosswalk.user_id_hash))
+
+
+class MemoryBudgetTest(StubServerTestCase):
+
+    backend_options = {'eob_count': 'fixed:60', 'eob_bytes': 'fixed:20000'}
+
+    def test_fhir_views_stay_within_their_memory_budget(self):
+        self.read_capability = self._create_capability('Read', [])
+        self.write_capability = self._create_capability('Write', [])
+        token = self.create_token('John', 'Smith')
+        auth = {'HTTP_AUTHORIZATION': 'Bearer %s' % token}
+        memory.report.clear()
+
+        # MEMORY_BUDGET_ENFORCE fails the requests going over their budget
+        with override_settings(MEMORY_SAMPLE_RATE=1):
+            response = self.client.get('/v1/fhir/ExplanationOfBenefit/?patient=20140000008325&count=50', **auth)
+            self.assertEqual(len(response.json()['entry']), 50)
+            eob_id = response.json()['entry'][0]['resource']['id']
+            self.assertEqual(self.client.get('/v1/fhir/ExplanationOfBenefit/%s' % eob_id, **auth).status_code, 200)
+            self.assertEqual(self.client.get('/v1/fhir/Patient/20140000008325', **auth).status_code, 200)
+
+        rows = dict(((row['view'], row['response_size']), row) for row in memory.report.summary())
+        search = rows[('bb_oauth_fhir_search', '100KB-1MB')]
+        self.assertEqual(search['requests'], 1)
+        self.assertGreater(search['peak_max'], 1024 * 1024)
+        self.assertIn(('bb_oauth_fhir_read_or_update_or_delete', '10KB-100KB'), rows)
+        self.assertIn(('bb_oauth_fhir_read_or_update_or_delete', '<10KB'), rows)
+
+
+class RecordingStubFhirBackend(StubFhirBackend):
+
+    def __init__(self, **kwargs):
+        super(RecordingStubFhirBackend, self).__init__(**kwargs)
+        self.traceparents = []
+
+    def __call__(self, environ, start_response):
+        self.traceparents.append(environ.get('HTTP_TRACEPARENT'))
+        return super(RecordingStubFhirBackend, self).__call__(environ, start_response)
+
+
+class TracingTest(TemporaryDirectoryMixin, StubServerTestCase):
+
+    def setUp(self):
+        super(TracingTest, self).setUp()
+        self.backend = RecordingStubFhirBackend(eob_count='fixed:25')
+        self.server.set_app(self.backend)
+
+    def spans(self):
+        flush()
+        spans = []
+        for path in glob.glob('%s/spans_*.json' % self.directory):
+            with open(path) as f:
+                for line in f:
+                    spans.extend(json.loads(line))
+        return spans
+
+    def test_spans_of_a_fhir_search(self):
+        self.read_capability = self._create_capability('Read', [])
+        self.write_capability = self._create_capability('Write', [])
+        token = self.create_token('John', 'Smith')
+        auth = {'HTTP_AUTHORIZATION': 'Bearer %s' % token}
+
+        with override_settings(TRACE_DIR=self.directory):
+            self.client.get('/v1/fhir/ExplanationOfBenefit/?patient=20140000008325', **auth)
+        self.assertEqual(self.spans(), [])
+        self.assertEqual(self.backend.traceparents, [None])
+
+        with override_settings(TRACE_DIR=self.directory, TRACE_SAMPLE_RATE=1):
+            response = self.client.get('/v1/fhir/ExplanationOfBenefit/?patient=20140000008325', **auth)
+        self.assertEqual(response.status_code, 200)
+        spans = self.spans()
+        self.assertEqual(len(set(span['traceId'] for span in spans)), 1)
+        by_name = dict((span['name'], span) for span in spans)
+        root = by_name['GET bb_oauth_fhir_search']
+        self.assertNotIn('parentId', root)
+        self.assertEqual((root['kind'], root['tags']['http.status_code']), ('SERVER', '200'))
+        for name in ('token', 'crosswalk', 'backend', 'backend_download', 'localize', 'serialize', 'db.query'):
+            self.assertIn(name, by_name)
+        ids = set(span['id'] for span in spans)
+        self.assertTrue(all(span['parentId'] in ids for span in spans if span is not root))
+        backend = by_name['backend']
+        self.assertEqual(by_name['backend_download']['parentId'], backend['id'])
+        self.assertEqual(backend['tags']['http.status_code'], '200')
+        self.assertEqual(self.backend.traceparents[-1], '00-%s-%s-01' % (backend['traceId'], backend['id']))
+        # no beneficiary identifier
+        self.assertEqual(root['tags']['http.path'], '/v1/fhir/ExplanationOfBenefit/')
+        self.assertIn('patient=REDACTED', backend['tags']['http.url'])
+        self.assertNotIn('20140000008325', json.dumps(spans))
+
+
+class SlowRequestTest(TemporaryDirectoryMixin, StubServerTestCase):
+
+    def test_slow_requests_are_recorded(self):
+        self.read_capability = self._create_capability('Read', [])
+        self.write_capability = self._create_capability('Write', [])
+        token = self.create_token('John', 'Smith')
+        auth = {'HTTP_AUTHORIZATION': 'Bearer %s' % token}
+        path = '/v1/fhir/ExplanationOfBenefit/?patient=20140000008325&count=5'
+
+        with override_settings(SLOW_REQUEST_DIR=self.directory, SLOW_REQUEST_THRESHOLD=60):
+            self.client.get(path, **auth)
+        self.assertEqual(glob.glob('%s/*' % self.directory), [])
+
+        with override_settings(SLOW_REQUEST_DIR=self.directory, SLOW_REQUEST_THRESHOLD=0.000001):
+            with self.assertLogs('performance', 'WARNING'):
+                response = self.client.get(path, **auth)
+            out = io.StringIO()
+            call_command('slow_requests', view='bb_oauth_fhir_search', stdout=out)
+            record_id = out.getvalue().split()[0]
+            out = io.StringIO()
+            call_command('slow_requests', record_id, stdout=out)
+            record = json.loads(out.getvalue())
+
+        with override_settings(SLOW_REQUEST_DIR=self.directory, SLOW_REQUEST_THRESHOLD=60):
+            User.objects.create_user('staff', password='secret', is_staff=True)
+            self.client.login(username='staff', password='secret')
+            self.assertEqual(self.client.get('/slow-requests').json()['records'][0]['id'], record_id)
+            self.assertEqual(self.client.get('/slow-requests', {'id': record_id}).json(), record)
+            self.assertEqual(self.client.get('/slow-requests', {'id': 'missing'}).status_code, 404)
+
+        self.assertEqual((record['status'], record['view']), (200, 'bb_oauth_fhir_search'))
+        self.assertEqual(record['path'], '/v1/fhir/ExplanationOfBenefit/')
+        self.assertEqual(record['response_bytes'], len(response.content))
+        self.assertIn('localize', record['phases_ms'])
+        self.assertTrue(record['queries'])
+        backend, = record['backend_calls']
+        self.assertEqual(backend['status'], 200)
+        self.assertIn('/baseDstu3/ExplanationOfBenefit/?', backend['url'])
+        self.assertIn('_format=application%2Fjson%2Bfhir&patient=REDACTED', backend['url'])
+        self.assertGreater(backend['bytes'], 0)
+        self.assertLessEqual(backend['ttfb_ms'], backend['ms'])
+        self.assertIn(('get', 'throttle_token_{id}', True),
+                      [(call['operation'], call['key'], call['hit']) for call in record['cache_calls']])
+        # no beneficiary identifier nor token
+        self.assertNotIn('20140000008325', json.dumps(record))
+        self.assertNotIn(token, json.dumps(record))
@@ -0,0 +1,31 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hhs_oauth_server.slow_requests import find_records, load_record, record_directory, summary
+
+
+class Command(BaseCommand):
+    help = ("List the latest slow request records of SLOW_REQUEST_DIR, or print one of them "
+            "with its SQL, backend and cache calls as JSON.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('record_id', nargs='?', default=None, help="Print this record")
+        parser.add_argument('--view', default=None, help="Only the records of this view")
+        parser.add_argument('--min-ms', type=float, default=None, help="Only the records taking this long")
+        parser.add_argument('--limit', type=int, default=50)
+
+    def handle(self, *args, **options):
+        if not record_directory():
+            raise CommandError("SLOW_REQUEST_DIR is not set.")
+        if options['record_id']:
+            record = load_record(options['record_id'])
+            if record is None:
+                raise CommandError("No record %s." % options['record_id'])
+            self.stdout.write(json.dumps(record, indent=2, sort_keys=True))
+            return
+
+        for record in find_records(options['view'], options['min_ms'], options['limit']):
+            line = summary(record)
+            self.stdout.write('%(id)s %(time)s %(ms)8.0fms %(status)s %(method)s %(path)s %(view)s '
+                              'queries:%(queries)s backend:%(backend_calls)s cache:%(cache_calls)s' % line)
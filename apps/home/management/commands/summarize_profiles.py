@@ -0,0 +1,56 @@
+import glob
+import io
+import os
+import pstats
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = ("Merge the per-request profiles written by ProfilingMiddleware by view, and print the "
+            "top functions of each view. Optionally merge the stacks of the sampling profilers "
+            "into one collapsed stacks file for flamegraph.pl.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', nargs='?', default=None, help="Defaults to PROFILE_DIR")
+        parser.add_argument('--view', default=None, help="Only the views whose name contains this")
+        parser.add_argument('--sort', default='cumulative', help="pstats sort key")
+        parser.add_argument('--limit', type=int, default=20, help="Functions printed per view")
+        parser.add_argument('--output', default=None, help="Write the merged profile of each view there")
+        parser.add_argument('--stacks', default=None, help="Write the merged sampled stacks to this file")
+
+    def handle(self, *args, **options):
+        directory = options['directory'] or getattr(settings, 'PROFILE_DIR', '')
+        if not directory or not os.path.isdir(directory):
+            raise CommandError("No profile directory %r." % directory)
+
+        by_view = defaultdict(list)
+        for path in sorted(glob.glob(os.path.join(directory, '**', '*.prof'), recursive=True)):
+            view = os.path.basename(path).rpartition('--')[0]
+            if not options['view'] or options['view'] in view:
+                by_view[view].append(path)
+
+        for view, paths in sorted(by_view.items()):
+            out = io.StringIO()
+            stats = pstats.Stats(*paths, stream=out)
+            stats.sort_stats(options['sort']).print_stats(options['limit'])
+            self.stdout.write('=== %s: %s requests, %.3fs per request\n' % (
+                view, len(paths), stats.total_tt / len(paths)))
+            self.stdout.write(out.getvalue())
+            if options['output']:
+                os.makedirs(options['output'], exist_ok=True)
+                stats.dump_stats(os.path.join(options['output'], '%s.prof' % view))
+
+        if options['stacks']:
+            stacks = Counter()
+            for path in glob.glob(os.path.join(directory, 'stacks_*.txt')):
+                with open(path) as f:
+                    for line in f:
+                        stack, _, count = line.rstrip('\n').rpartition(' ')
+                        stacks[stack] += int(count)
+            with open(options['stacks'], 'w') as f:
+                for stack, count in stacks.most_common():
+                    f.write('%s %d\n' % (stack, count))
+            self.stdout.write('%s stacks written to %s' % (len(stacks), options['stacks']))
@@ -1,7 +1,5 @@
 from django.shortcuts import render
 from django.utils.translation import ugettext_lazy as _
-from ..accounts.models import UserProfile
-from ..fhir.bluebutton.models import Crosswalk
 from django.views.decorators.cache import never_cache
 
 
@@ -18,14 +16,8 @@ def authenticated_home(request):
     template = 'authenticated-home.html'
     if request.user.is_authenticated():
         name = _('Authenticated Home')
-        try:
-            profile = UserProfile.objects.get(user=request.user)
-        except UserProfile.DoesNotExist:
-            profile = None
-        try:
-            crosswalk = Crosswalk.objects.get(user=request.user)
-        except Crosswalk.DoesNotExist:
-            crosswalk = None
+        profile = request.principal.profile
+        crosswalk = request.principal.crosswalk
 
         if crosswalk is None:
             fhir_id = '0'
@@ -1,6 +1,6 @@
 import logging
-import requests
 from django.conf import settings
+from .connections import pooled_session, sls_timeout
 
 logger = logging.getLogger('hhs_server.%s' % __name__)
 
@@ -34,10 +34,11 @@ class OAuth2Config():
             "redirect_uri": self.redirect_uri,
         }
 
-        response = requests.post(self.token_endpoint,
-                                 auth=self.basic_auth(),
-                                 json=token_dict,
-                                 verify=self.verify_ssl)
+        response = pooled_session('sls').post(self.token_endpoint,
+                                              auth=self.basic_auth(),
+                                              json=token_dict,
+                                              verify=self.verify_ssl,
+                                              timeout=sls_timeout())
 
         response.raise_for_status()
 
@@ -0,0 +1,35 @@
+import threading
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+def pooled_session(name):
+    """
+    Return the process wide requests.Session called `name`. Its
+    connections are kept alive between logins, up to
+    `MEDICARE_HTTP_POOL_SIZE` per host. Cookies are never stored, since
+    the session is shared by all the users.
+    """
+    session = _sessions.get(name)
+    if session is None:
+        with _lock:
+            session = _sessions.get(name)
+            if session is None:
+                session = requests.Session()
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                pool_size = getattr(settings, 'MEDICARE_HTTP_POOL_SIZE', 10)
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _sessions[name] = session
+    return session
+
+
+def sls_timeout():
+    return getattr(settings, 'SLS_REQUEST_TIMEOUT', (3, 10))
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.9 on 2026-10-19 10:56
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mymedicare_cb', '0002_remove_anonuserstate_session_key'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='AnonUserState',
+        ),
+    ]
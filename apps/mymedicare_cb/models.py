@@ -1,15 +1,122 @@
-import requests
 import logging
-from django.db import models
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
 from django.contrib.auth.models import User, Group
+from apps.accounts.ephemeral import EphemeralStore
+from apps.accounts.hashing import hash_user_id
 from apps.accounts.models import UserProfile
 from apps.fhir.authentication import convert_sls_uuid
 from apps.fhir.bluebutton.models import Crosswalk
-from apps.fhir.bluebutton.utils import get_resourcerouter, FhirServerAuth
+from apps.fhir.bluebutton.utils import get_resourcerouter, FhirServerAuth, FhirServerVerify
+from hhs_oauth_server.tracing import backend_call, current_span, propagation_headers, span
+from .connections import pooled_session
 
 logger = logging.getLogger('hhs_server.%s' % __name__)
 
 
+def fhir_id_cache_key(user_id_hash):
+    return 'mymedicare_fhir_id:%s' % user_id_hash
+
+
+def lookup_fhir_id(crosswalk, timeout):
+    """
+    Search the backend for the patient with the hicnHash of `crosswalk`.
+    Returns the fhir_id, or None when no single patient matches, and the
+    search bundle. Raises a requests RequestException when the backend
+    fails or does not answer within `timeout` seconds.
+    """
+    auth_state = FhirServerAuth(crosswalk)
+    certs = (auth_state['cert_file'], auth_state['key_file'])
+
+    # URL for patient ID.
+    url = crosswalk.fhir_source.fhir_url + \
+        "Patient/?identifier=http%3A%2F%2Fbluebutton.cms.hhs.gov%2Fidentifier%23hicnHash%7C" + \
+        crosswalk.user_id_hash + \
+        "&_format=json"
+    with backend_call(url) as call:
+        response = pooled_session('backend').get(url, cert=certs, verify=FhirServerVerify(crosswalk),
+                                                 timeout=timeout, headers=propagation_headers())
+        call.finished(response)
+    response.raise_for_status()
+    backend_data = response.json()
+
+    fhir_id = None
+    if 'entry' in backend_data and backend_data['total'] == 1:
+        fhir_id = backend_data['entry'][0]['resource']['id']
+        cache.set(fhir_id_cache_key(crosswalk.user_id_hash), fhir_id,
+                  getattr(settings, 'MEDICARE_FHIR_ID_CACHE_SECONDS', 86400))
+    return fhir_id, backend_data
+
+
+def retry_fhir_id_lookup(crosswalk_pk, user_id_hash, delay=0):
+    """
+    Retry the backend search of a crosswalk whose lookup failed at login,
+    up to `MEDICARE_FHIR_LOOKUP_RETRIES` times, waiting `delay` seconds
+    doubled after each attempt. Gives up when the crosswalk got its
+    fhir_id or another hicn hash meanwhile.
+    """
+    for attempt in range(getattr(settings, 'MEDICARE_FHIR_LOOKUP_RETRIES', 3)):
+        if delay:
+            time.sleep(delay * 2 ** attempt)
+        crosswalk = Crosswalk.objects.select_related('fhir_source').filter(
+            pk=crosswalk_pk, user_id_hash=user_id_hash).first()
+        if crosswalk is None or crosswalk.fhir_id:
+            return
+        try:
+            with span('fhir_id_lookup', tags={'attempt': attempt + 1}):
+                fhir_id, _ = lookup_fhir_id(crosswalk, timeout=crosswalk.fhir_source.wait_time)
+        except requests.exceptions.RequestException as e:
+            logger.warning("Beneficiary FHIR lookup attempt %s failed: %s" % (attempt + 1, e))
+            continue
+        if fhir_id:
+            crosswalk.fhir_id = fhir_id
+            crosswalk.save(update_fields=['fhir_id'])
+            logger.info("Success:Beneficiary connected to FHIR")
+        else:
+            logger.error("Failed to connect Beneficiary "
+                         "to FHIR")
+        return
+    logger.error("Failed to connect Beneficiary to FHIR, the next login retries")
+
+
+def _retry_in_thread(crosswalk_pk, user_id_hash, delay, parent=None):
+    try:
+        # in the trace of the login scheduling it
+        with span('fhir_id_lookup_retry', parent=parent):
+            retry_fhir_id_lookup(crosswalk_pk, user_id_hash, delay)
+    except Exception:
+        logger.exception("Beneficiary FHIR lookup failed")
+    finally:
+        connection.close()
+
+
+def schedule_fhir_id_lookup(crosswalk_pk, user_id_hash):
+    """
+    Retry the backend search in a background thread once the current
+    transaction commits, or inline when `MEDICARE_FHIR_LOOKUP_BACKGROUND`
+    is False.
+    """
+    if not getattr(settings, 'MEDICARE_FHIR_LOOKUP_BACKGROUND', True):
+        retry_fhir_id_lookup(crosswalk_pk, user_id_hash)
+        return
+
+    parent = current_span()
+
+    def start():
+        thread = threading.Thread(target=_retry_in_thread, name='fhir-id-lookup',
+                                  args=(crosswalk_pk, user_id_hash,
+                                        getattr(settings, 'MEDICARE_FHIR_LOOKUP_RETRY_DELAY', 5), parent))
+        thread.daemon = True
+        thread.start()
+
+    transaction.on_commit(start)
+
+
 def get_and_update_user(user_info):
     username = convert_sls_uuid(user_info['sub'])
     try:
@@ -41,30 +148,32 @@ def get_and_update_user(user_info):
     fhir_source = get_resourcerouter()
     crosswalk, _ = Crosswalk.objects.get_or_create(
         user=user, fhir_source=fhir_source)
-    hicn = user_info.get('hicn', "")
-    crosswalk.user_id_hash = hicn
-    crosswalk.save()
-
-    auth_state = FhirServerAuth(None)
-    certs = (auth_state['cert_file'], auth_state['key_file'])
-
-    # URL for patient ID.
-    url = fhir_source.fhir_url + \
-        "Patient/?identifier=http%3A%2F%2Fbluebutton.cms.hhs.gov%2Fidentifier%23hicnHash%7C" + \
-        crosswalk.user_id_hash + \
-        "&_format=json"
-    response = requests.get(url, cert=certs, verify=False)
-    backend_data = response.json()
+    crosswalk.fhir_source = fhir_source
+    user_id_hash = hash_user_id(user_info.get('hicn', ""))
 
-    if 'entry' in backend_data and backend_data['total'] == 1:
-        fhir_id = backend_data['entry'][0]['resource']['id']
-        crosswalk.fhir_id = fhir_id
-        crosswalk.save()
-
-        logger.info("Success:Beneficiary connected to FHIR")
-    else:
-        logger.error("Failed to connect Beneficiary "
-                     "to FHIR")
+    # a known beneficiary is not searched again on the login path
+    backend_data = {}
+    deferred = False
+    if not crosswalk.fhir_id or crosswalk.user_id_hash != user_id_hash:
+        crosswalk.user_id_hash = user_id_hash
+        crosswalk.fhir_id = cache.get(fhir_id_cache_key(user_id_hash), "")
+        if not crosswalk.fhir_id:
+            try:
+                fhir_id, backend_data = lookup_fhir_id(
+                    crosswalk, timeout=getattr(settings, 'MEDICARE_FHIR_LOOKUP_TIMEOUT', 3))
+            except requests.exceptions.RequestException as e:
+                logger.warning("Beneficiary FHIR lookup deferred: %s" % e)
+                deferred = True
+            else:
+                if fhir_id:
+                    crosswalk.fhir_id = fhir_id
+                    logger.info("Success:Beneficiary connected to FHIR")
+                else:
+                    logger.error("Failed to connect Beneficiary "
+                                 "to FHIR")
+    crosswalk.save()
+    if deferred:
+        schedule_fhir_id_lookup(crosswalk.pk, user_id_hash)
 
     # Get first and last name from FHIR if not in OIDC Userinfo response.
     if user_info['given_name'] == "" or user_info['family_name'] == "":
@@ -85,9 +194,5 @@ def get_and_update_user(user_info):
     return user
 
 
-class AnonUserState(models.Model):
-    state = models.CharField(default='', max_length=64, db_index=True)
-    next_uri = models.CharField(default='', max_length=512)
-
-    def __str__(self):
-        return '%s %s' % (self.state, self.next_uri)
+# next_uri of the MyMedicare logins in progress, by state parameter
+anon_user_states = EphemeralStore('mymedicare_state', 'MEDICARE_STATE_SECONDS')
@@ -4,11 +4,16 @@ from django.conf import settings
 from django.test import TestCase
 from urllib.parse import urlparse, parse_qs
 from apps.mymedicare_cb.views import generate_nonce
-from apps.mymedicare_cb.models import AnonUserState
+from apps.mymedicare_cb.models import anon_user_states
 from apps.mymedicare_cb.authorization import OAuth2Config
 from httmock import urlmatch, all_requests, HTTMock
-from django.contrib.auth.models import Group
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from apps.accounts.hashing import hash_user_id
+from apps.fhir.authentication import convert_sls_uuid
+from apps.fhir.bluebutton.models import Crosswalk
 from apps.fhir.server.models import ResourceRouter
+from apps.mymedicare_cb.models import fhir_id_cache_key
 
 from .responses import patient_response
 
@@ -22,7 +27,9 @@ class MyMedicareBlueButtonClientApiUserInfoTest(TestCase):
         self.callback_url = reverse('mymedicare-sls-callback')
         self.login_url = reverse('mymedicare-login')
         Group.objects.create(name='BlueButton')
-        ResourceRouter.objects.create(pk=settings.FHIR_SERVER_DEFAULT, fhir_url="http://bogus.com/")
+        self.fhir_source = ResourceRouter.objects.create(pk=settings.FHIR_SERVER_DEFAULT,
+                                                         fhir_url="http://bogus.com/")
+        cache.clear()
 
     def test_login_url_success(self):
         """
@@ -49,7 +56,7 @@ class MyMedicareBlueButtonClientApiUserInfoTest(TestCase):
     def test_callback_url_success(self):
         # create a state
         state = generate_nonce()
-        AnonUserState.objects.create(state=state, next_uri="http://www.google.com")
+        anon_user_states.set(state, {"next_uri": "http://www.google.com"})
         # mock sls token endpoint
 
         @urlmatch(netloc='dev.accounts.cms.gov', path='/v1/oauth/token')
@@ -94,11 +101,14 @@ class MyMedicareBlueButtonClientApiUserInfoTest(TestCase):
             self.assertRedirects(response, "http://www.google.com", fetch_redirect_response=False)
             # assert login
             self.assertIn('_auth_user_id', self.client.session)
+            # the state is used once
+            response = self.client.get(self.callback_url, data={'code': 'test', 'state': state})
+            self.assertEqual(response.status_code, 400)
 
     def test_callback_url_failure(self):
         # create a state
         state = generate_nonce()
-        AnonUserState.objects.create(state=state, next_uri="http://www.google.com")
+        anon_user_states.set(state, {"next_uri": "http://www.google.com"})
 
         @all_requests
         def catchall(url, request):
@@ -111,6 +121,8 @@ class MyMedicareBlueButtonClientApiUserInfoTest(TestCase):
             response = self.client.get(self.callback_url, data={'code': 'test', 'state': state})
             # assert http redirect
             self.assertEqual(response.status_code, 502)
+        # the state is kept for the user to try again
+        self.assertEqual(anon_user_states.get(state), {"next_uri": "http://www.google.com"})
 
     def test_sls_token_exchange_w_creds(self):
         with self.settings(SLS_CLIENT_ID="test",
@@ -154,3 +166,73 @@ class MyMedicareBlueButtonClientApiUserInfoTest(TestCase):
                 with self.assertRaises(requests.exceptions.HTTPError):
                     tkn = sls_client.exchange("test_code")
                     self.assertEquals(tkn, "test_tkn")
+
+    def _login(self, *mocks):
+        state = generate_nonce()
+        anon_user_states.set(state, {"next_uri": "http://www.google.com"})
+
+        @urlmatch(netloc='dev.accounts.cms.gov', path='/v1/oauth/token')
+        def sls_token_mock(url, request):
+            return {'status_code': 200, 'content': {'access_token': 'works'}}
+
+        @urlmatch(netloc='dev.accounts.cms.gov', path='/v1/oauth/userinfo')
+        def sls_user_info_mock(url, request):
+            return {
+                'status_code': 200,
+                'content': {
+                    'sub': '0123456789abcdefghijklmnopqrstuvwxyz',
+                    'given_name': 'Bob',
+                    'family_name': 'Bobson',
+                    'email': 'bob@bobserver.bob',
+                    'hicn': '1000079035',
+                },
+            }
+
+        @all_requests
+        def catchall(url, request):
+            raise Exception(url)
+
+        with HTTMock(sls_token_mock, sls_user_info_mock, *(mocks + (catchall,))):
+            response = self.client.get(self.callback_url, data={'code': 'test', 'state': state})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('_auth_user_id', self.client.session)
+
+    def test_known_beneficiary_skips_backend_search(self):
+        user = User.objects.create(username=convert_sls_uuid('0123456789abcdefghijklmnopqrstuvwxyz'))
+        Crosswalk.objects.create(user=user, fhir_source=self.fhir_source,
+                                 fhir_id='19990000000001', user_id_hash='1000079035')
+        # the catchall fails any backend call
+        self._login()
+        self.assertEqual(Crosswalk.objects.get(user=user).fhir_id, '19990000000001')
+
+    def test_fhir_id_is_cached(self):
+        cache.set(fhir_id_cache_key(hash_user_id('1000079035')), '19990000000001')
+        self._login()
+        self.assertEqual(Crosswalk.objects.get().fhir_id, '19990000000001')
+
+    def test_backend_search_is_deferred(self):
+        calls = []
+
+        @urlmatch(netloc='bogus.com', path='/Patient/')
+        def fhir_patient_info_mock(url, request):
+            calls.append(request.url)
+            if len(calls) == 1:
+                raise requests.exceptions.Timeout('too slow')
+            return {'status_code': 200, 'content': patient_response}
+
+        # the login succeeds and the retry, inline in the tests, finds the patient
+        self._login(fhir_patient_info_mock)
+        self.assertEqual(len(calls), 2)
+        crosswalk = Crosswalk.objects.get()
+        self.assertEqual(crosswalk.fhir_id, '19990000000001')
+        self.assertEqual(crosswalk.user_id_hash, hash_user_id('1000079035'))
+        self.assertEqual(cache.get(fhir_id_cache_key(crosswalk.user_id_hash)), '19990000000001')
+
+    def test_backend_failures_do_not_block_login(self):
+        @urlmatch(netloc='bogus.com', path='/Patient/')
+        def fhir_patient_info_mock(url, request):
+            return {'status_code': 503, 'content': {}}
+
+        with self.settings(MEDICARE_FHIR_LOOKUP_RETRIES=2):
+            self._login(fhir_patient_info_mock)
+        self.assertEqual(Crosswalk.objects.get().fhir_id, '')
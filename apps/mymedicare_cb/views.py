@@ -1,5 +1,5 @@
 from django.conf import settings
-from django.http import HttpResponseRedirect
+from django.http import Http404, HttpResponseRedirect
 from django.core.urlresolvers import reverse
 from django.contrib.auth import login
 import requests
@@ -7,13 +7,14 @@ from django.http import JsonResponse
 import urllib.request as urllib_request
 import random
 from .models import (
-    AnonUserState,
+    anon_user_states,
     get_and_update_user,
 )
 import logging
 from django.shortcuts import render
 from django.views.decorators.cache import never_cache
 from .authorization import OAuth2Config
+from .connections import pooled_session, sls_timeout
 
 logger = logging.getLogger('hhs_server.%s' % __name__)
 
@@ -27,40 +28,44 @@ def callback(request):
             "error": 'The state parameter is required'
         }, status=400)
 
-    try:
-        anon_user_state = AnonUserState.objects.get(state=state)
-    except AnonUserState.DoesNotExist:
-        return JsonResponse({"error": 'The requested state was not found'}, status=400)
-    next_uri = anon_user_state.next_uri
-
     code = request.GET.get('code')
     if not code:
         return JsonResponse({
             "error": 'The code parameter is required'
         }, status=400)
 
+    if anon_user_states.get(state) is None:
+        return JsonResponse({"error": 'The requested state was not found'}, status=400)
+
     sls_client = OAuth2Config()
 
     try:
         sls_client.exchange(code)
-    except requests.exceptions.HTTPError as e:
+    except requests.exceptions.RequestException as e:
+        # the state is kept, for the user to try again
         logger.error("Token request response error {reason}".format(reason=e))
         return JsonResponse({
             "error": 'An error occurred connecting to account.mymedicare.gov'
         }, status=502)
 
+    # the state is used once, by the first exchange that succeeded
+    anon_user_state = anon_user_states.pop(state)
+    if anon_user_state is None:
+        return JsonResponse({"error": 'The requested state was not found'}, status=400)
+    next_uri = anon_user_state['next_uri']
+
     userinfo_endpoint = getattr(
         settings,
         'SLS_USERINFO_ENDPOINT',
         'https://test.accounts.cms.gov/v1/oauth/userinfo')
 
-    response = requests.get(userinfo_endpoint,
-                            headers=sls_client.auth_header(),
-                            verify=sls_client.verify_ssl)
-
     try:
+        response = pooled_session('sls').get(userinfo_endpoint,
+                                             headers=sls_client.auth_header(),
+                                             verify=sls_client.verify_ssl,
+                                             timeout=sls_timeout())
         response.raise_for_status()
-    except requests.exceptions.HTTPError as e:
+    except requests.exceptions.RequestException as e:
         logger.error("User info request response error {reason}".format(reason=e))
         return JsonResponse({
             "error": 'An error occurred connecting to account.mymedicare.gov'
@@ -91,7 +96,7 @@ def mymedicare_login(request):
         mymedicare_login_url, state, redirect)
     next_uri = request.GET.get('next', "")
 
-    AnonUserState.objects.create(state=state, next_uri=next_uri)
+    anon_user_states.set(state, {'next_uri': next_uri})
     if getattr(settings, 'ALLOW_CHOOSE_LOGIN', False):
         return HttpResponseRedirect(reverse('mymedicare-choose-login'))
 
@@ -103,9 +108,12 @@ def mymedicare_choose_login(request):
     mymedicare_login_uri = settings.MEDICARE_LOGIN_URI
     redirect = settings.MEDICARE_REDIRECT_URI
     redirect = urllib_request.pathname2url(redirect)
-    anon_user_state = AnonUserState.objects.get(state=request.session['state'])
+    state = request.session['state']
+    anon_user_state = anon_user_states.get(state)
+    if anon_user_state is None:
+        raise Http404("The requested state was not found")
     mymedicare_login_uri = "%s&state=%s&redirect_uri=%s" % (
-        mymedicare_login_uri, anon_user_state.state, redirect)
-    context = {'next_uri': anon_user_state.next_uri,
+        mymedicare_login_uri, state, redirect)
+    context = {'next_uri': anon_user_state['next_uri'],
                'mymedicare_login_uri': mymedicare_login_uri}
     return render(request, 'design_system/login.html', context)
@@ -0,0 +1,261 @@
+import math
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import parse_qs, urljoin, urlparse
+
+import requests
+
+# (step name, path) of the API calls each flow makes once it has a
+# token; {patient} is replaced with the patient id of the userinfo
+DEFAULT_SCRIPT = (
+    ('userinfo', '/v1/connect/userinfo'),
+    ('patient', '/v1/fhir/Patient/{patient}'),
+    ('coverage', '/v1/fhir/Coverage/?beneficiary=Patient/{patient}'),
+    ('eob', '/v1/fhir/ExplanationOfBenefit/?patient={patient}'),
+)
+PERCENTILES = (50, 90, 95, 99)
+
+
+class FormParser(HTMLParser):
+    """
+    Collect the values a browser would post with the first form of a
+    page: the inputs, checked or not, and the first option of the
+    selects.
+    """
+
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.fields = []
+        self._select = None
+        self._forms = 0
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'form':
+            self._forms += 1
+        if self._forms != 1:
+            return
+        if tag == 'input' and attrs.get('name') and attrs.get('type') not in ('submit', 'button'):
+            self.fields.append((attrs['name'], attrs.get('value', '')))
+        elif tag == 'select':
+            self._select = attrs.get('name')
+        elif tag == 'option' and self._select:
+            self.fields.append((self._select, attrs.get('value', '')))
+            self._select = None
+
+    def handle_endtag(self, tag):
+        if tag == 'select':
+            self._select = None
+
+
+def form_fields(html):
+    parser = FormParser()
+    parser.feed(html)
+    return parser.fields
+
+
+class StepFailed(Exception):
+    pass
+
+
+def percentile(values, pct):
+    """
+    The nearest-rank `pct` percentile of the sorted `values`.
+    """
+    if not values:
+        return None
+    rank = int(math.ceil(pct / 100.0 * len(values)))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+class Recorder(object):
+    """
+    Collect the latency and outcome of each step.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, step, seconds, status, ok):
+        with self._lock:
+            self.samples[step].append(seconds * 1000)
+            self.statuses[step][str(status)] += 1
+            if not ok:
+                self.errors[step] += 1
+
+    def report(self, elapsed):
+        steps = {}
+        for step, samples in self.samples.items():
+            samples = sorted(samples)
+            stats = {
+                'count': len(samples),
+                'errors': self.errors[step],
+                'error_rate': self.errors[step] / float(len(samples)),
+                'throughput': len(samples) / elapsed if elapsed else 0,
+                'mean_ms': sum(samples) / len(samples),
+                'max_ms': samples[-1],
+                'statuses': dict(self.statuses[step]),
+            }
+            for pct in PERCENTILES:
+                stats['p%s_ms' % pct] = percentile(samples, pct)
+            steps[step] = stats
+        return steps
+
+
+class LoadTest(object):
+    """
+    Drive `users`, a list of (username, password), through the OAuth
+    authorization code flow of the application `client_id`, then through
+    `script`, from `concurrency` threads against the server at
+    `base_url`. Runs `flows` flows, or as many as fit in `duration`
+    seconds when it is set.
+    """
+
+    def __init__(self, base_url, users, client_id, client_secret, redirect_uri,
+                 script=DEFAULT_SCRIPT, concurrency=10, flows=100, duration=None,
+                 eob_pages=1, timeout=30, verify=True):
+        self.base_url = base_url.rstrip('/')
+        self.users = users
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.redirect_uri = redirect_uri
+        self.script = script
+        self.concurrency = concurrency
+        self.flows = flows
+        self.duration = duration
+        self.eob_pages = eob_pages
+        self.timeout = timeout
+        self.verify = verify
+        self.recorder = Recorder()
+        self._lock = threading.Lock()
+        self._started = 0
+        self._completed = 0
+        self._failed = 0
+
+    def url(self, path):
+        return urljoin(self.base_url + '/', path.lstrip('/'))
+
+    def _call(self, step, method, session, url, expect=(200,), **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        kwargs.setdefault('allow_redirects', False)
+        kwargs.setdefault('verify', self.verify)
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException as e:
+            self.recorder.record(step, time.perf_counter() - start, type(e).__name__, False)
+            raise StepFailed('%s: %s' % (step, e))
+        ok = response.status_code in expect
+        self.recorder.record(step, time.perf_counter() - start, response.status_code, ok)
+        if not ok:
+            raise StepFailed('%s: HTTP %s' % (step, response.status_code))
+        return response
+
+    def _post_form(self, step, session, url, page, extra, expect):
+        data = [field for field in form_fields(page.text) if field[0] not in extra]
+        data.extend(extra.items())
+        return self._call(step, 'POST', session, url, data=data, expect=expect,
+                          headers={'Referer': url})
+
+    def authorize(self, session, username, password):
+        """
+        Log `username` in and go through the consent page. Returns the
+        access token.
+        """
+        login_url = self.url('/v1/accounts/mfa/login')
+        page = self._call('login_page', 'GET', session, login_url)
+        self._post_form('login', session, login_url, page,
+                        {'username': username, 'password': password}, expect=(302,))
+
+        params = {'client_id': self.client_id, 'response_type': 'code', 'redirect_uri': self.redirect_uri}
+        authorize_url = self.url('/v1/o/authorize/')
+        response = self._call('authorize_page', 'GET', session, authorize_url, params=params,
+                              expect=(200, 302))
+        if response.status_code == 200:
+            response = self._post_form('authorize', session, response.url, response,
+                                       {'allow': 'Approve'}, expect=(302,))
+        code = parse_qs(urlparse(response.headers.get('Location', '')).query).get('code')
+        if not code:
+            raise StepFailed('authorize: no code in the redirect')
+
+        response = self._call('token', 'POST', requests.Session(), self.url('/v1/o/token/'), data={
+            'grant_type': 'authorization_code', 'code': code[0], 'redirect_uri': self.redirect_uri,
+        }, auth=(self.client_id, self.client_secret))
+        return response.json()['access_token']
+
+    def run_script(self, token):
+        session = requests.Session()
+        session.headers['Authorization'] = 'Bearer %s' % token
+        patient = None
+        for step, path in self.script:
+            response = self._call(step, 'GET', session, self.url(path.format(patient=patient)))
+            if step == 'userinfo':
+                patient = response.json().get('patient')
+            elif step == 'eob':
+                self._follow_pages(session, response)
+
+    def _follow_pages(self, session, response):
+        for page in range(1, self.eob_pages):
+            links = dict((link['relation'], link['url']) for link in response.json().get('link', []))
+            if 'next' not in links:
+                return
+            response = self._call('eob_page', 'GET', session, links['next'])
+
+    def flow(self, index):
+        username, password = self.users[index % len(self.users)]
+        start = time.perf_counter()
+        try:
+            self.run_script(self.authorize(requests.Session(), username, password))
+        except StepFailed:
+            ok = False
+        else:
+            ok = True
+        self.recorder.record('flow', time.perf_counter() - start, 'ok' if ok else 'failed', ok)
+        with self._lock:
+            self._completed += 1
+            self._failed += not ok
+
+    def _next_flow(self, deadline):
+        with self._lock:
+            if deadline is not None:
+                if time.time() >= deadline:
+                    return None
+            elif self._started >= self.flows:
+                return None
+            self._started += 1
+            return self._started - 1
+
+    def _worker(self, deadline):
+        while True:
+            index = self._next_flow(deadline)
+            if index is None:
+                return
+            self.flow(index)
+
+    def run(self):
+        """
+        Run the load test and return its report.
+        """
+        deadline = time.time() + self.duration if self.duration else None
+        started = time.time()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            for future in [pool.submit(self._worker, deadline) for i in range(self.concurrency)]:
+                future.result()
+        elapsed = time.perf_counter() - start
+        return {
+            'started': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(started)),
+            'base_url': self.base_url,
+            'concurrency': self.concurrency,
+            'elapsed_s': elapsed,
+            'flows': self._completed,
+            'failed_flows': self._failed,
+            'flows_per_s': self._completed / elapsed if elapsed else 0,
+            'steps': self.recorder.report(elapsed),
+        }
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.testclient.synthetic import SyntheticData
+
+
+class Command(BaseCommand):
+    help = ("Bulk insert synthetic beneficiaries with their profile, crosswalk and access tokens, "
+            "for performance tests. The data derives from --seed, so runs are reproducible; "
+            "--start extends a previous run. The crosswalks match the patients of the stub FHIR "
+            "backend (run_fhir_stub) started with the same --seed, --eob-count and --eob-bytes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int, help="Number of beneficiaries")
+        parser.add_argument('--start', type=int, default=0, help="Index of the first beneficiary")
+        parser.add_argument('--prefix', default='synth', help="Prefix of the usernames")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--password', default='synthetic-password', help="Password of every user")
+        parser.add_argument('--applications', type=int, default=10)
+        parser.add_argument('--tokens-per-user', default='fixed:1',
+                            help="Distribution of the number of access tokens per beneficiary")
+        parser.add_argument('--expired-rate', type=float, default=0.25,
+                            help="Fraction of the access tokens already expired")
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help="Beneficiaries inserted per transaction")
+        parser.add_argument('--processes', type=int, default=None,
+                            help="Processes hashing and inserting the batches, defaults to the number of CPUs; one on SQLite")
+        parser.add_argument('--documents', default=None,
+                            help="Directory where to write the FHIR documents as NDJSON")
+        parser.add_argument('--eob-count', default='lognormal:3:1',
+                            help="Distribution of the number of claims per beneficiary")
+        parser.add_argument('--eob-bytes', default='0',
+                            help="Distribution of the padding added to each claim, in bytes")
+
+    def handle(self, *args, **options):
+        try:
+            generator = SyntheticData(
+                options['count'], start=options['start'], prefix=options['prefix'], seed=options['seed'],
+                password=options['password'], applications=options['applications'],
+                tokens_per_user=options['tokens_per_user'], expired_rate=options['expired_rate'],
+                batch_size=options['batch_size'], processes=options['processes'],
+                documents_dir=options['documents'], eob_count=options['eob_count'],
+                eob_bytes=options['eob_bytes'])
+        except ValueError as e:
+            raise CommandError(e)
+
+        def progress(done, elapsed):
+            self.stdout.write("%s/%s beneficiaries, %.0f/s" % (
+                done, options['count'], done / elapsed if elapsed else 0))
+
+        totals = generator.generate(progress)
+        self.stdout.write("%(users)s beneficiaries and %(tokens)s access tokens created." % totals)
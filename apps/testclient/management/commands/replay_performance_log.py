@@ -0,0 +1,67 @@
+import io
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from oauth2_provider.models import AccessToken
+
+from apps.testclient.replay import LogReplay, parse_log
+
+
+class Command(BaseCommand):
+    help = ("Replay the API requests of performance logs against a running server, with their "
+            "original inter-arrival times, optionally compressed, and print the latency and "
+            "throughput of the original traffic and of the replay by endpoint as JSON. The "
+            "beneficiaries of the logs are mapped to the synthetic beneficiaries of "
+            "generate_synthetic_data, with their unexpired tokens. Point the server at the stub "
+            "FHIR backend of run_fhir_stub to replay without a backend.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('logs', nargs='+', help="Log files of the performance logger")
+        parser.add_argument('--base-url', default=None, help="Defaults to HOSTNAME_URL")
+        parser.add_argument('--speedup', type=float, default=1.0,
+                            help="Divide the time between the requests by this factor")
+        parser.add_argument('--concurrency', type=int, default=20, help="Requests in flight at most")
+        parser.add_argument('--prefix', default='synth', help="Username prefix of the synthetic beneficiaries")
+        parser.add_argument('--limit', type=int, default=None, help="Replay the first LIMIT requests only")
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--insecure', action='store_true', help="Skip the TLS certificate checks")
+        parser.add_argument('--output', default=None, help="Write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        if options['speedup'] <= 0:
+            raise CommandError("--speedup must be positive.")
+        records = []
+        for path in options['logs']:
+            with io.open(path, encoding='utf-8', errors='replace') as f:
+                records.extend(parse_log(f))
+        records.sort(key=lambda record: record.started)
+        records = records[:options['limit']]
+        if not records:
+            raise CommandError("No API requests found in the logs.")
+
+        # a token per synthetic beneficiary
+        identities = OrderedDict()
+        for token, fhir_id in AccessToken.objects.filter(
+                user__username__startswith=options['prefix'], expires__gt=timezone.now(),
+                user__crosswalk__isnull=False).order_by('user__username', 'pk').values_list(
+                'token', 'user__crosswalk__fhir_id'):
+            identities.setdefault(fhir_id, (token, fhir_id))
+        if not identities:
+            raise CommandError("No unexpired tokens of users named %s*, run generate_synthetic_data first."
+                               % options['prefix'])
+
+        base_url = options['base_url'] or settings.HOSTNAME_URL
+        if not base_url.startswith(('http://', 'https://')):
+            base_url = 'https://' + base_url
+
+        report = LogReplay(records, base_url, list(identities.values()), speedup=options['speedup'],
+                           concurrency=options['concurrency'], timeout=options['timeout'],
+                           verify=not options['insecure']).run()
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        self.stdout.write(output)
@@ -0,0 +1,67 @@
+import io
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.accounts.bulk_invitations import read_csv
+from apps.dot_ext.models import Application
+from apps.testclient.loadtest import LoadTest
+
+
+class Command(BaseCommand):
+    help = ("Run the OAuth authorization code flow and then the API calls of the test client "
+            "from concurrent threads against a running server, and print the throughput, "
+            "latency percentiles and error rates of each step as JSON. The users are read "
+            "from a CSV file with the username and password columns.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('users_csv', help="CSV file with the username and password columns")
+        parser.add_argument('--base-url', default=None, help="Defaults to HOSTNAME_URL")
+        parser.add_argument('--application', default='TestApp',
+                            help="Name of the application authorized, when --client-id is not given")
+        parser.add_argument('--client-id', default=None)
+        parser.add_argument('--client-secret', default=None)
+        parser.add_argument('--redirect-uri', default=None,
+                            help="Defaults to the first redirect URI of the application")
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--flows', type=int, default=100)
+        parser.add_argument('--duration', type=float, default=None,
+                            help="Run for this many seconds instead of --flows flows")
+        parser.add_argument('--eob-pages', type=int, default=1,
+                            help="ExplanationOfBenefit pages read per flow")
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--insecure', action='store_true', help="Skip the TLS certificate checks")
+        parser.add_argument('--output', default=None, help="Write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        with io.open(options['users_csv'], newline='', encoding='utf-8') as f:
+            users = [(row['username'], row['password']) for row in read_csv(f)
+                     if row.get('username') and row.get('password')]
+        if not users:
+            raise CommandError("The CSV file needs the username and password columns.")
+
+        client_id, client_secret = options['client_id'], options['client_secret']
+        redirect_uri = options['redirect_uri']
+        if not client_id:
+            application = Application.objects.filter(name=options['application']).first()
+            if application is None:
+                raise CommandError("No application named %s." % options['application'])
+            client_id, client_secret = application.client_id, application.client_secret
+            redirect_uri = redirect_uri or application.default_redirect_uri
+        if not redirect_uri:
+            raise CommandError("--redirect-uri is required with --client-id.")
+
+        base_url = options['base_url'] or settings.HOSTNAME_URL
+        if not base_url.startswith(('http://', 'https://')):
+            base_url = 'https://' + base_url
+
+        report = LoadTest(base_url, users, client_id, client_secret, redirect_uri,
+                          concurrency=options['concurrency'], flows=options['flows'],
+                          duration=options['duration'], eob_pages=options['eob_pages'],
+                          timeout=options['timeout'], verify=not options['insecure']).run()
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        self.stdout.write(output)
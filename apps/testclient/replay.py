@@ -0,0 +1,199 @@
+import ast
+import re
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+
+from .loadtest import Recorder
+
+# A line of hhs_oauth_server.request_logging.RequestTimeLoggingMiddleware:
+# "timestamp tag uuid count path +delta message", after the log prefix
+REQUEST_LOG = re.compile(
+    r'(?P<timestamp>\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(?:\.\d+)?) (?P<tag>\S+) +(?P<id>[0-9a-f-]{36}) +\d+ '
+    r'(?P<path>\S+) \+(?:(?P<days>-?\d+) days?, )?(?P<delta>\d+:\d\d:\d\d(?:\.\d+)?) ?(?P<message>.*)$')
+# The headers logged by apps.fhir.bluebutton.utils.request_call
+BACKEND_CALL = re.compile(r"(\{'BlueButton-.*\})\s*$")
+STATUS = re.compile(r'^(\d{3})\b')
+# The requests replayed, the other ones need a body or a session
+REPLAYED_PATHS = ('/v1/fhir/', '/v1/connect/userinfo')
+ENDPOINT = re.compile(r'^(/v1/fhir/[A-Za-z]+/)[^/]+/?$')
+
+LogRecord = namedtuple('LogRecord', 'id started path query status seconds beneficiary')
+
+
+def parse_timestamp(value):
+    return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%f' if '.' in value else '%Y-%m-%dT%H:%M:%S')
+
+
+def parse_delta(days, value):
+    hours, minutes, seconds = value.split(':')
+    return timedelta(days=int(days or 0), hours=int(hours), minutes=int(minutes),
+                     seconds=float(seconds)).total_seconds()
+
+
+def parse_log(lines, paths=REPLAYED_PATHS):
+    """
+    The requests to `paths` logged in the performance log `lines`, in
+    the order they started: their path, status and time taken from the
+    request and response lines of RequestTimeLoggingMiddleware, and the
+    query string and beneficiary of the FHIR requests from the headers
+    logged by request_call. The requests without a response are left
+    out.
+    """
+    started = OrderedDict()
+    responses = {}
+    backend_calls = {}
+    for line in lines:
+        match = REQUEST_LOG.search(line)
+        if match is not None:
+            tag, request_id = match.group('tag'), match.group('id')
+            if tag == 'request' and match.group('path').startswith(paths):
+                started[request_id] = (parse_timestamp(match.group('timestamp')), match.group('path'))
+            elif tag == 'response':
+                status = STATUS.match(match.group('message'))
+                responses[request_id] = (int(status.group(1)) if status else 0,
+                                         parse_delta(match.group('days'), match.group('delta')))
+            continue
+        match = BACKEND_CALL.search(line)
+        if match is not None:
+            try:
+                headers = ast.literal_eval(match.group(1))
+            except (SyntaxError, ValueError):
+                continue
+            backend_calls.setdefault(str(headers.get('BlueButton-OriginalQueryId')), headers)
+
+    records = []
+    for request_id, (timestamp, path) in started.items():
+        if request_id not in responses:
+            continue
+        status, seconds = responses[request_id]
+        headers = backend_calls.get(request_id, {})
+        records.append(LogRecord(request_id, timestamp, path, headers.get('BlueButton-OriginalQuery', ''),
+                                 status, seconds, headers.get('BlueButton-BeneficiaryId', '')))
+    records.sort(key=lambda record: record.started)
+    return records
+
+
+def endpoint(path):
+    """
+    The endpoint of `path`, with the id of a read as {id}.
+    """
+    return ENDPOINT.sub(r'\1{id}', path)
+
+
+class LogReplay(object):
+    """
+    Replay the `records` of parse_log against the server at `base_url`,
+    with their original inter-arrival times divided by `speedup`, from
+    at most `concurrency` requests in flight.
+
+    Each beneficiary of the log is mapped, in order of appearance, to
+    one of `identities`, a list of (access token, patient id) of
+    synthetic beneficiaries, and its patient id is replaced with theirs
+    in the paths and queries. The requests without a beneficiary, as
+    userinfo, are mapped by request.
+    """
+
+    def __init__(self, records, base_url, identities, speedup=1.0, concurrency=20, timeout=30, verify=True):
+        self.records = records
+        self.base_url = base_url.rstrip('/')
+        self.identities = identities
+        self.speedup = speedup
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.verify = verify
+        self.beneficiaries = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._max_lag = 0.0
+        self._mismatches = 0
+
+    def identity(self, record):
+        key = record.beneficiary or record.id
+        if key not in self.beneficiaries:
+            self.beneficiaries[key] = self.identities[len(self.beneficiaries) % len(self.identities)]
+        return self.beneficiaries[key]
+
+    def url(self, record):
+        token, patient_id = self.identity(record)
+        path, query = record.path, record.query
+        if record.beneficiary.startswith('patientId:'):
+            original = record.beneficiary.split(':', 1)[1]
+            path, query = path.replace(original, patient_id), query.replace(original, patient_id)
+        return '%s%s%s' % (self.base_url, path, '?' + query if query else ''), token
+
+    def session(self):
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def call(self, record, url, token, due, recorder):
+        start = time.perf_counter()
+        try:
+            response = self.session().get(url, headers={'Authorization': 'Bearer %s' % token},
+                                          timeout=self.timeout, verify=self.verify, allow_redirects=False)
+        except requests.exceptions.RequestException as e:
+            status = type(e).__name__
+        else:
+            status = response.status_code
+        seconds = time.perf_counter() - start
+        recorder.record(endpoint(record.path), seconds, status, isinstance(status, int) and status < 500)
+        with self._lock:
+            self._max_lag = max(self._max_lag, start - due)
+            self._mismatches += status != record.status
+
+    def run(self):
+        """
+        Replay the records and return the report of the original traffic
+        and of the replay, by endpoint.
+        """
+        if not self.records:
+            return {'requests': 0}
+        original = Recorder()
+        first = self.records[0].started
+        for record in self.records:
+            original.record(endpoint(record.path), record.seconds, record.status, record.status < 500)
+        last = self.records[-1]
+        original_elapsed = (last.started - first).total_seconds() + last.seconds
+
+        replayed = Recorder()
+        # the urls are rewritten upfront, out of the timed schedule
+        calls = [(record, (record.started - first).total_seconds() / self.speedup) + self.url(record)
+                 for record in self.records]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            futures = []
+            for record, offset, url, token in calls:
+                delay = start + offset - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                futures.append(pool.submit(self.call, record, url, token, start + offset, replayed))
+            for future in futures:
+                future.result()
+        elapsed = time.perf_counter() - start
+
+        return {
+            'base_url': self.base_url,
+            'speedup': self.speedup,
+            'concurrency': self.concurrency,
+            'requests': len(self.records),
+            'beneficiaries': len(self.beneficiaries),
+            'original': {
+                'started': first.strftime('%Y-%m-%dT%H:%M:%S'),
+                'elapsed_s': original_elapsed,
+                'requests_per_s': len(self.records) / original_elapsed if original_elapsed else 0,
+                'endpoints': original.report(original_elapsed),
+            },
+            'replay': {
+                'elapsed_s': elapsed,
+                'requests_per_s': len(self.records) / elapsed if elapsed else 0,
+                # how late the requests were sent, when all the threads were busy
+                'max_lag_ms': max(self._max_lag, 0) * 1000,
+                'status_mismatches': self._mismatches,
+                'endpoints': replayed.report(elapsed),
+            },
+        }
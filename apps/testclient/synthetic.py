@@ -0,0 +1,217 @@
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.db import connection, connections, transaction
+from django.utils import timezone
+from oauth2_provider.models import AccessToken
+
+from apps.accounts.hashing import hash_user_id
+from apps.accounts.lookups import normalize
+from apps.accounts.models import UserLookup, UserProfile
+from apps.capabilities.models import ProtectedCapability
+from apps.dot_ext.models import Application
+from apps.fhir.bluebutton.models import Crosswalk
+from apps.fhir.bluebutton.utils import get_resourcerouter
+from apps.fhir.server.stub import Distribution, StubFhirBackend, patient_id_for_hash
+
+FIRST_NAMES = ('Jane', 'John', 'Alex', 'Sam', 'Maria', 'Jose', 'Linda', 'James', 'Wei', 'Fatima')
+LAST_NAMES = ('Doe', 'Smith', 'Garcia', 'Nguyen', 'Johnson', 'Brown', 'Lee', 'Patel', 'Khan', 'Jones')
+# SQLite allows at most 999 variables per statement
+ID_LOOKUP_CHUNK = 500
+
+
+class SyntheticData(object):
+    """
+    Generate `count` beneficiaries named `prefix` followed by their
+    index, from `start` on, with their UserProfile, Crosswalk and
+    AccessTokens, plus `applications` applications of a developer.
+
+    Everything derives from `seed` and the index of the beneficiary, so
+    that a run is reproducible and can be extended with a later `start`.
+    Each beneficiary gets the tokens drawn from `tokens_per_user`, an
+    `expired_rate` fraction of them expired. The users share `password`,
+    hashed once. The crosswalks get the fhir_id the stub FHIR backend
+    gives to their hash.
+
+    The rows are bulk inserted by batches of `batch_size`, a transaction
+    per batch. The batches are hashed and inserted by `processes`
+    processes, one on SQLite, which does not take concurrent writes.
+
+    When `documents_dir` is set, the Patient, Coverage and
+    ExplanationOfBenefit documents that the stub backend would serve,
+    with claims drawn from `eob_count` and `eob_bytes`, are written there
+    as NDJSON files.
+    """
+
+    def __init__(self, count, start=0, prefix='synth', seed=0, password='synthetic-password',
+                 applications=10, tokens_per_user='fixed:1', expired_rate=0.25,
+                 batch_size=10000, processes=None, documents_dir=None,
+                 eob_count='lognormal:3:1', eob_bytes='0'):
+        self.count = count
+        self.start = start
+        self.prefix = prefix
+        self.seed = seed
+        self.password = password
+        self.applications = applications
+        self.tokens_per_user = Distribution(tokens_per_user)
+        self.expired_rate = expired_rate
+        self.batch_size = batch_size
+        self.processes = processes or os.cpu_count()
+        self.documents_dir = documents_dir
+        # checked here, the backend is made where the documents are written
+        self.eob_count = Distribution(eob_count).spec
+        self.eob_bytes = Distribution(eob_bytes).spec
+
+    def username(self, index):
+        return '%s%08d' % (self.prefix, index)
+
+    def user_id(self, index):
+        # the raw beneficiary id, hashed into the crosswalk
+        return '%s%d%09d' % (self.prefix, self.seed, index)
+
+    def generate(self, progress=None):
+        """
+        Insert the rows, calling `progress(done, elapsed)` after each
+        batch, and return the number of users and tokens inserted.
+        """
+        start = time.time()
+        self.group, _ = Group.objects.get_or_create(name='BlueButton')
+        self.resource_router = get_resourcerouter()
+        self.password_hash = make_password(self.password)
+        self.now = timezone.now()
+        self.apps = self.create_applications()
+
+        end = self.start + self.count
+        batches = [(batch_start, min(batch_start + self.batch_size, end))
+                   for batch_start in range(self.start, end, self.batch_size)]
+        totals = {'users': 0, 'tokens': 0}
+        files = self.open_documents()
+        try:
+            for users, tokens, hashes in self._run(batches):
+                totals['users'] += users
+                totals['tokens'] += tokens
+                if files:
+                    self.write_documents(files, hashes)
+                if progress:
+                    progress(totals['users'], time.time() - start)
+        finally:
+            for f in files.values():
+                f.close()
+        return totals
+
+    def _run(self, batches):
+        processes = 1 if connection.vendor == 'sqlite' else self.processes
+        if processes < 2 or len(batches) < 2:
+            for batch in batches:
+                yield self.insert_range(*batch)
+            return
+        # the forked processes open their own connections
+        connections.close_all()
+        with ProcessPoolExecutor(processes) as pool:
+            for future in as_completed([pool.submit(self.insert_range, *batch) for batch in batches]):
+                yield future.result()
+
+    def insert_range(self, batch_start, batch_end):
+        """
+        Hash and insert the beneficiaries from `batch_start` to
+        `batch_end`, in a transaction. Returns the numbers of users and
+        tokens inserted, and the crosswalk hashes.
+        """
+        indexes = range(batch_start, batch_end)
+        hashes = [hash_user_id(self.user_id(index)) for index in indexes]
+        with transaction.atomic():
+            tokens = self.insert_batch(indexes, hashes)
+        return len(indexes), tokens, hashes
+
+    def create_applications(self):
+        developer, created = User.objects.get_or_create(username='%s-developer' % self.prefix)
+        if created:
+            developer.set_password(self.password)
+            developer.save()
+            UserProfile.objects.create(user=developer, user_type='DEV', create_applications=True)
+        capabilities = list(ProtectedCapability.objects.all())
+        apps = []
+        for i in range(self.applications):
+            name = '%s application %s' % (self.prefix, i)
+            application = Application.objects.filter(name=name).first()
+            if application is None:
+                application = Application.objects.create(
+                    name=name, user=developer, client_type=Application.CLIENT_CONFIDENTIAL,
+                    authorization_grant_type=Application.GRANT_AUTHORIZATION_CODE,
+                    redirect_uris='http://localhost:8000/testclient/callback')
+                application.scope.add(*capabilities)
+            apps.append(application)
+        self.scope = ' '.join(capability.slug for capability in capabilities)
+        return apps
+
+    def insert_batch(self, indexes, hashes):
+        rngs = [random.Random('%s:%s' % (self.seed, index)) for index in indexes]
+        users = []
+        for index, rng in zip(indexes, rngs):
+            username = self.username(index)
+            users.append(User(username=username, password=self.password_hash,
+                              first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES),
+                              email='%s@example.com' % username))
+        User.objects.bulk_create(users)
+        user_pks = self.user_pks(users)
+
+        UserLookup.objects.bulk_create([
+            UserLookup(user_id=pk, username_lower=normalize(user.username), email_lower=normalize(user.email))
+            for user, pk in zip(users, user_pks)])
+        UserProfile.objects.bulk_create([
+            UserProfile(user_id=pk, user_type='BEN', access_key_id='%020X' % rng.getrandbits(80),
+                        access_key_secret='%040x' % rng.getrandbits(160))
+            for pk, rng in zip(user_pks, rngs)])
+        User.groups.through.objects.bulk_create([
+            User.groups.through(user_id=pk, group_id=self.group.pk) for pk in user_pks])
+        Crosswalk.objects.bulk_create([
+            Crosswalk(user_id=pk, fhir_source=self.resource_router, user_id_hash=user_id_hash,
+                      fhir_id=patient_id_for_hash(user_id_hash))
+            for pk, user_id_hash in zip(user_pks, hashes)])
+
+        tokens = []
+        if self.apps:
+            for pk, rng in zip(user_pks, rngs):
+                for i in range(self.tokens_per_user.sample_int(rng)):
+                    expired = rng.random() < self.expired_rate
+                    tokens.append(AccessToken(
+                        user_id=pk, application=rng.choice(self.apps), scope=self.scope,
+                        token='%032x' % rng.getrandbits(128),
+                        expires=self.now + timedelta(days=-1 if expired else 30)))
+        AccessToken.objects.bulk_create(tokens)
+        return len(tokens)
+
+    def user_pks(self, users):
+        if all(user.pk for user in users):
+            return [user.pk for user in users]
+        # the database does not return the ids of bulk inserts
+        usernames = [user.username for user in users]
+        pks = {}
+        for i in range(0, len(usernames), ID_LOOKUP_CHUNK):
+            pks.update(User.objects.filter(
+                username__in=usernames[i:i + ID_LOOKUP_CHUNK]).values_list('username', 'pk'))
+        return [pks[username] for username in usernames]
+
+    def open_documents(self):
+        if not self.documents_dir:
+            return {}
+        os.makedirs(self.documents_dir, exist_ok=True)
+        mode = 'a' if self.start else 'w'
+        return dict((resource_type, open(os.path.join(self.documents_dir, '%s.ndjson' % resource_type), mode))
+                    for resource_type in ('Patient', 'Coverage', 'ExplanationOfBenefit'))
+
+    def write_documents(self, files, hashes):
+        backend = StubFhirBackend(eob_count=self.eob_count, eob_bytes=self.eob_bytes, seed=self.seed)
+        for user_id_hash in hashes:
+            patient_id = patient_id_for_hash(user_id_hash)
+            files['Patient'].write(json.dumps(backend.patient(patient_id)) + '\n')
+            for coverage in backend.coverages(patient_id):
+                files['Coverage'].write(json.dumps(coverage) + '\n')
+            for eob in backend.eobs(patient_id):
+                files['ExplanationOfBenefit'].write(json.dumps(eob) + '\n')
@@ -1,9 +1,29 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import skipIf, skipUnless
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
 from django.core.management import call_command
 from django.test.client import Client
-from django.test import TestCase
+from django.test import LiveServerTestCase, TestCase
+from django.utils import timezone
+from oauth2_provider.models import AccessToken
+from apps.accounts.lookups import users_by_username
+from apps.dot_ext.models import Application
+from apps.fhir.bluebutton.models import Crosswalk
+from apps.fhir.server.models import ResourceRouter
+from apps.fhir.server.stub import StubFhirBackend, make_server, patient_id_for_hash
+from .loadtest import LoadTest, percentile
+from .replay import endpoint, parse_log
+from .synthetic import SyntheticData
 from .utils import test_setup
 from django.core.urlresolvers import reverse
-from unittest import skipIf
 from django.conf import settings
 
 
@@ -206,3 +226,165 @@ class BlueButtonClientApiOidcDiscoveryTest(TestCase):
         response = self.client.get(reverse('openid-configuration'))
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, "userinfo_endpoint")
+
+
+class LoadTestDriverTest(LiveServerTestCase):
+    """
+    Drive the authorization flow and the API calls against a live
+    server reading from the stub FHIR backend.
+    """
+
+    fixtures = ['testfixture']
+
+    def setUp(self):
+        call_command('create_blue_button_scopes')
+        call_command('create_test_user_and_application')
+        self.stub = make_server(StubFhirBackend(eob_count='fixed:30'), port=0)
+        thread = threading.Thread(target=self.stub.serve_forever)
+        thread.daemon = True
+        thread.start()
+        ResourceRouter.objects.update(fhir_url='http://127.0.0.1:%s/baseDstu3/' % self.stub.server_address[1],
+                                      client_auth=False, cert_file=None, key_file=None)
+
+    def tearDown(self):
+        self.stub.shutdown()
+        self.stub.server_close()
+
+    @patch.dict(os.environ, {'OAUTHLIB_INSECURE_TRANSPORT': '1'})
+    def test_load_test_report(self):
+        application = Application.objects.get(name='TestApp')
+        report = LoadTest(self.live_server_url, [('fred', 'foobarfoobarfoobar')],
+                          application.client_id, application.client_secret,
+                          application.default_redirect_uri, concurrency=2, flows=4, eob_pages=3).run()
+        self.assertEqual((report['flows'], report['failed_flows']), (4, 0))
+        steps = report['steps']
+        for step in ('login', 'token', 'userinfo', 'patient', 'coverage', 'eob'):
+            self.assertEqual(steps[step]['count'], 4)
+            self.assertEqual(steps[step]['errors'], 0)
+            self.assertLessEqual(steps[step]['p50_ms'], steps[step]['p99_ms'])
+        self.assertEqual(steps['eob_page']['count'], 8)
+
+
+class LogReplayTest(LiveServerTestCase):
+    """
+    Replay the performance log of API requests against a live server
+    reading from the stub FHIR backend.
+    """
+
+    fixtures = ['testfixture']
+
+    def setUp(self):
+        call_command('create_blue_button_scopes')
+        self.stub = make_server(StubFhirBackend(eob_count='fixed:30'), port=0)
+        thread = threading.Thread(target=self.stub.serve_forever)
+        thread.daemon = True
+        thread.start()
+        ResourceRouter.objects.update(fhir_url='http://127.0.0.1:%s/baseDstu3/' % self.stub.server_address[1],
+                                      client_auth=False, cert_file=None, key_file=None)
+        SyntheticData(3, applications=1, expired_rate=0, processes=1).generate()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def tearDown(self):
+        self.stub.shutdown()
+        self.stub.server_close()
+
+    def record_traffic(self):
+        with self.assertLogs('performance', 'INFO') as logs:
+            for token, patient_id in AccessToken.objects.values_list('token', 'user__crosswalk__fhir_id'):
+                auth = {'HTTP_AUTHORIZATION': 'Bearer %s' % token}
+                self.client.get('/v1/connect/userinfo', **auth)
+                self.client.get('/v1/fhir/Patient/%s' % patient_id, **auth)
+                self.client.get('/v1/fhir/ExplanationOfBenefit/', {'patient': patient_id, 'count': 5}, **auth)
+                self.client.get('/v1/o/authorize/')
+        return logs.output
+
+    def test_replay(self):
+        lines = self.record_traffic()
+        records = parse_log(lines)
+        self.assertEqual(len(records), 9)
+        self.assertEqual([record.status for record in records], [200] * 9)
+        search = records[2]
+        self.assertEqual(endpoint(search.path), '/v1/fhir/ExplanationOfBenefit/')
+        self.assertIn('count=5', search.query)
+        self.assertTrue(search.beneficiary.startswith('patientId:'))
+        self.assertEqual(endpoint(records[1].path), '/v1/fhir/Patient/{id}')
+
+        path = os.path.join(self.directory, 'performance.log')
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines))
+        out = io.StringIO()
+        call_command('replay_performance_log', path, base_url=self.live_server_url, speedup=10, stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['requests'], 9)
+        self.assertEqual(report['replay']['status_mismatches'], 0)
+        for name in ('/v1/connect/userinfo', '/v1/fhir/Patient/{id}', '/v1/fhir/ExplanationOfBenefit/'):
+            self.assertEqual(report['replay']['endpoints'][name]['statuses'], {'200': 3})
+            self.assertEqual(report['original']['endpoints'][name]['count'], 3)
+
+
+class PercentileTest(TestCase):
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual([percentile(values, pct) for pct in (50, 90, 99, 100)], [50, 90, 99, 100])
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertIsNone(percentile([], 50))
+
+
+class SyntheticDataTest(TestCase):
+
+    fixtures = ['testfixture']
+
+    def setUp(self):
+        call_command('create_blue_button_scopes')
+        self.documents = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.documents)
+
+    def generate(self, **kwargs):
+        options = dict(seed=3, applications=2, tokens_per_user='fixed:2', batch_size=10,
+                       processes=1, documents_dir=self.documents, eob_count='fixed:3')
+        options.update(kwargs)
+        return SyntheticData(25, **options).generate()
+
+    def test_generate(self):
+        self.assertEqual(self.generate(), {'users': 25, 'tokens': 50})
+        self.assertEqual(Crosswalk.objects.count(), 25)
+        for crosswalk in Crosswalk.objects.all():
+            self.assertEqual(crosswalk.fhir_id, patient_id_for_hash(crosswalk.user_id_hash))
+        self.assertEqual(users_by_username('SYNTH00000007').get().userprofile.user_type, 'BEN')
+        self.assertTrue(self.client.login(username='synth00000007', password='synthetic-password'))
+        self.assertTrue(AccessToken.objects.filter(expires__lt=timezone.now()).exists())
+
+        lines = {}
+        for resource_type in ('Patient', 'Coverage', 'ExplanationOfBenefit'):
+            with open(os.path.join(self.documents, '%s.ndjson' % resource_type)) as f:
+                lines[resource_type] = [json.loads(line) for line in f]
+        self.assertEqual([len(lines[t]) for t in ('Patient', 'Coverage', 'ExplanationOfBenefit')], [25, 75, 75])
+        self.assertEqual(set(patient['id'] for patient in lines['Patient']),
+                         set(Crosswalk.objects.values_list('fhir_id', flat=True)))
+
+    def test_generate_is_reproducible(self):
+        self.generate()
+        tokens = set(AccessToken.objects.values_list('token', flat=True))
+        fhir_ids = set(Crosswalk.objects.values_list('fhir_id', flat=True))
+        User.objects.filter(username__startswith='synth0').delete()
+        self.generate()
+        self.assertEqual(set(AccessToken.objects.values_list('token', flat=True)), tokens)
+        self.assertEqual(set(Crosswalk.objects.values_list('fhir_id', flat=True)), fhir_ids)
+
+
+@skipUnless(os.environ.get('RUN_BENCHMARKS'), "Set RUN_BENCHMARKS=1 to run the benchmarks.")
+class SyntheticDataBenchmark(TestCase):
+
+    fixtures = ['testfixture']
+
+    def test_benchmark_generate(self):
+        call_command('create_blue_button_scopes')
+        count = 20000
+        start = time.perf_counter()
+        totals = SyntheticData(count, tokens_per_user='uniform:0:4').generate()
+        elapsed = time.perf_counter() - start
+        self.assertEqual(totals['users'], count)
+        print("\n%s beneficiaries, %s tokens: %.1f s, %.0f beneficiaries/s" % (
+            count, totals['tokens'], elapsed, count / elapsed))
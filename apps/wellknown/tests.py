@@ -30,3 +30,9 @@ class OpenIDConnectConfigurationTestCase(TestCase):
         if six.PY3:
             response_content = str(response_content, encoding='utf8')
         self.assertEqual(type(json.loads(response_content)), type({}))
+
+    def test_conditional_get(self):
+        response = self.client.get(self.url)
+        self.assertIn('max-age', response['Cache-Control'])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
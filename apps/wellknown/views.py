@@ -1,21 +1,53 @@
+import hashlib
+import json
 import logging
-from django.http import JsonResponse
-from django.views.decorators.http import require_GET
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_GET
 from collections import OrderedDict
 from django.conf import settings
 from django.core.urlresolvers import reverse
 logger = logging.getLogger('hhs_server.%s' % __name__)
 
+# issuer -> (encoded discovery document, etag)
+_discovery_documents = {}
+
+
+def discovery_document(issuer):
+    """
+    Return the discovery document for `issuer` as JSON encoded bytes
+    along with its ETag. Documents are built once per issuer.
+    """
+    document = _discovery_documents.get(issuer)
+    if document is None:
+        body = json.dumps(build_endpoint_info(issuer=issuer)).encode('utf-8')
+        document = (body, '"%s"' % hashlib.md5(body).hexdigest())
+        _discovery_documents[issuer] = document
+    return document
+
+
+@receiver(setting_changed)
+def clear_discovery_documents(**kwargs):
+    _discovery_documents.clear()
+
+
+def discovery_etag(request):
+    return discovery_document(base_issuer(request))[1]
+
 
 @require_GET
+@condition(etag_func=discovery_etag)
 def openid_configuration(request):
     """
     Views that returns openid_configuration.
     """
-    data = OrderedDict()
-    issuer = base_issuer(request)
-    data = build_endpoint_info(data, issuer=issuer)
-    return JsonResponse(data)
+    body, etag = discovery_document(base_issuer(request))
+    response = HttpResponse(body, content_type='application/json')
+    patch_cache_control(response, public=True,
+                        max_age=getattr(settings, 'OPENID_CONFIGURATION_MAX_AGE', 86400))
+    return response
 
 
 def base_issuer(request):
@@ -45,7 +77,7 @@ def base_issuer(request):
     return issuer
 
 
-def build_endpoint_info(data=OrderedDict(), issuer=""):
+def build_endpoint_info(data=None, issuer=""):
     """
     construct the data package
     issuer should be http: or https:// prefixed url.
@@ -53,6 +85,8 @@ def build_endpoint_info(data=OrderedDict(), issuer=""):
     :param data:
     :return:
     """
+    if data is None:
+        data = OrderedDict()
     data["issuer"] = issuer
     data["authorization_endpoint"] = issuer + \
         reverse('oauth2_provider:authorize')
@@ -0,0 +1,215 @@
+import logging
+import os
+import random
+import resource
+import threading
+import tracemalloc
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+
+from .query_budget import view_attribute
+from .request_logging import RequestTimeLoggingMiddleware
+
+logger = logging.getLogger('performance.%s' % __name__)
+
+# Upper bounds of the response size buckets in bytes, and their names
+SIZE_BUCKETS = ((10 * 1024, '<10KB'), (100 * 1024, '10KB-100KB'), (1024 * 1024, '100KB-1MB'))
+LARGEST_BUCKET = '>=1MB'
+# the allocation sites kept per view and size bucket
+TOP_SITES = 10
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+IGNORED_SITES = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+class MemoryBudgetExceeded(AssertionError):
+    pass
+
+
+def rss():
+    """
+    The resident set size of the process in bytes, from /proc where
+    there is one, else its peak from getrusage.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (IOError, OSError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def size_bucket(response):
+    if response.streaming:
+        return 'streaming'
+    size = len(response.content)
+    for bound, name in SIZE_BUCKETS:
+        if size < bound:
+            return name
+    return LARGEST_BUCKET
+
+
+class MemoryTracker(object):
+    """
+    Context manager measuring the peak Python allocation of a block with
+    tracemalloc, the memory it still holds on exit and where it was
+    allocated, and the growth of the resident set size of the process.
+
+        with MemoryTracker() as memory:
+            ...
+        assert memory.peak < 10 * 1024 * 1024
+
+    tracemalloc traces the whole process: allocations of other threads
+    running meanwhile are counted too. When it is already tracing, as
+    with PYTHONTRACEMALLOC, the peak cannot be reset and is the one of
+    the process since tracing started.
+    """
+
+    def __init__(self, top=TOP_SITES):
+        self.top = top
+        self.peak = 0
+        self.retained = 0
+        self.rss_growth = 0
+        self.top_sites = []
+
+    def __enter__(self):
+        self.rss_before = rss()
+        self._started = not tracemalloc.is_tracing()
+        if self._started:
+            tracemalloc.start()
+        self._before = tracemalloc.get_traced_memory()[0]
+        return self
+
+    def __exit__(self, type, value, traceback):
+        current, peak = tracemalloc.get_traced_memory()
+        self.peak = max(peak - self._before, 0)
+        self.retained = current - self._before
+        if self.top:
+            statistics = tracemalloc.take_snapshot().filter_traces(IGNORED_SITES).statistics('lineno')
+            self.top_sites = [(str(stat.traceback[0]), stat.size) for stat in statistics[:self.top]]
+        if self._started:
+            tracemalloc.stop()
+        self.rss_growth = rss() - self.rss_before
+
+
+class MemoryReport(object):
+    """
+    The memory of the sampled requests of the process, by view and
+    response size bucket: their number, peak allocation, RSS growth, and
+    the sites still holding the most memory when they end.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.rows = {}
+
+    def add(self, key, tracker):
+        with self._lock:
+            row = self.rows.get(key)
+            if row is None:
+                row = self.rows[key] = {'requests': 0, 'peak_total': 0, 'peak_max': 0,
+                                        'rss_growth_total': 0, 'rss_growth_max': 0, 'sites': Counter()}
+            row['requests'] += 1
+            row['peak_total'] += tracker.peak
+            row['peak_max'] = max(row['peak_max'], tracker.peak)
+            row['rss_growth_total'] += tracker.rss_growth
+            row['rss_growth_max'] = max(row['rss_growth_max'], tracker.rss_growth)
+            row['sites'].update(dict(tracker.top_sites))
+
+    def summary(self):
+        """
+        The rows with the largest peaks first.
+        """
+        with self._lock:
+            rows = [{
+                'view': view,
+                'response_size': bucket,
+                'requests': row['requests'],
+                'peak_mean': row['peak_total'] // row['requests'],
+                'peak_max': row['peak_max'],
+                'rss_growth_total': row['rss_growth_total'],
+                'rss_growth_max': row['rss_growth_max'],
+                'top_sites': row['sites'].most_common(TOP_SITES),
+            } for (view, bucket), row in self.rows.items()]
+        return sorted(rows, key=lambda row: row['peak_max'], reverse=True)
+
+    def clear(self):
+        with self._lock:
+            self.rows = {}
+
+
+report = MemoryReport()
+# tracemalloc is global to the process: one sampled request at a time
+_tracing = threading.Lock()
+
+
+def should_sample():
+    rate = getattr(settings, 'MEMORY_SAMPLE_RATE', 0)
+    return bool(rate) and random.randrange(rate) == 0
+
+
+class MemoryMiddleware(object):
+    """
+    Opt-in memory accounting of one request in MEMORY_SAMPLE_RATE, one
+    at a time: its peak Python allocation under tracemalloc, which slows
+    it down, and the growth of the RSS of the worker, in the performance
+    log and in the report of the staff-only memory_report view, by view
+    and response size bucket.
+
+    Views can declare the peak they are allowed with a `memory_budget`
+    attribute in bytes. A sampled request going over the budget of its
+    view is logged as a warning with its top allocation sites, and
+    raises MemoryBudgetExceeded when MEMORY_BUDGET_ENFORCE is set, as in
+    the tests.
+    """
+
+    def process_request(self, request):
+        if should_sample() and _tracing.acquire(blocking=False):
+            try:
+                request.memory_tracker = MemoryTracker().__enter__()
+            except Exception:
+                _tracing.release()
+                raise
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.memory_budget = view_attribute(view_func, 'memory_budget')
+
+    def process_response(self, request, response):
+        tracker = getattr(request, 'memory_tracker', None)
+        if tracker is None:
+            return response
+        try:
+            tracker.__exit__(None, None, None)
+        finally:
+            del request.memory_tracker
+            _tracing.release()
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        report.add((view, size_bucket(response)), tracker)
+        budget = getattr(request, 'memory_budget', None)
+
+        RequestTimeLoggingMiddleware.log_message(
+            request, 'memory', 'peak %s bytes rss growth %s bytes budget %s' % (
+                tracker.peak, tracker.rss_growth, budget))
+
+        if budget is not None and tracker.peak > budget:
+            message = '%s %s allocated a peak of %s bytes, over its budget of %s' % (
+                request.method, request.path, tracker.peak, budget)
+            logger.warning('%s, top allocation sites:\n%s' % (message, '\n'.join(
+                '%s: %s bytes' % site for site in tracker.top_sites)))
+            if getattr(settings, 'MEMORY_BUDGET_ENFORCE', False):
+                raise MemoryBudgetExceeded(message)
+        return response
+
+
+@staff_member_required
+def memory_report(request):
+    """
+    The memory of the requests sampled by this process.
+    """
+    return JsonResponse({'pid': os.getpid(), 'rss': rss(), 'views': report.summary()})
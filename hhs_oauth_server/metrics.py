@@ -0,0 +1,192 @@
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+# Upper bounds of the histogram buckets in seconds, log-linear as in
+# HDR histograms: ten buckets per power of ten, from 10us to 100s.
+MANTISSAS = (1, 1.25, 1.5, 2, 2.5, 3, 4, 5, 6, 8)
+BOUNDS = tuple(float('%se%s' % (m, e)) for e in range(-5, 2) for m in MANTISSAS) + (100.0,)
+# a value per bucket, the +Inf bucket and the sum
+SLOTS = len(BOUNDS) + 2
+LABELS = ('endpoint', 'resource_type', 'application', 'phase')
+INITIAL_SIZE = 1 << 20
+METRIC = 'bluebutton_request_phase_seconds'
+
+
+def _padded(size):
+    return (size + 7) // 8 * 8
+
+
+class HistogramStore(object):
+    """
+    Latency histograms of a process, by label values, in a buffer of
+    doubles that other processes can read: a memory mapped file at
+    `path`, or memory when it is None.
+
+    The buffer starts with the number of bytes used. Each histogram then
+    takes the length of its JSON encoded key, the key padded to 8 bytes,
+    and `SLOTS` doubles. Only the owning process writes to it, so the
+    readers need no lock and at worst see a histogram being updated.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._index = {}
+        if path is None:
+            self._file = None
+            self._buffer = bytearray(INITIAL_SIZE)
+            self._used = 8
+        else:
+            self._file = open(path, 'a+b')
+            size = max(os.fstat(self._file.fileno()).st_size, INITIAL_SIZE)
+            self._file.truncate(size)
+            self._buffer = mmap.mmap(self._file.fileno(), size)
+            self._used = struct.unpack_from('Q', self._buffer, 0)[0] or 8
+            for key, offset in _entries(self._buffer):
+                self._index[key] = offset
+
+    def observe(self, key, seconds):
+        """
+        Add `seconds` to the histogram of `key`, a tuple of label values.
+        """
+        slot = bisect_left(BOUNDS, seconds)
+        with self._lock:
+            offset = self._index.get(key)
+            if offset is None:
+                offset = self._add(key)
+            position = offset + slot * 8
+            struct.pack_into('d', self._buffer, position, struct.unpack_from('d', self._buffer, position)[0] + 1)
+            position = offset + (SLOTS - 1) * 8
+            struct.pack_into('d', self._buffer, position,
+                             struct.unpack_from('d', self._buffer, position)[0] + seconds)
+
+    def _add(self, key):
+        encoded = json.dumps(key).encode('utf-8')
+        size = 8 + _padded(len(encoded)) + SLOTS * 8
+        while self._used + size > len(self._buffer):
+            self._grow()
+        struct.pack_into('I', self._buffer, self._used, len(encoded))
+        self._buffer[self._used + 8:self._used + 8 + len(encoded)] = encoded
+        offset = self._used + 8 + _padded(len(encoded))
+        self._used += size
+        # published last, readers only go up to it
+        struct.pack_into('Q', self._buffer, 0, self._used)
+        self._index[key] = offset
+        return offset
+
+    def _grow(self):
+        size = len(self._buffer) * 2
+        if self._file is None:
+            self._buffer.extend(bytes(size - len(self._buffer)))
+        else:
+            self._buffer.close()
+            self._file.truncate(size)
+            self._buffer = mmap.mmap(self._file.fileno(), size)
+
+    def histograms(self):
+        return dict((key, struct.unpack_from('%sd' % SLOTS, self._buffer, offset))
+                    for key, offset in _entries(self._buffer))
+
+
+def _entries(buffer):
+    used = struct.unpack_from('Q', buffer, 0)[0]
+    position = 8
+    while position < used:
+        length = struct.unpack_from('I', buffer, position)[0]
+        key = tuple(json.loads(bytes(buffer[position + 8:position + 8 + length]).decode('utf-8')))
+        offset = position + 8 + _padded(length)
+        yield key, offset
+        position = offset + SLOTS * 8
+
+
+_store = {}
+_store_lock = threading.Lock()
+
+
+def store():
+    """
+    The HistogramStore of this process, in METRICS_DIR when it is set,
+    so that the metrics endpoint of any worker reports all of them.
+    """
+    key = (os.getpid(), getattr(settings, 'METRICS_DIR', ''))
+    if _store.get('key') != key:
+        with _store_lock:
+            if _store.get('key') != key:
+                pid, directory = key
+                path = os.path.join(directory, 'histograms_%s.db' % pid) if directory else None
+                _store['store'] = HistogramStore(path)
+                _store['key'] = key
+    return _store['store']
+
+
+def observe(labels, phases):
+    """
+    Record the `phases`, a mapping of phase names to seconds, of a
+    request with the `labels` endpoint, resource type and application.
+    """
+    histograms = store()
+    for phase, seconds in phases.items():
+        histograms.observe(tuple(labels) + (phase,), seconds)
+
+
+def collect():
+    """
+    The histograms of all the processes, summed by key.
+    """
+    directory = getattr(settings, 'METRICS_DIR', '')
+    if not directory:
+        return store().histograms()
+    totals = {}
+    for path in glob.glob(os.path.join(directory, 'histograms_*.db')):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < 8:
+            continue
+        for key, offset in _entries(data):
+            values = struct.unpack_from('%sd' % SLOTS, data, offset)
+            if key in totals:
+                values = tuple(a + b for a, b in zip(totals[key], values))
+            totals[key] = values
+    return totals
+
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text(histograms):
+    lines = [
+        '# HELP %s Time spent in each phase of the requests.' % METRIC,
+        '# TYPE %s histogram' % METRIC,
+    ]
+    for key in sorted(histograms):
+        values = histograms[key]
+        labels = ','.join('%s="%s"' % (name, _label_value(value)) for name, value in zip(LABELS, key))
+        count = 0
+        for bound, value in zip(BOUNDS + ('+Inf',), values):
+            count += value
+            lines.append('%s_bucket{%s,le="%s"} %d' % (METRIC, labels, bound, count))
+        lines.append('%s_sum{%s} %r' % (METRIC, labels, values[-1]))
+        lines.append('%s_count{%s} %d' % (METRIC, labels, count))
+    return '\n'.join(lines) + '\n'
+
+
+def metrics(request):
+    """
+    The request phase histograms in the Prometheus text format, for
+    the addresses of METRICS_ALLOWED_IPS and for staff users.
+    """
+    user = getattr(request, 'user', None)
+    if (request.META.get('REMOTE_ADDR') not in getattr(settings, 'METRICS_ALLOWED_IPS', ()) and
+            not (user is not None and user.is_staff)):
+        return HttpResponseForbidden()
+    return HttpResponse(prometheus_text(collect()),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,189 @@
+import cProfile
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core import signing
+from django.http import JsonResponse
+
+logger = logging.getLogger('performance.%s' % __name__)
+
+PROFILE_HEADER = 'HTTP_X_BLUEBUTTON_PROFILE'
+TOKEN_SALT = 'hhs_oauth_server.profiling'
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def profile_dir():
+    return getattr(settings, 'PROFILE_DIR', '')
+
+
+def frame_label(code):
+    filename = code.co_filename
+    if 'site-packages' in filename:
+        filename = filename.rpartition('site-packages' + os.sep)[2]
+    elif filename.startswith(PROJECT_DIR):
+        filename = os.path.relpath(filename, PROJECT_DIR)
+    return '%s (%s)' % (code.co_name, filename)
+
+
+def collapsed_stack(frame):
+    """
+    The stack of `frame` in the collapsed format of flamegraph.pl: the
+    frames from the root down, separated by semicolons.
+    """
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame.f_code).replace(';', ':'))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class SamplingProfiler(threading.Thread):
+    """
+    Sample the stacks of the other threads of the process every
+    `interval` seconds, and write the number of samples of each stack to
+    `path` every `flush_interval` seconds, in the collapsed format that
+    flamegraph.pl reads.
+    """
+
+    def __init__(self, path, interval=0.05, flush_interval=60):
+        super(SamplingProfiler, self).__init__(name='sampling-profiler')
+        self.daemon = True
+        self.path = path
+        self.interval = interval
+        self.flush_interval = flush_interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def sample(self):
+        own = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id != own:
+                self.stacks[collapsed_stack(frame)] += 1
+
+    def flush(self):
+        temporary = '%s.tmp' % self.path
+        with open(temporary, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write('%s %d\n' % (stack, count))
+        os.replace(temporary, self.path)
+
+    def run(self):
+        flushed = time.time()
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+            if time.time() - flushed >= self.flush_interval:
+                self.flush()
+                flushed = time.time()
+        self.flush()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+_sampler = {}
+_sampler_lock = threading.Lock()
+
+
+def start_sampler():
+    """
+    Start the sampling profiler of this process, once, when PROFILE_DIR
+    and SAMPLING_PROFILER_INTERVAL are set. Called on each request, as
+    the threads of a preforking server's master do not survive the fork.
+    """
+    interval = getattr(settings, 'SAMPLING_PROFILER_INTERVAL', 0)
+    if not interval or not profile_dir() or _sampler.get('pid') == os.getpid():
+        return
+    with _sampler_lock:
+        if _sampler.get('pid') != os.getpid():
+            sampler = SamplingProfiler(os.path.join(profile_dir(), 'stacks_%s.txt' % os.getpid()), interval,
+                                       getattr(settings, 'SAMPLING_PROFILER_FLUSH_INTERVAL', 60))
+            sampler.start()
+            _sampler.update(pid=os.getpid(), sampler=sampler)
+
+
+def profile_token(user):
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(str(user.pk))
+
+
+def valid_profile_token(token):
+    try:
+        signing.TimestampSigner(salt=TOKEN_SALT).unsign(
+            token, max_age=getattr(settings, 'PROFILE_TOKEN_MAX_AGE', 3600))
+    except signing.BadSignature:
+        return False
+    return True
+
+
+@staff_member_required
+def profile_token_view(request):
+    """
+    A token for staff to profile their requests, to be sent in the
+    X-BlueButton-Profile header.
+    """
+    return JsonResponse({'header': 'X-BlueButton-Profile', 'token': profile_token(request.user),
+                         'max_age': getattr(settings, 'PROFILE_TOKEN_MAX_AGE', 3600)})
+
+
+def should_profile(request):
+    if not profile_dir():
+        return False
+    token = request.META.get(PROFILE_HEADER)
+    if token:
+        return valid_profile_token(token)
+    rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0)
+    return bool(rate) and random.randrange(rate) == 0
+
+
+def profile_path(request):
+    """
+    The pstats file of `request`, named after its view and request id,
+    in a directory per day.
+    """
+    match = getattr(request, 'resolver_match', None)
+    view = re.sub(r'[^\w.-]', '_', match.view_name if match else 'unresolved')
+    directory = os.path.join(profile_dir(), time.strftime('%Y-%m-%d'))
+    os.makedirs(directory, exist_ok=True)
+    request_id = getattr(request, '_logging_uuid', None) or '%x' % random.getrandbits(64)
+    return os.path.join(directory, '%s--%s.prof' % (view, request_id))
+
+
+class ProfilingMiddleware(object):
+    """
+    Opt-in profiling, with PROFILE_DIR set.
+
+    A request is run under cProfile when it carries a token from the
+    staff-only profile_token view in its X-BlueButton-Profile header, or
+    for one request in PROFILE_SAMPLE_RATE. Its pstats file is written
+    to PROFILE_DIR, tagged with its view and request id, which is sent
+    back in the X-BlueButton-Profile-Id header. The summarize_profiles
+    command merges them by view.
+
+    With SAMPLING_PROFILER_INTERVAL, each worker also runs a
+    SamplingProfiler writing its stacks to PROFILE_DIR.
+    """
+
+    def process_request(self, request):
+        start_sampler()
+        if should_profile(request):
+            request.profiler = cProfile.Profile()
+            request.profiler.enable()
+
+    def process_response(self, request, response):
+        profiler = getattr(request, 'profiler', None)
+        if profiler is None:
+            return response
+        profiler.disable()
+        path = profile_path(request)
+        profiler.dump_stats(path)
+        logger.info('Profiled %s %s to %s' % (request.method, request.path, path))
+        response['X-BlueButton-Profile-Id'] = os.path.basename(path)[:-len('.prof')]
+        return response
@@ -0,0 +1,194 @@
+import logging
+import os
+import time
+import traceback
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections
+
+from .request_logging import RequestTimeLoggingMiddleware
+from .slow_requests import current_collector
+from .timing import add_phase
+from .tracing import MAX_STATEMENT, current_span, span
+
+logger = logging.getLogger('performance.%s' % __name__)
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class CountingCursor(object):
+    """
+    Cursor wrapper recording the queries it runs in a QueryCounter.
+    """
+
+    def __init__(self, cursor, counter, alias):
+        self.cursor = cursor
+        self.counter = counter
+        self.alias = alias
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.cursor.__exit__(type, value, traceback)
+
+    def execute(self, sql, params=None):
+        start = time.perf_counter()
+        try:
+            if current_span() is None:
+                return self.cursor.execute(sql, params)
+            with span('db.query', tags={'db.alias': self.alias, 'db.statement': sql[:MAX_STATEMENT]}):
+                return self.cursor.execute(sql, params)
+        finally:
+            self.counter.record(self.alias, sql, params, time.perf_counter() - start)
+
+    def executemany(self, sql, param_list):
+        start = time.perf_counter()
+        try:
+            if current_span() is None:
+                return self.cursor.executemany(sql, param_list)
+            with span('db.query', tags={'db.alias': self.alias, 'db.statement': sql[:MAX_STATEMENT]}):
+                return self.cursor.executemany(sql, param_list)
+        finally:
+            self.counter.record(self.alias, sql, None, time.perf_counter() - start)
+
+
+class QueryCounter(object):
+    """
+    Context manager counting the queries run by the connections of the
+    current thread, the time they take, and the duplicates: queries run
+    again with the same SQL and parameters. With `stacks`, the stack of
+    each duplicate is kept to find where it comes from.
+
+        with QueryCounter() as queries:
+            ...
+        assert queries.duplicates == 0
+    """
+
+    def __init__(self, stacks=True):
+        self.stacks = stacks
+        self.count = 0
+        self.duplicates = 0
+        self.seconds = 0.0
+        self.duplicate_stacks = []
+        self._seen = Counter()
+        self._installed = []
+
+    def __enter__(self):
+        for connection in connections.all():
+            saved = dict((name, connection.__dict__[name]) for name in ('make_cursor', 'make_debug_cursor')
+                         if name in connection.__dict__)
+            connection.make_cursor = self._wrap(connection.make_cursor, connection.alias)
+            connection.make_debug_cursor = self._wrap(connection.make_debug_cursor, connection.alias)
+            self._installed.append((connection, saved))
+        return self
+
+    def __exit__(self, type, value, traceback):
+        for connection, saved in self._installed:
+            del connection.make_cursor
+            del connection.make_debug_cursor
+            connection.__dict__.update(saved)
+        self._installed = []
+
+    def _wrap(self, make_cursor, alias):
+        return lambda cursor: CountingCursor(make_cursor(cursor), self, alias)
+
+    def record(self, alias, sql, params, seconds):
+        self.count += 1
+        self.seconds += seconds
+        collector = current_collector()
+        if collector is not None:
+            collector.add_query(alias, sql, seconds)
+        key = query_key(alias, sql, params)
+        self._seen[key] += 1
+        if params is not None and self._seen[key] > 1:
+            self.duplicates += 1
+            self.duplicate_stacks.append((sql, project_stack() if self.stacks else []))
+
+
+def query_key(alias, sql, params):
+    """
+    A hash identifying the query, so that its parameters are not kept.
+    """
+    try:
+        return hash((alias, sql, tuple(params) if isinstance(params, list) else params))
+    except TypeError:
+        # unhashable parameters, as a dict or a list value
+        return hash((alias, sql, repr(params)))
+
+
+def project_stack():
+    """
+    The frames of the current stack in the code of the project, outside
+    of this module and of the installed packages.
+    """
+    return [frame for frame in traceback.extract_stack()[:-2]
+            if frame.filename.startswith(PROJECT_DIR) and 'site-packages' not in frame.filename and
+            frame.filename != __file__]
+
+
+def view_attribute(view_func, name):
+    """
+    The attribute `name` declared on a view function or view class.
+    """
+    value = getattr(view_func, name, None)
+    for attr in ('view_class', 'cls'):
+        if value is None:
+            value = getattr(getattr(view_func, attr, None), name, None)
+    return value
+
+
+class QueryBudgetMiddleware(object):
+    """
+    Count the queries of each request, their duplicates and the time
+    spent in the database, and add them to the performance log.
+
+    Views can declare the queries they are allowed with a `query_budget`
+    attribute. A request going over the budget of its view is logged as
+    a warning with its duplicate queries, and raises QueryBudgetExceeded
+    when QUERY_BUDGET_ENFORCE is set, as in the tests. The stacks of the
+    duplicates are only collected with DEBUG or QUERY_BUDGET_ENFORCE
+    set, and in the traced requests. The database time is added to the
+    phases of the request.
+    """
+
+    def process_request(self, request):
+        stacks = (settings.DEBUG or getattr(settings, 'QUERY_BUDGET_ENFORCE', False) or
+                  current_span() is not None)
+        request.query_counter = QueryCounter(stacks=stacks).__enter__()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = view_attribute(view_func, 'query_budget')
+
+    def process_response(self, request, response):
+        counter = getattr(request, 'query_counter', None)
+        if counter is None:
+            return response
+        counter.__exit__(None, None, None)
+        budget = getattr(request, 'query_budget', None)
+        add_phase('db', counter.seconds)
+
+        RequestTimeLoggingMiddleware.log_message(
+            request, 'queries', '%s queries %s duplicates %.1fms budget %s' % (
+                counter.count, counter.duplicates, counter.seconds * 1000, budget))
+
+        if budget is not None and counter.count > budget:
+            message = '%s %s ran %s queries, over its budget of %s' % (
+                request.method, request.path, counter.count, budget)
+            logger.warning('%s, duplicates:\n%s' % (message, '\n'.join(
+                '%s\n%s' % (sql, ''.join(traceback.format_list(stack)))
+                for sql, stack in counter.duplicate_stacks)))
+            if getattr(settings, 'QUERY_BUDGET_ENFORCE', False):
+                raise QueryBudgetExceeded(message)
+        return response
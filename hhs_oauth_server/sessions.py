@@ -0,0 +1,68 @@
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.sessions.middleware import SessionMiddleware
+
+SIGNED_COOKIES_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+
+
+def is_signed_cookie(session_key):
+    # the server side engines use random alphanumeric keys, signed
+    # cookies are "data:timestamp:signature"
+    return bool(session_key) and ':' in session_key
+
+
+def session_store(session_key):
+    """
+    The session of `session_key`, in the engine that stored it.
+    """
+    if is_signed_cookie(session_key):
+        return import_module(SIGNED_COOKIES_ENGINE).SessionStore(session_key)
+    return import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+
+
+def view_engine(request, session):
+    """
+    The session engine of `session` for the view serving `request`:
+    signed cookies for the anonymous sessions of the views named in
+    `SESSION_COOKIE_VIEWS`, `SESSION_ENGINE` otherwise. The sessions of
+    logged in users stay on the server, where logging out revokes them.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if (match is not None and match.view_name in getattr(settings, 'SESSION_COOKIE_VIEWS', ()) and
+            SESSION_KEY not in session):
+        return import_module(SIGNED_COOKIES_ENGINE)
+    return import_module(settings.SESSION_ENGINE)
+
+
+class FlowSessionMiddleware(SessionMiddleware):
+    """
+    SessionMiddleware letting each view choose where its session is kept.
+
+    The views named in `SESSION_COOKIE_VIEWS`, whose sessions hold a few
+    small values, keep the anonymous ones in a signed cookie. The others
+    use `SESSION_ENGINE`. A session is read from wherever its cookie points, so it
+    follows the user across the views of a flow, and moves to the engine
+    of the view that modifies it. As with SessionMiddleware, sessions
+    that were not modified are not saved.
+    """
+
+    def process_request(self, request):
+        request.session = session_store(request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+
+    def process_response(self, request, response):
+        session = getattr(request, 'session', None)
+        if (session is not None and session.modified and not session.is_empty() and
+                response.status_code != 500):
+            engine = view_engine(request, session)
+            if not isinstance(session, engine.SessionStore):
+                request.session = self.move_session(session, engine)
+        return super(FlowSessionMiddleware, self).process_response(request, response)
+
+    def move_session(self, session, engine):
+        moved = engine.SessionStore()
+        moved.update(dict(session.items()))
+        if session.session_key and not is_signed_cookie(session.session_key):
+            session.delete()
+        return moved
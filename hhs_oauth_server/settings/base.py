@@ -1,9 +1,8 @@
 import os
 import dj_database_url
 import socket
-import datetime
 from getenv import env
-from ..utils import bool_env, int_env
+from ..utils import bool_env, int_env, list_env
 
 from django.contrib.messages import constants as messages
 from django.utils.translation import ugettext_lazy as _
@@ -76,7 +75,6 @@ INSTALLED_APPS = [
     'social_django',
     # DOT must be installed after apps.dot_ext in order to override templates
     'oauth2_provider',
-    'axes',
 
 ]
 
@@ -86,15 +84,81 @@ REST_FRAMEWORK = {
     },
 }
 
-# Failed Login Attempt Module: AXES
-# Either integer or timedelta.
-# If integer interpreted, as hours
-AXES_COOLOFF_TIME = datetime.timedelta(minutes=30)
-AXES_FAILURE_LIMIT = 5
-AXES_LOGIN_FAILURE_LIMIT = 5
-AXES_LOCK_OUT_AT_FAILURE = True
-AXES_ONLY_USER_FAILURES = True
-AXES_USERNAME_FORM_FIELD = "username"
+# Failed login lockout. A username, an IP address or a username and IP
+# address pair is locked out for LOGIN_LOCKOUT_SECONDS once its failures
+# over the last LOGIN_FAILURE_WINDOW seconds reach its limit; a limit of
+# 0 turns the dimension off. The counters live in LOGIN_LOCKOUT_CACHE,
+# which must increment atomically, so not a DatabaseCache, and be shared
+# by the processes of the server: the system checks refuse a per process
+# cache when DEBUG is off.
+# See apps.accounts.lockout
+LOGIN_FAILURE_LIMIT = int(env('DJANGO_LOGIN_FAILURE_LIMIT', 5))
+LOGIN_FAILURE_IP_LIMIT = int(env('DJANGO_LOGIN_FAILURE_IP_LIMIT', 0))
+LOGIN_FAILURE_USER_IP_LIMIT = int(env('DJANGO_LOGIN_FAILURE_USER_IP_LIMIT', 0))
+LOGIN_FAILURE_WINDOW = int(env('DJANGO_LOGIN_FAILURE_WINDOW', 1800))
+LOGIN_LOCKOUT_SECONDS = int(env('DJANGO_LOGIN_LOCKOUT_SECONDS', 1800))
+LOGIN_LOCKOUT_CACHE = env('DJANGO_LOGIN_LOCKOUT_CACHE', 'counters')
+# Failed logins are audited in the LoginFailure table, written in batches
+# of LOGIN_AUDIT_BATCH_SIZE every LOGIN_AUDIT_INTERVAL seconds by a
+# background thread buffering at most LOGIN_AUDIT_BUFFER_SIZE records.
+LOGIN_AUDIT_BACKGROUND = True
+LOGIN_AUDIT_BATCH_SIZE = int(env('DJANGO_LOGIN_AUDIT_BATCH_SIZE', 500))
+LOGIN_AUDIT_INTERVAL = int(env('DJANGO_LOGIN_AUDIT_INTERVAL', 5))
+LOGIN_AUDIT_BUFFER_SIZE = int(env('DJANGO_LOGIN_AUDIT_BUFFER_SIZE', 10000))
+
+# Raise when a request runs more queries than the query_budget of its
+# view, instead of logging a warning.
+QUERY_BUDGET_ENFORCE = bool_env(env('DJANGO_QUERY_BUDGET_ENFORCE', 'False'))
+
+# Request phase histograms. Each worker process writes its own to
+# METRICS_DIR, where /metrics reads them all; without it /metrics only
+# reports the process serving it.
+METRICS_DIR = env('DJANGO_METRICS_DIR', '')
+METRICS_ALLOWED_IPS = list_env(env('DJANGO_METRICS_ALLOWED_IPS', ['127.0.0.1']))
+# Send the Server-Timing header to everyone, not only to staff users
+SERVER_TIMING_PUBLIC = bool_env(env('DJANGO_SERVER_TIMING_PUBLIC', 'False'))
+
+# Opt-in profiling, written to PROFILE_DIR: cProfile of the requests with
+# a staff profile token header and of one request in PROFILE_SAMPLE_RATE
+# (0 for none), and stacks sampled every SAMPLING_PROFILER_INTERVAL
+# seconds (0 for never).
+PROFILE_DIR = env('DJANGO_PROFILE_DIR', '')
+PROFILE_SAMPLE_RATE = int(env('DJANGO_PROFILE_SAMPLE_RATE', 0))
+PROFILE_TOKEN_MAX_AGE = int(env('DJANGO_PROFILE_TOKEN_MAX_AGE', 3600))
+SAMPLING_PROFILER_INTERVAL = float(env('DJANGO_SAMPLING_PROFILER_INTERVAL', 0))
+SAMPLING_PROFILER_FLUSH_INTERVAL = int(env('DJANGO_SAMPLING_PROFILER_FLUSH_INTERVAL', 60))
+
+# Opt-in memory accounting of one request in MEMORY_SAMPLE_RATE (0 for
+# none) under tracemalloc, reported by /memory-report. Raise when one
+# allocates more than the memory_budget of its view, instead of logging
+# a warning.
+MEMORY_SAMPLE_RATE = int(env('DJANGO_MEMORY_SAMPLE_RATE', 0))
+MEMORY_BUDGET_ENFORCE = bool_env(env('DJANGO_MEMORY_BUDGET_ENFORCE', 'False'))
+
+# Opt-in tracing of one request in TRACE_SAMPLE_RATE (0 for none). The
+# spans of each worker are written in batches to spans_<pid>.json in
+# TRACE_DIR, one JSON array of Zipkin v2 spans per line, rotated past
+# TRACE_FILE_MAX_BYTES.
+TRACE_DIR = env('DJANGO_TRACE_DIR', '')
+TRACE_SAMPLE_RATE = int(env('DJANGO_TRACE_SAMPLE_RATE', 0))
+TRACE_SERVICE_NAME = env('DJANGO_TRACE_SERVICE_NAME', 'bluebutton')
+TRACE_EXPORT_BACKGROUND = True
+TRACE_EXPORT_INTERVAL = int(env('DJANGO_TRACE_EXPORT_INTERVAL', 5))
+TRACE_BATCH_SIZE = int(env('DJANGO_TRACE_BATCH_SIZE', 500))
+TRACE_BUFFER_SIZE = int(env('DJANGO_TRACE_BUFFER_SIZE', 10000))
+TRACE_FILE_MAX_BYTES = int(env('DJANGO_TRACE_FILE_MAX_BYTES', 50 * 1024 * 1024))
+TRACE_FILE_BACKUPS = int(env('DJANGO_TRACE_FILE_BACKUPS', 5))
+
+# Forensic records of the requests taking more than
+# SLOW_REQUEST_THRESHOLD seconds (0 for none), the latest
+# SLOW_REQUEST_MAX_RECORDS kept in SLOW_REQUEST_DIR. See
+# hhs_oauth_server.slow_requests
+SLOW_REQUEST_THRESHOLD = float(env('DJANGO_SLOW_REQUEST_THRESHOLD', 0))
+SLOW_REQUEST_DIR = env('DJANGO_SLOW_REQUEST_DIR', '')
+SLOW_REQUEST_MAX_RECORDS = int(env('DJANGO_SLOW_REQUEST_MAX_RECORDS', 1000))
+# SQL, backend and cache calls kept of each kind per request
+SLOW_REQUEST_MAX_ITEMS = int(env('DJANGO_SLOW_REQUEST_MAX_ITEMS', 500))
+
 # Used for testing for optional apps in templates without causing a crash
 # used in SETTINGS_EXPORT below.
 OPTIONAL_INSTALLED_APPS = ["", ]
@@ -102,8 +166,20 @@ OPTIONAL_INSTALLED_APPS = ["", ]
 MIDDLEWARE_CLASSES = [
     # Middleware that adds headers to the resposne
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    # Records the slow requests, once everything below has finished
+    'hhs_oauth_server.slow_requests.SlowRequestMiddleware',
+    # Traces the sampled requests, around everything below
+    'hhs_oauth_server.tracing.TracingMiddleware',
+    # Times the phases of the requests, including the queries counted below
+    'hhs_oauth_server.timing.TimingMiddleware',
+    # Counts the queries of the middlewares below and of the view
+    'hhs_oauth_server.query_budget.QueryBudgetMiddleware',
+    # Measures the memory of the sampled requests, from here down
+    'hhs_oauth_server.memory.MemoryMiddleware',
+    'hhs_oauth_server.sessions.FlowSessionMiddleware',
     'hhs_oauth_server.request_logging.RequestTimeLoggingMiddleware',
+    # Profiles the requests asking for it, tagged with the request id above
+    'hhs_oauth_server.profiling.ProfilingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
 
     # Middleware that can send a response must be below this line
@@ -111,6 +187,7 @@ MIDDLEWARE_CLASSES = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.auth.middleware.SessionAuthenticationMiddleware',
+    'apps.accounts.principal.PrincipalMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'social_django.middleware.SocialAuthExceptionMiddleware',
@@ -148,6 +225,14 @@ CACHES = {
         'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.db.DatabaseCache'),
         'LOCATION': os.environ.get('CACHE_LOCATION', 'django_cache'),
     },
+    # Counters incremented atomically, as the login lockout ones, and the
+    # cached principals. The default is per process, which only suits a
+    # single process server: point it at memcached for the processes to
+    # share it.
+    'counters': {
+        'BACKEND': os.environ.get('COUNTER_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('COUNTER_CACHE_LOCATION', 'counters'),
+    },
 }
 
 DATABASES = {
@@ -206,7 +291,28 @@ EMAIL_HOST_PASSWORD = env('DJANGO_EMAIL_HOST_PASSWORD', None)
 EMAIL_SSL_KEYFILE = env('DJANGO_EMAIL_SSL_KEYFILE', None)
 EMAIL_SSL_CERTFILE = env('DJANGO_EMAIL_SSL_CERTFILE', None)
 
+# Emails are queued in the outbox and sent in batches over one
+# connection. Their bodies are blanked once sent, or
+# EMAIL_OUTBOX_FAILED_RETENTION_SECONDS after they were queued when they
+# failed. See apps.accounts.outbox
+EMAIL_OUTBOX_BACKGROUND = True
+EMAIL_OUTBOX_BATCH_SIZE = int(env('DJANGO_EMAIL_OUTBOX_BATCH_SIZE', 50))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(env('DJANGO_EMAIL_OUTBOX_MAX_ATTEMPTS', 5))
+EMAIL_OUTBOX_RETRY_SECONDS = int(env('DJANGO_EMAIL_OUTBOX_RETRY_SECONDS', 60))
+EMAIL_OUTBOX_LEASE_SECONDS = int(env('DJANGO_EMAIL_OUTBOX_LEASE_SECONDS', 300))
+EMAIL_OUTBOX_DEDUP_SECONDS = int(env('DJANGO_EMAIL_OUTBOX_DEDUP_SECONDS', 300))
+EMAIL_OUTBOX_FAILED_RETENTION_SECONDS = int(env('DJANGO_EMAIL_OUTBOX_FAILED_RETENTION_SECONDS', 7 * 24 * 3600))
+
 MFA = True
+# Seconds an MFA code stays valid.
+MFA_CODE_SECONDS = int(env('DJANGO_MFA_CODE_SECONDS', 86400))
+
+# Short lived login state (MFA codes, MyMedicare state parameters) is kept
+# in the default cache, or in the EphemeralState table when set to 'db'.
+# Expired rows are deleted at most every EPHEMERAL_STORE_CLEANUP_SECONDS.
+# See apps.accounts.ephemeral
+EPHEMERAL_STORE = env('DJANGO_EPHEMERAL_STORE', 'cache')
+EPHEMERAL_STORE_CLEANUP_SECONDS = int(env('DJANGO_EPHEMERAL_STORE_CLEANUP_SECONDS', 300))
 
 # AWS Credentials need to support SES, SQS and SNS
 AWS_ACCESS_KEY_ID = env('AWS_ACCESS_KEY_ID', 'change-me')
@@ -285,6 +391,35 @@ OAUTH2_PROVIDER = {
     'ALLOWED_REDIRECT_URI_SCHEMES': ['https', 'http']
 }
 
+# Seconds between checks of the shared scope catalog version.
+# See apps.dot_ext.scopes.ScopeCatalog
+SCOPE_CATALOG_VERSION_CHECK_SECONDS = int(env('DJANGO_SCOPE_CATALOG_VERSION_CHECK_SECONDS', 5))
+
+# Bulk token revocation. Running revocations whose worker has not
+# finished a batch for TOKEN_REVOCATION_STALE_SECONDS are resumed by
+# revoke_tokens --pending.
+# See apps.dot_ext.revocation
+TOKEN_REVOCATION_BATCH_SIZE = int(env('DJANGO_TOKEN_REVOCATION_BATCH_SIZE', 1000))
+TOKEN_REVOCATION_STALE_SECONDS = int(env('DJANGO_TOKEN_REVOCATION_STALE_SECONDS', 3600))
+TOKEN_REVOCATION_BACKGROUND = True
+
+# Skip the authorization page when the user already approved the
+# requested scopes. See apps.dot_ext.views.authorization
+REMEMBER_CONSENT = bool_env(env('DJANGO_REMEMBER_CONSENT', True))
+CONSENT_CACHE_SECONDS = int(env('DJANGO_CONSENT_CACHE_SECONDS', 300))
+
+# Cache-Control max-age of the OpenID Connect discovery document and
+# lifetime of the cached userinfo responses.
+OPENID_CONFIGURATION_MAX_AGE = int(env('DJANGO_OPENID_CONFIGURATION_MAX_AGE', 86400))
+USERINFO_CACHE_SECONDS = int(env('DJANGO_USERINFO_CACHE_SECONDS', 300))
+# Seconds the user, profile and crosswalk of a logged in user are cached
+# in PRINCIPAL_CACHE, without the password hash, by
+# apps.accounts.principal.PrincipalMiddleware. Saving any of them
+# invalidates the cached copy: the cache must be shared by the processes
+# of the server, as LOGIN_LOCKOUT_CACHE.
+PRINCIPAL_CACHE = env('DJANGO_PRINCIPAL_CACHE', 'counters')
+PRINCIPAL_CACHE_SECONDS = int(env('DJANGO_PRINCIPAL_CACHE_SECONDS', 300))
+
 # These choices will be available in the expires_in field
 # of the oauth2 authorization page.
 DOT_EXPIRES_IN = (
@@ -382,6 +517,18 @@ SETTINGS_EXPORT = [
 
 SESSION_COOKIE_AGE = 5400
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
+# Sessions are kept in the cache and written through to the database,
+# or only in the database when the cache is a DatabaseCache, where
+# cached_db would write both. The views listed here keep their anonymous
+# sessions in a signed cookie.
+SESSION_ENGINE = env('DJANGO_SESSION_ENGINE',
+                     'django.contrib.sessions.backends.db'
+                     if CACHES['default']['BACKEND'].endswith('.DatabaseCache') else
+                     'django.contrib.sessions.backends.cached_db')
+SESSION_COOKIE_VIEWS = [
+    'mymedicare-login',
+    'mymedicare-choose-login',
+]
 
 FHIR_SERVER_DEFAULT = env('DJANGO_FHIRSERVER_ID', 1)
 
@@ -457,10 +604,30 @@ SLS_USERINFO_ENDPOINT = env(
     'DJANGO_SLS_USERINFO_ENDPOINT', 'https://dev.accounts.cms.gov/v1/oauth/userinfo')
 SLS_TOKEN_ENDPOINT = env(
     'DJANGO_SLS_TOKEN_ENDPOINT', 'https://dev.accounts.cms.gov/v1/oauth/token')
+# Seconds a successful client authentication of an SLS caller is cached.
+SLS_CLIENT_AUTH_CACHE_SECONDS = int(env('DJANGO_SLS_CLIENT_AUTH_CACHE_SECONDS', 60))
 
 
 # Since this is internal False may be acceptable.
 SLS_VERIFY_SSL = env('DJANGO_SLS_VERIFY_SSL', True)
+# Connect and read timeouts, in seconds, of the SLS token and userinfo calls.
+SLS_REQUEST_TIMEOUT = (float(env('DJANGO_SLS_CONNECT_TIMEOUT', 3)),
+                       float(env('DJANGO_SLS_READ_TIMEOUT', 10)))
+# Seconds a MyMedicare login may take between the redirect and the callback.
+MEDICARE_STATE_SECONDS = int(env('DJANGO_MEDICARE_STATE_SECONDS', 3600))
+# Connections kept alive per host for the SLS and backend calls made at login.
+MEDICARE_HTTP_POOL_SIZE = int(env('DJANGO_MEDICARE_HTTP_POOL_SIZE', 10))
+# Seconds the patient search may take at login. When it fails or takes
+# longer the user is logged in anyway and the search is retried in a
+# background thread, MEDICARE_FHIR_LOOKUP_RETRIES times, waiting
+# MEDICARE_FHIR_LOOKUP_RETRY_DELAY seconds doubled after each attempt.
+# See apps.mymedicare_cb.models
+MEDICARE_FHIR_LOOKUP_TIMEOUT = float(env('DJANGO_MEDICARE_FHIR_LOOKUP_TIMEOUT', 3))
+MEDICARE_FHIR_LOOKUP_BACKGROUND = True
+MEDICARE_FHIR_LOOKUP_RETRIES = int(env('DJANGO_MEDICARE_FHIR_LOOKUP_RETRIES', 3))
+MEDICARE_FHIR_LOOKUP_RETRY_DELAY = int(env('DJANGO_MEDICARE_FHIR_LOOKUP_RETRY_DELAY', 5))
+# Seconds the hicn hash to fhir_id mapping is cached.
+MEDICARE_FHIR_ID_CACHE_SECONDS = int(env('DJANGO_MEDICARE_FHIR_ID_CACHE_SECONDS', 86400))
 
 AUTHENTICATION_BACKENDS = ('apps.accounts.email_auth_backend.EmailBackend',
                            'django.contrib.auth.backends.ModelBackend')
@@ -468,6 +635,9 @@ AUTHENTICATION_BACKENDS = ('apps.accounts.email_auth_backend.EmailBackend',
 # Change these for production
 USER_ID_SALT = env('DJANGO_USER_ID_SALT', "6E6F747468657265616C706570706572")
 USER_ID_ITERATIONS = int(env("DJANGO_USER_ID_ITERATIONS", "2"))
+# Number of recent user id hashes kept in memory by each process.
+# See apps.accounts.hashing
+USER_ID_HASH_CACHE_SIZE = int(env("DJANGO_USER_ID_HASH_CACHE_SIZE", "10000"))
 
 USER_ID_TYPE_CHOICES = (('H', 'HICN'),
                         ('M', 'MBI'),
@@ -16,6 +16,8 @@ DEV_SPECIFIC_APPS = [
     # 'storages',
     # A test client - moved to aws-test / dev /impl settings
     'apps.testclient',
+    # Microbenchmarks of the FHIR proxy hot paths
+    'apps.benchmarks',
 ]
 INSTALLED_APPS += DEV_SPECIFIC_APPS
 
@@ -13,6 +13,22 @@ REQUEST_CALL_TIMEOUT = (5, 120)
 
 OFFLINE = True
 
+# run bulk token revocations inline
+TOKEN_REVOCATION_BACKGROUND = False
+
+# send queued emails inline
+EMAIL_OUTBOX_BACKGROUND = False
+# retry the deferred patient searches inline
+MEDICARE_FHIR_LOOKUP_BACKGROUND = False
+# write the login failure audit records inline
+LOGIN_AUDIT_BACKGROUND = False
+# write the trace spans inline
+TRACE_EXPORT_BACKGROUND = False
+
+# fail the tests of views going over their query or memory budget
+QUERY_BUDGET_ENFORCE = True
+MEMORY_BUDGET_ENFORCE = True
+
 # Should be set to True in production and False in all other dev and test environments
 # Replace with BLOCK_HTTP_REDIRECT_URIS per CBBP-845 to support mobile apps
 # REQUIRE_HTTPS_REDIRECT_URIS = True
@@ -32,11 +48,16 @@ CACHES = {
         'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
         'LOCATION': os.environ.get('CACHE_LOCATION', 'unique-snowflake'),
     },
-    'axes_cache': {
-        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    'counters': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'counters',
     },
 }
-AXES_CACHE = 'axes_cache'
+
+# the tests run in a single process, which the per process counters suit
+SILENCED_SYSTEM_CHECKS = ['accounts.E002']
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
 
 # http required in ALLOWED_REDIRECT_URI_SCHEMES for tests to function correctly
 APPLICATION_TITLE = "Blue Button 2.0 TEST"
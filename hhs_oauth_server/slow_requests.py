@@ -0,0 +1,300 @@
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, JsonResponse
+
+logger = logging.getLogger('performance.%s' % __name__)
+
+# the ids of the resources of a beneficiary in the FHIR paths
+RESOURCE_ID = re.compile(r'(/(?:Patient|Coverage|ExplanationOfBenefit)/)[^/?]+')
+# the query parameters whose values are kept, the others may be PHI
+SAFE_PARAMETERS = ('_format', '_count', 'count', 'startIndex', 'resourceType')
+# the route arguments kept in the paths, when they look like names
+SAFE_ARGUMENTS = ('resource_type',)
+# a path segment that holds no key nor id, or the API version
+PATH_WORD = re.compile(r'^(?:[A-Za-z_.-]{0,30}|v\d+)$')
+KEY_PART = re.compile(r'[^:_.-]+')
+WORD = re.compile(r'^[a-z]{1,15}$')
+# the words of a cache key kept at most, the namespace of its values
+MAX_KEY_WORDS = 3
+RECORD_NAME = re.compile(r'^[0-9T]+-\d+-[0-9a-f]+$')
+
+_local = threading.local()
+
+
+def redact_path(request):
+    """
+    The path of `request` with the segments holding the arguments of its
+    route as {name}, but SAFE_ARGUMENTS, or with the segments that do not
+    look like words as {id} when it did not resolve.
+    """
+    match = getattr(request, 'resolver_match', None)
+    segments = request.path.split('/')
+    if match is None:
+        return '/'.join(segment if PATH_WORD.match(segment) else '{id}' for segment in segments)
+    arguments = dict((str(value), '{%s}' % name) for name, value in match.kwargs.items()
+                     if not (name in SAFE_ARGUMENTS and PATH_WORD.match(str(value))))
+    arguments.update((str(value), '{arg}') for value in match.args)
+    return '/'.join(arguments.get(segment, segment) for segment in segments)
+
+
+def redact_url(url):
+    """
+    `url` without the resource ids of its FHIR path and the values of
+    its query parameters but SAFE_PARAMETERS.
+    """
+    parts = urlsplit(url)
+    path = RESOURCE_ID.sub(r'\1{id}', parts.path)
+    query = urlencode([(key, value if key in SAFE_PARAMETERS else 'REDACTED')
+                       for key, value in parse_qsl(parts.query, keep_blank_values=True)])
+    return urlunsplit((parts.scheme, parts.netloc, path, query, ''))
+
+
+class RequestCollector(object):
+    """
+    The SQL, backend and cache calls of a request, kept in case it is
+    slow, up to `max_items` of each.
+    """
+
+    def __init__(self, max_items=500):
+        self.max_items = max_items
+        self.queries = []
+        self.backend_calls = []
+        self.cache_calls = []
+        self.dropped = 0
+
+    def _add(self, items, item):
+        if len(items) < self.max_items:
+            items.append(item)
+        else:
+            self.dropped += 1
+
+    def add_query(self, alias, sql, seconds):
+        self._add(self.queries, (alias, sql, seconds))
+
+    def add_backend_call(self, url, status, seconds, ttfb, size):
+        self._add(self.backend_calls, (url, status, seconds, ttfb, size))
+
+    def add_cache_call(self, alias, operation, key, hit, seconds):
+        self._add(self.cache_calls, (alias, operation, key, hit, seconds))
+
+    def as_json(self):
+        return {
+            'queries': [{'alias': alias, 'sql': sql, 'ms': seconds * 1000}
+                        for alias, sql, seconds in self.queries],
+            'backend_calls': [{
+                'url': redact_url(url),
+                'status': status,
+                'ms': seconds * 1000,
+                # the wait for the headers, connection included
+                'ttfb_ms': ttfb * 1000 if ttfb is not None else None,
+                'download_ms': (seconds - ttfb) * 1000 if ttfb is not None else None,
+                'bytes': size,
+            } for url, status, seconds, ttfb, size in self.backend_calls],
+            'cache_calls': [{'alias': alias, 'operation': operation, 'key': key, 'hit': hit, 'ms': seconds * 1000}
+                            for alias, operation, key, hit, seconds in self.cache_calls],
+            'dropped': self.dropped,
+        }
+
+
+def current_collector():
+    return getattr(_local, 'collector', None)
+
+
+def redact_cache_key(key):
+    """
+    The namespace of `key`, its leading lowercase words up to
+    MAX_KEY_WORDS, followed by {id} in place of the rest, which holds the
+    hashes, ids, tokens and usernames keys end with.
+    """
+    key = str(key)
+    words = 0
+    for match in KEY_PART.finditer(key):
+        if words == MAX_KEY_WORDS or not WORD.match(match.group(0)):
+            return key[:match.start()] + '{id}'
+        words += 1
+    return key
+
+
+def record_cache_call(alias, operation, args, kwargs, result, seconds):
+    """
+    Record a cache call, with whether it hit for the lookups, in the
+    collector of the current request.
+    """
+    collector = current_collector()
+    if collector is None:
+        return
+    hit = None
+    if operation == 'get':
+        hit = result is not (args[1] if len(args) > 1 else kwargs.get('default'))
+    elif operation == 'has_key':
+        hit = bool(result)
+    elif operation == 'get_many':
+        hit = '%s/%s' % (len(result), len(args[0]) if args else 0)
+    key = redact_cache_key(args[0]) if args and operation not in ('get_many', 'set_many', 'delete_many') else ''
+    collector.add_cache_call(alias, operation, key, hit, seconds)
+
+
+def record_directory():
+    return getattr(settings, 'SLOW_REQUEST_DIR', '')
+
+
+def save_record(record):
+    """
+    Write `record` to SLOW_REQUEST_DIR, then delete the oldest records
+    past SLOW_REQUEST_MAX_RECORDS. Returns its id.
+    """
+    directory = record_directory()
+    os.makedirs(directory, exist_ok=True)
+    # named by time, to delete the oldest first
+    record_id = '%s-%s-%08x' % (datetime.utcnow().strftime('%Y%m%dT%H%M%S%f'), os.getpid(),
+                                random.getrandbits(32))
+    record['id'] = record_id
+    path = os.path.join(directory, record_id + '.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(record, f)
+    os.replace(path + '.tmp', path)
+
+    names = sorted(name for name in os.listdir(directory) if name.endswith('.json'))
+    for name in names[:max(len(names) - getattr(settings, 'SLOW_REQUEST_MAX_RECORDS', 1000), 0)]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            # pruned by another worker
+            pass
+    return record_id
+
+
+def load_record(record_id):
+    if not RECORD_NAME.match(record_id):
+        return None
+    try:
+        with open(os.path.join(record_directory(), record_id + '.json')) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def find_records(view=None, min_ms=None, limit=50):
+    """
+    The records of SLOW_REQUEST_DIR, the latest first, of `view` and
+    taking at least `min_ms` when they are given.
+    """
+    directory = record_directory()
+    if not directory or not os.path.isdir(directory):
+        return []
+    records = []
+    for name in sorted((name for name in os.listdir(directory) if name.endswith('.json')), reverse=True):
+        record = load_record(name[:-len('.json')])
+        if record is None:
+            continue
+        if view and record['view'] != view:
+            continue
+        if min_ms is not None and record['ms'] < min_ms:
+            continue
+        records.append(record)
+        if len(records) >= limit:
+            break
+    return records
+
+
+def summary(record):
+    return {
+        'id': record['id'],
+        'time': record['time'],
+        'method': record['method'],
+        'path': record['path'],
+        'view': record['view'],
+        'status': record['status'],
+        'ms': record['ms'],
+        'queries': len(record['queries']),
+        'backend_calls': len(record['backend_calls']),
+        'cache_calls': len(record['cache_calls']),
+    }
+
+
+class SlowRequestMiddleware(object):
+    """
+    Keep a forensic record of the requests taking more than
+    SLOW_REQUEST_THRESHOLD seconds, with SLOW_REQUEST_DIR set: their SQL,
+    backend calls, cache calls, phases and response size. Each request
+    collects them in memory, thrown away when it was fast. The records
+    go to SLOW_REQUEST_DIR, keeping the latest SLOW_REQUEST_MAX_RECORDS,
+    where the slow_requests command and view read them.
+
+    The paths are kept without the arguments of their route, the backend
+    URLs without their resource ids and query values, the SQL without
+    its parameters and the cache keys without what follows their
+    namespace. This leaves out the ids of the beneficiaries, the tokens,
+    the usernames and the keys of the reset and activation links.
+    """
+
+    def process_request(self, request):
+        _local.collector = None
+        if getattr(settings, 'SLOW_REQUEST_THRESHOLD', 0) and record_directory():
+            request.slow_request_start = time.perf_counter()
+            _local.collector = RequestCollector(getattr(settings, 'SLOW_REQUEST_MAX_ITEMS', 500))
+
+    def process_response(self, request, response):
+        collector = current_collector()
+        _local.collector = None
+        start = getattr(request, 'slow_request_start', None)
+        if collector is None or start is None:
+            return response
+        seconds = time.perf_counter() - start
+        if seconds < settings.SLOW_REQUEST_THRESHOLD:
+            return response
+
+        match = getattr(request, 'resolver_match', None)
+        timer = getattr(request, 'timer', None)
+        trace = getattr(request, 'trace', None)
+        record = {
+            'time': datetime.utcnow().isoformat(),
+            'method': request.method,
+            'path': redact_path(request),
+            'view': match.view_name if match else '',
+            'status': response.status_code,
+            'ms': seconds * 1000,
+            'response_bytes': None if response.streaming else len(response.content),
+            'phases_ms': dict((name, value * 1000) for name, value in timer.phases.items()) if timer else {},
+            'request_id': str(getattr(request, '_logging_uuid', '')),
+            'trace_id': trace.trace_id if trace is not None else '',
+        }
+        record.update(collector.as_json())
+        try:
+            record_id = save_record(record)
+        except (IOError, OSError):
+            logger.exception("Could not save the slow request record")
+            return response
+        logger.warning('%s %s took %.0fms, recorded as %s' % (request.method, record['path'], record['ms'],
+                                                              record_id))
+        return response
+
+
+@staff_member_required
+def slow_requests(request):
+    """
+    The slow request record `id`, or the summaries of the latest ones,
+    filtered by `view` and `min_ms`.
+    """
+    if request.GET.get('id'):
+        record = load_record(request.GET['id'])
+        if record is None:
+            raise Http404()
+        return JsonResponse(record)
+    try:
+        min_ms = float(request.GET['min_ms']) if request.GET.get('min_ms') else None
+        limit = int(request.GET.get('limit', 50))
+    except ValueError:
+        return JsonResponse({'error': 'min_ms and limit must be numbers'}, status=400)
+    return JsonResponse({'records': [summary(record) for record in
+                                     find_records(request.GET.get('view'), min_ms, limit)]})
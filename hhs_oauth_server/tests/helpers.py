@@ -0,0 +1,63 @@
+import shutil
+import tempfile
+
+from django.test import RequestFactory, override_settings
+
+
+class TemporaryDirectoryMixin(object):
+    """
+    Give each test an empty `self.directory`, removed after the test.
+    """
+
+    def setUp(self):
+        super(TemporaryDirectoryMixin, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+
+class MiddlewareTestMixin(object):
+    """
+    Run views through `middleware_class` out of the URL resolver.
+    """
+    middleware_class = None
+
+    def run_view(self, view, user=None):
+        middleware = self.middleware_class()
+        request = RequestFactory().get('/')
+        if user is not None:
+            request.user = user
+        middleware.process_request(request)
+        middleware.process_view(request, view, (), {})
+        return middleware.process_response(request, view(request))
+
+
+class BudgetTestMixin(MiddlewareTestMixin):
+    """
+    Check a middleware holding views to the budget set as their
+    `budget_attribute`, which raises `budget_exception` with
+    `enforce_setting` on and logs a warning otherwise.
+    """
+    budget_attribute = None
+    budget_exception = None
+    enforce_setting = None
+    budget_settings = {}
+
+    def check_budget(self, view, within, over):
+        """
+        Run `view` within its budget, then over it enforced and not.
+        Returns the response within the budget and the warning logged
+        over it.
+        """
+        setattr(view, self.budget_attribute, within)
+        try:
+            with override_settings(**self.budget_settings):
+                response = self.run_view(view)
+                setattr(view, self.budget_attribute, over)
+                with self.assertRaises(self.budget_exception), self.assertLogs('performance', 'WARNING'):
+                    self.run_view(view)
+                with override_settings(**{self.enforce_setting: False}):
+                    with self.assertLogs('performance', 'WARNING') as logs:
+                        self.run_view(view)
+        finally:
+            delattr(view, self.budget_attribute)
+        return response, logs.output[0]
@@ -0,0 +1,57 @@
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+
+from ..memory import MemoryBudgetExceeded, MemoryMiddleware, MemoryTracker, report
+from .helpers import BudgetTestMixin
+
+
+def allocate_a_megabyte(request):
+    chunks = [bytes(1024) for i in range(1024)]
+    del chunks
+    return HttpResponse(b'x' * 20 * 1024)
+
+
+class MemoryTest(BudgetTestMixin, TestCase):
+    middleware_class = MemoryMiddleware
+    budget_attribute = 'memory_budget'
+    budget_exception = MemoryBudgetExceeded
+    enforce_setting = 'MEMORY_BUDGET_ENFORCE'
+    budget_settings = {'MEMORY_SAMPLE_RATE': 1}
+
+    def setUp(self):
+        report.clear()
+
+    def test_tracker(self):
+        with MemoryTracker() as memory:
+            allocate_a_megabyte(None)
+            kept = [bytes(1024) for i in range(100)]
+        self.assertGreater(memory.peak, 1024 * 1024)
+        self.assertGreater(memory.retained, 100 * 1024)
+        self.assertLess(memory.retained, memory.peak)
+        site, size = memory.top_sites[0]
+        self.assertIn('hhs_oauth_server/tests/test_memory.py', site)
+        self.assertGreater(size, 100 * 1024)
+        self.assertEqual(len(kept), 100)
+
+    def test_sampled_requests_are_reported_by_view_and_size(self):
+        self.run_view(allocate_a_megabyte)
+        self.assertEqual(report.summary(), [])
+        with override_settings(MEMORY_SAMPLE_RATE=1):
+            self.run_view(allocate_a_megabyte)
+            self.run_view(allocate_a_megabyte)
+        row, = report.summary()
+        self.assertEqual((row['view'], row['response_size'], row['requests']), ('unresolved', '10KB-100KB', 2))
+        self.assertGreater(row['peak_max'], 1024 * 1024)
+
+        User.objects.create_user('staff', password='secret', is_staff=True)
+        self.assertEqual(self.client.get('/memory-report').status_code, 302)
+        self.client.login(username='staff', password='secret')
+        data = self.client.get('/memory-report').json()
+        self.assertGreater(data['rss'], 0)
+        self.assertEqual(data['views'][0]['requests'], 2)
+
+    def test_budget(self):
+        response, warning = self.check_budget(allocate_a_megabyte, 2 * 1024 * 1024, 512 * 1024)
+        self.assertIn('over its budget of 524288', warning)
+        self.assertIn('hhs_oauth_server/tests/test_memory.py', warning)
@@ -0,0 +1,40 @@
+import os
+
+from django.test import TestCase, override_settings
+
+from ..metrics import BOUNDS, HistogramStore, collect, prometheus_text
+from .helpers import TemporaryDirectoryMixin
+
+
+class HistogramStoreTest(TemporaryDirectoryMixin, TestCase):
+
+    def test_processes_are_summed(self):
+        first = HistogramStore(os.path.join(self.directory, 'histograms_1.db'))
+        second = HistogramStore(os.path.join(self.directory, 'histograms_2.db'))
+        key = ('read', 'Patient', 'app', 'total')
+        first.observe(key, 0.0011)
+        first.observe(key, 0.0011)
+        second.observe(key, 200)
+        # many keys, to grow the file
+        for i in range(2000):
+            second.observe(('read', 'Patient', 'app %s' % i, 'total'), 0.5)
+        second.observe(key, 0.5)
+
+        with override_settings(METRICS_DIR=self.directory):
+            histograms = collect()
+        values = histograms[key]
+        self.assertEqual(values[BOUNDS.index(0.00125)], 2)
+        self.assertEqual(values[BOUNDS.index(0.5)], 1)
+        self.assertEqual(values[len(BOUNDS)], 1)
+        self.assertAlmostEqual(values[-1], 200.5022)
+        self.assertEqual(len(histograms), 2001)
+        # reopened by a process with the same pid
+        self.assertEqual(HistogramStore(second.path).histograms(), second.histograms())
+
+        text = prometheus_text({key: values})
+        self.assertIn('bluebutton_request_phase_seconds_bucket{endpoint="read",resource_type="Patient",'
+                      'application="app",phase="total",le="0.001"} 0\n', text)
+        self.assertIn('le="0.00125"} 2\n', text)
+        self.assertIn('le="+Inf"} 4\n', text)
+        self.assertIn('bluebutton_request_phase_seconds_count{endpoint="read",resource_type="Patient",'
+                      'application="app",phase="total"} 4\n', text)
@@ -0,0 +1,77 @@
+import glob
+import io
+import os
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from ..profiling import SamplingProfiler, profile_token
+from .helpers import TemporaryDirectoryMixin
+
+
+class ProfilingTest(TemporaryDirectoryMixin, TestCase):
+
+    def setUp(self):
+        super(ProfilingTest, self).setUp()
+        self.staff = User.objects.create_user('staff', password='secret', is_staff=True)
+
+    def profiles(self):
+        return glob.glob(os.path.join(self.directory, '*', '*.prof'))
+
+    def test_profile_token(self):
+        self.assertEqual(self.client.get('/profile-token').status_code, 302)
+        self.client.login(username='staff', password='secret')
+        token = self.client.get('/profile-token').json()['token']
+        self.client.logout()
+
+        with override_settings(PROFILE_DIR=self.directory):
+            self.client.get('/.well-known/openid-configuration', HTTP_X_BLUEBUTTON_PROFILE=token + 'x')
+            self.assertEqual(self.profiles(), [])
+            response = self.client.get('/.well-known/openid-configuration', HTTP_X_BLUEBUTTON_PROFILE=token)
+        profile, = self.profiles()
+        self.assertEqual(os.path.basename(profile), response['X-BlueButton-Profile-Id'] + '.prof')
+        self.assertTrue(response['X-BlueButton-Profile-Id'].startswith('openid-configuration--'))
+
+        with override_settings(PROFILE_DIR=self.directory, PROFILE_TOKEN_MAX_AGE=-1):
+            self.client.get('/.well-known/openid-configuration', HTTP_X_BLUEBUTTON_PROFILE=token)
+        self.assertEqual(len(self.profiles()), 1)
+
+    def test_sampled_profiles_are_summarized_by_view(self):
+        with override_settings(PROFILE_DIR=self.directory, PROFILE_SAMPLE_RATE=1):
+            for i in range(3):
+                self.client.get('/.well-known/openid-configuration')
+        self.assertEqual(len(self.profiles()), 3)
+        out = io.StringIO()
+        call_command('summarize_profiles', self.directory, output=os.path.join(self.directory, 'merged'),
+                     stdout=out)
+        self.assertIn('=== openid-configuration: 3 requests', out.getvalue())
+        self.assertIn('openid_configuration', out.getvalue())
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'merged', 'openid-configuration.prof')))
+
+    def test_sampling_profiler(self):
+        def busy(stop):
+            while not stop.is_set():
+                sum(range(1000))
+        stop = threading.Event()
+        worker = threading.Thread(target=busy, args=(stop,))
+        worker.start()
+        sampler = SamplingProfiler(os.path.join(self.directory, 'stacks_1.txt'), interval=0.001)
+        sampler.start()
+        time.sleep(0.2)
+        sampler.stop()
+        stop.set()
+        worker.join()
+        with open(sampler.path) as f:
+            lines = f.read().splitlines()
+        self.assertTrue(any('busy (hhs_oauth_server/tests/test_profiling.py)' in line for line in lines))
+        self.assertTrue(all(int(line.rpartition(' ')[2]) > 0 for line in lines))
+
+        out = io.StringIO()
+        call_command('summarize_profiles', self.directory, stacks=os.path.join(self.directory, 'all.txt'),
+                     stdout=out)
+        with open(os.path.join(self.directory, 'all.txt')) as f:
+            self.assertEqual(f.read().splitlines(), lines)
+        self.assertEqual(profile_token(self.staff).split(':')[0], str(self.staff.pk))
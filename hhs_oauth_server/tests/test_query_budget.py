@@ -0,0 +1,54 @@
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+
+from ..query_budget import QueryBudgetExceeded, QueryBudgetMiddleware, QueryCounter
+from .helpers import BudgetTestMixin
+
+
+def two_user_lookups(request):
+    User.objects.filter(pk=1).first()
+    User.objects.filter(pk=1).first()
+    return HttpResponse()
+
+
+class QueryBudgetTest(BudgetTestMixin, TestCase):
+    middleware_class = QueryBudgetMiddleware
+    budget_attribute = 'query_budget'
+    budget_exception = QueryBudgetExceeded
+    enforce_setting = 'QUERY_BUDGET_ENFORCE'
+
+    def test_counter(self):
+        with QueryCounter() as queries:
+            two_user_lookups(None)
+            User.objects.count()
+        self.assertEqual((queries.count, queries.duplicates), (3, 1))
+        self.assertGreater(queries.seconds, 0)
+        sql, stack = queries.duplicate_stacks[0]
+        self.assertIn('auth_user', sql)
+        self.assertEqual(stack[-1].name, 'two_user_lookups')
+        # uninstalled on exit
+        User.objects.count()
+        self.assertEqual(queries.count, 3)
+
+    def test_counter_without_stacks(self):
+        with QueryCounter(stacks=False) as queries:
+            two_user_lookups(None)
+        self.assertEqual((queries.count, queries.duplicates), (2, 1))
+        sql, stack = queries.duplicate_stacks[0]
+        self.assertEqual(stack, [])
+
+    def test_budget(self):
+        response, warning = self.check_budget(two_user_lookups, 2, 1)
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertIn('ran 2 queries, over its budget of 1', warning)
+        # the stacks are only collected with DEBUG or QUERY_BUDGET_ENFORCE
+        self.assertNotIn('in two_user_lookups', warning)
+
+    def test_budget_stacks_in_debug(self):
+        two_user_lookups.query_budget = 1
+        self.addCleanup(delattr, two_user_lookups, 'query_budget')
+        with override_settings(DEBUG=True, QUERY_BUDGET_ENFORCE=False), \
+                self.assertLogs('performance', 'WARNING') as logs:
+            self.run_view(two_user_lookups)
+        self.assertIn('in two_user_lookups', logs.output[0])
@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from ..sessions import is_signed_cookie, session_store
+
+
+class FlowSessionMiddlewareTest(TestCase):
+    """ Check that each view keeps its session in its engine """
+
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user('fred', password='bedrocks')
+
+    def session(self):
+        return session_store(self.client.cookies[settings.SESSION_COOKIE_NAME].value)
+
+    def test_cookie_view_keeps_the_session_in_a_cookie(self):
+        self.client.get(reverse('mymedicare-login'))
+        self.assertTrue(is_signed_cookie(self.client.cookies[settings.SESSION_COOKIE_NAME].value))
+        self.assertFalse(Session.objects.exists())
+
+    def test_session_moves_to_the_engine_of_the_view_modifying_it(self):
+        self.client.get(reverse('mymedicare-login'))
+        state = self.session()['state']
+        self.client.post(reverse('mfa_login'), {'username': 'fred', 'password': 'bedrocks'})
+        session_key = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        self.assertFalse(is_signed_cookie(session_key))
+        self.assertEqual(Session.objects.get().session_key, session_key)
+        self.assertEqual(self.session()['state'], state)
+        # logged in, the session stays on the server
+        self.client.get(reverse('mymedicare-login'))
+        self.assertEqual(self.client.cookies[settings.SESSION_COOKIE_NAME].value, session_key)
+        self.assertNotEqual(self.session()['state'], state)
+        # and logging out revokes it
+        self.client.logout()
+        self.assertFalse(Session.objects.exists())
+        self.assertFalse(session_store(session_key).get(SESSION_KEY))
+
+    def test_unmodified_session_is_not_saved(self):
+        self.client.login(username='fred', password='bedrocks')
+        response = self.client.get(reverse('home'))
+        self.assertTrue(response.wsgi_request.user.is_authenticated())
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
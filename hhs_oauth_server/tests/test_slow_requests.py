@@ -0,0 +1,43 @@
+import os
+
+from django.core.urlresolvers import Resolver404, resolve
+from django.test import RequestFactory, TestCase, override_settings
+
+from ..slow_requests import find_records, redact_cache_key, redact_path, redact_url, save_record
+from .helpers import TemporaryDirectoryMixin
+
+
+class SlowRequestTest(TemporaryDirectoryMixin, TestCase):
+
+    def test_redaction(self):
+        self.assertEqual(redact_url('https://fhir/baseDstu3/Patient/-20140000008325/?_format=json&patient=123'),
+                         'https://fhir/baseDstu3/Patient/{id}/?_format=json&patient=REDACTED')
+        self.assertEqual(redact_cache_key('throttle_token_aB3dE5fG7hI9'), 'throttle_token_{id}')
+        self.assertEqual(redact_cache_key('mymedicare:fhir_id:20140000008325'), 'mymedicare:fhir_id:{id}')
+        self.assertEqual(redact_cache_key('lockout:count:user:wilma:123'), 'lockout:count:user:{id}')
+        self.assertEqual(redact_cache_key('accounts.principal'), 'accounts.principal')
+
+    def test_path_redaction(self):
+        factory = RequestFactory()
+        for path, expected in (
+                ('/v1/accounts/password-reset-email-verify/abcdefghijklmnopqrstuvwxyzabcd/',
+                 '/v1/accounts/password-reset-email-verify/{reset_password_key}/'),
+                ('/v1/accounts/activation-verify/3f2a9c/', '/v1/accounts/activation-verify/{activation_key}/'),
+                ('/v1/fhir/Patient/-20140000008325', '/v1/fhir/Patient/{resource_id}'),
+                ('/v1/fhir/20140000008325', '/v1/fhir/{resource_type}'),
+                # not resolved
+                ('/v1/unknown/3f2a9c/', '/v1/unknown/{id}/')):
+            request = factory.get(path)
+            try:
+                request.resolver_match = resolve(path)
+            except Resolver404:
+                pass
+            self.assertEqual(redact_path(request), expected)
+
+    def test_oldest_records_are_pruned(self):
+        with override_settings(SLOW_REQUEST_DIR=self.directory, SLOW_REQUEST_MAX_RECORDS=3):
+            for i in range(5):
+                save_record({'view': 'v%s' % (i % 2), 'ms': i * 100})
+            self.assertEqual(len(os.listdir(self.directory)), 3)
+            self.assertEqual([record['ms'] for record in find_records()], [400, 300, 200])
+            self.assertEqual([record['ms'] for record in find_records(view='v0', min_ms=300)], [400])
@@ -0,0 +1,35 @@
+from django.test import override_settings
+
+from apps.test import BaseApiTest
+from ..metrics import collect
+
+
+class TimingTest(BaseApiTest):
+
+    fixtures = ['testfixture']
+
+    def setUp(self):
+        self.read_capability = self._create_capability('Read', [])
+        self.write_capability = self._create_capability('Write', [])
+        self.token = self.create_token('John', 'Smith')
+
+    def test_phases(self):
+        auth = {'HTTP_AUTHORIZATION': 'Bearer %s' % self.token}
+        self.assertFalse(self.client.get('/v1/connect/userinfo', **auth).has_header('Server-Timing'))
+        with override_settings(SERVER_TIMING_PUBLIC=True):
+            response = self.client.get('/v1/connect/userinfo', **auth)
+        self.assertRegex(response['Server-Timing'],
+                         r'^token;dur=[0-9.]+, serialize;dur=[0-9.]+, db;dur=[0-9.]+, total;dur=[0-9.]+$')
+
+        histograms = collect()
+        total = histograms[('openid_connect_userinfo', '', 'John_Smith_test', 'total')]
+        self.assertGreaterEqual(sum(total[:-1]), 2)
+        self.assertIn(('oauth2_provider:token', '', 'John_Smith_test', 'token_save'), histograms)
+
+        response = self.client.get('/metrics')
+        self.assertContains(response, 'bluebutton_request_phase_seconds_bucket{endpoint="openid_connect_userinfo",'
+                                      'resource_type="",application="John_Smith_test",phase="token",le="+Inf"}')
+        with override_settings(METRICS_ALLOWED_IPS=[]):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with override_settings(METRICS_ALLOWED_IPS=['127.0.0.12']):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
@@ -0,0 +1,84 @@
+import glob
+import json
+import os
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+
+from ..tracing import (NULL_SPAN, TracingMiddleware, backend_call, current_span, finish_span, flush, span,
+                       start_trace)
+from .helpers import TemporaryDirectoryMixin
+
+
+class TracingTest(TemporaryDirectoryMixin, TestCase):
+
+    def spans(self):
+        flush()
+        spans = []
+        for path in sorted(glob.glob(os.path.join(self.directory, 'spans_*.json*'))):
+            with open(path) as f:
+                for line in f:
+                    spans.extend(json.loads(line))
+        return spans
+
+    def test_spans(self):
+        with span('outside') as outside:
+            self.assertIs(outside, NULL_SPAN)
+        self.assertIsNone(start_trace('unsampled'))
+
+        with override_settings(TRACE_DIR=self.directory, TRACE_SAMPLE_RATE=1):
+            root = start_trace('root')
+            with span('child', tags={'key': 1}) as child:
+                self.assertIs(current_span(), child)
+                with self.assertRaises(ValueError):
+                    with span('failing'):
+                        raise ValueError()
+                cache.set('traced', 1)
+            self.assertIs(current_span(), root)
+            finish_span(root)
+            self.assertIsNone(current_span())
+            spans = self.spans()
+        by_name = dict((data['name'], data) for data in spans)
+        self.assertEqual(sorted(by_name), ['cache.set', 'child', 'failing', 'root'])
+        self.assertEqual(by_name['child']['tags'], {'key': '1'})
+        self.assertEqual(by_name['failing']['tags'], {'error': 'ValueError'})
+        self.assertEqual(by_name['failing']['parentId'], by_name['child']['id'])
+        self.assertEqual(by_name['cache.set']['parentId'], by_name['child']['id'])
+        self.assertEqual(by_name['child']['parentId'], by_name['root']['id'])
+        self.assertGreaterEqual(by_name['root']['duration'], by_name['child']['duration'])
+
+    def test_files_rotate(self):
+        with override_settings(TRACE_DIR=self.directory, TRACE_SAMPLE_RATE=1, TRACE_FILE_MAX_BYTES=2000,
+                               TRACE_FILE_BACKUPS=2, TRACE_BATCH_SIZE=5):
+            for i in range(20):
+                root = start_trace('request %s' % i)
+                for j in range(4):
+                    with span('step'):
+                        pass
+                finish_span(root)
+        self.assertEqual(len(glob.glob(os.path.join(self.directory, 'spans_*.json*'))), 3)
+        spans = self.spans()
+        self.assertLess(len(spans), 100)
+        names = [data['name'] for data in spans]
+        # the oldest spans were rotated out
+        self.assertIn('request 19', names)
+        self.assertNotIn('request 0', names)
+
+    def test_nothing_is_redacted_or_instrumented_when_off(self):
+        with mock.patch('hhs_oauth_server.tracing.redact_path') as redact_path, \
+                mock.patch('hhs_oauth_server.tracing.redact_url') as redact_url, \
+                mock.patch('hhs_oauth_server.tracing.instrument_caches') as instrument_caches:
+            request = RequestFactory().get('/v1/fhir/Patient/123')
+            TracingMiddleware().process_request(request)
+            with backend_call('http://backend/Patient/123'):
+                pass
+            # sampled out
+            with override_settings(TRACE_DIR=self.directory, TRACE_SAMPLE_RATE=10 ** 9):
+                TracingMiddleware().process_request(request)
+                with backend_call('http://backend/Patient/123'):
+                    pass
+        self.assertIsNone(request.trace)
+        redact_path.assert_not_called()
+        redact_url.assert_not_called()
+        self.assertEqual(instrument_caches.call_count, 1)
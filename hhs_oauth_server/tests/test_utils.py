@@ -7,7 +7,8 @@ File created by: 'Mark Scrimshire: @ekivemark'
 """
 
 from django.test import TestCase
-from .utils import bool_env, TRUE_LIST, FALSE_LIST, int_env
+
+from ..utils import bool_env, TRUE_LIST, FALSE_LIST, int_env, list_env
 
 
 class Check_BooleanVariable_Test(TestCase):
@@ -45,3 +46,19 @@ class Check_IntFromText_Test(TestCase):
         for x, y in int_list:
             result = int_env(x)
             self.assertEqual(result, y)
+
+
+class Check_ListFromText_Test(TestCase):
+    """ Check that text gets converted to a list """
+
+    def test_list_values(self):
+        """ Check we get lists of the exact values """
+
+        list_list = [("10.0.0.12", ["10.0.0.12"]),
+                     ("10.0.0.1, 10.0.0.2,", ["10.0.0.1", "10.0.0.2"]),
+                     ("", []),
+                     (["127.0.0.1"], ["127.0.0.1"])]
+
+        for x, y in list_list:
+            result = list_env(x)
+            self.assertEqual(result, y)
@@ -0,0 +1,111 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+
+from . import metrics
+from .tracing import span
+
+_local = threading.local()
+
+
+class RequestTimer(object):
+    """
+    The time spent by a request in each of its phases, and the labels
+    its histograms are recorded under.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = OrderedDict()
+        self.labels = {'endpoint': '', 'resource_type': '', 'application': ''}
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def server_timing(self):
+        return ', '.join('%s;dur=%.1f' % (name, seconds * 1000) for name, seconds in self.phases.items())
+
+
+def current_timer():
+    return getattr(_local, 'timer', None)
+
+
+def add_phase(name, seconds):
+    """
+    Add `seconds` to the phase `name` of the current request.
+    """
+    timer = current_timer()
+    if timer is not None:
+        timer.add(name, seconds)
+
+
+def set_label(name, value):
+    timer = current_timer()
+    if timer is not None:
+        timer.labels[name] = value
+
+
+@contextmanager
+def phase(name):
+    """
+    Time the block as the phase `name` of the current request, and trace
+    it as a span of the same name.
+    """
+    start = time.perf_counter()
+    try:
+        with span(name):
+            yield
+    finally:
+        add_phase(name, time.perf_counter() - start)
+
+
+def timed(name):
+    """
+    Decorator timing each call as the phase `name` of the current request.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TimingMiddleware(object):
+    """
+    Time the phases of each request: token validation, database,
+    crosswalk, backend and serialization as reported by the code running
+    them with `phase`, plus the total. The phases are recorded in the
+    latency histograms of the endpoint, resource type and application
+    served at /metrics, and sent in a Server-Timing header with DEBUG,
+    to staff users, or to everyone with SERVER_TIMING_PUBLIC.
+    """
+
+    def process_request(self, request):
+        _local.timer = request.timer = RequestTimer()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.timer.labels['endpoint'] = request.resolver_match.view_name
+
+    def process_response(self, request, response):
+        timer = getattr(request, 'timer', None)
+        if timer is None:
+            return response
+        _local.timer = None
+        timer.add('total', time.perf_counter() - timer.start)
+        if timer.labels['endpoint']:
+            metrics.observe((timer.labels['endpoint'], timer.labels['resource_type'],
+                             timer.labels['application']), timer.phases)
+        if getattr(settings, 'SERVER_TIMING_PUBLIC', False) or settings.DEBUG or is_staff(request):
+            response['Server-Timing'] = timer.server_timing()
+        return response
+
+
+def is_staff(request):
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_authenticated() and user.is_staff
@@ -0,0 +1,372 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .slow_requests import current_collector, record_cache_call, redact_path, redact_url
+
+logger = logging.getLogger('performance.%s' % __name__)
+
+CACHE_METHODS = ('get', 'set', 'add', 'delete', 'get_many', 'set_many', 'delete_many', 'incr', 'decr',
+                 'get_or_set', 'has_key', 'clear')
+# longest SQL statement kept in a span
+MAX_STATEMENT = 1000
+
+_local = threading.local()
+
+
+def tracing_dir():
+    return getattr(settings, 'TRACE_DIR', '')
+
+
+class Span(object):
+    """
+    A timed operation of a trace, exported in the Zipkin v2 JSON format.
+    """
+
+    def __init__(self, name, trace_id, parent_id=None, kind=None, tags=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = '%016x' % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.tags = dict(tags or {})
+        self.timestamp = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+
+    def tag(self, key, value):
+        self.tags[key] = value
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._start
+
+    def traceparent(self):
+        """
+        The W3C Trace Context header of the calls made within the span.
+        """
+        return '00-%s-%s-01' % (self.trace_id, self.span_id)
+
+    def to_json(self):
+        data = {
+            'traceId': self.trace_id,
+            'id': self.span_id,
+            'name': self.name,
+            'timestamp': int(self.timestamp * 1e6),
+            'duration': max(int(self.duration * 1e6), 1),
+            'localEndpoint': {'serviceName': getattr(settings, 'TRACE_SERVICE_NAME', 'bluebutton')},
+            'tags': dict((key, str(value)) for key, value in self.tags.items()),
+        }
+        if self.parent_id:
+            data['parentId'] = self.parent_id
+        if self.kind:
+            data['kind'] = self.kind
+        return data
+
+
+class NullSpan(object):
+    """
+    The span of the blocks run outside of a sampled trace.
+    """
+
+    def tag(self, key, value):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def current_span():
+    stack = getattr(_local, 'stack', None)
+    return stack[-1] if stack else None
+
+
+def should_sample():
+    rate = getattr(settings, 'TRACE_SAMPLE_RATE', 0)
+    return bool(tracing_dir()) and bool(rate) and random.randrange(rate) == 0
+
+
+def start_trace(name, kind='SERVER', tags=None):
+    """
+    Open the root span of a new trace for one call in TRACE_SAMPLE_RATE,
+    with TRACE_DIR set. Returns None when the trace is not sampled.
+    """
+    _local.stack = []
+    if not should_sample():
+        return None
+    root = Span(name, '%032x' % random.getrandbits(128), kind=kind, tags=tags)
+    _stack().append(root)
+    return root
+
+
+def start_span(name, kind=None, tags=None, parent=None):
+    """
+    Open a span, a child of `parent`, by default of the current span of
+    the thread. Returns None outside of a sampled trace.
+    """
+    parent = parent or current_span()
+    if parent is None:
+        return None
+    child = Span(name, parent.trace_id, parent.span_id, kind, tags)
+    _stack().append(child)
+    return child
+
+
+def finish_span(current):
+    current.finish()
+    stack = _stack()
+    if current in stack:
+        stack.remove(current)
+    export(current)
+
+
+@contextmanager
+def span(name, kind=None, tags=None, parent=None):
+    """
+    Trace the block as the span `name`, when it runs within a sampled
+    trace. The span is tagged with the exception the block raises.
+    """
+    current = start_span(name, kind, tags, parent)
+    if current is None:
+        yield NULL_SPAN
+        return
+    try:
+        yield current
+    except Exception as e:
+        current.tag('error', type(e).__name__)
+        raise
+    finally:
+        finish_span(current)
+
+
+def propagation_headers():
+    """
+    The traceparent header of the current span, to send to the backend.
+    """
+    current = current_span()
+    return {'traceparent': current.traceparent()} if current is not None else {}
+
+
+class BackendCall(object):
+    """
+    A call to the backend, timed by backend_call.
+    """
+
+    def __init__(self, url, span):
+        self.url = url
+        self.span = span
+        self.status = None
+        self.ttfb = None
+        self.size = None
+
+    def finished(self, response):
+        """
+        Record the status, time to first byte and size of `response`.
+        """
+        # with the query parameters
+        self.url = response.url
+        if self.span is not NULL_SPAN:
+            self.span.tag('http.url', redact_url(response.url))
+        self.status = response.status_code
+        self.ttfb = response.elapsed.total_seconds()
+        if response._content_consumed:
+            self.size = len(response.content)
+        self.span.tag('http.status_code', response.status_code)
+
+
+@contextmanager
+def backend_call(url):
+    """
+    Trace the block calling the backend at `url` as a client span, and
+    record the call for the slow request records. The block passes the
+    response to the `finished` method of the BackendCall it gets.
+    """
+    start = time.perf_counter()
+    with span('backend', kind='CLIENT') as current:
+        # only the sampled spans pay for the redaction
+        if current is not NULL_SPAN:
+            current.tag('http.url', redact_url(url))
+        call = BackendCall(url, current)
+        try:
+            yield call
+        except Exception as e:
+            call.status = type(e).__name__
+            raise
+        finally:
+            collector = current_collector()
+            if collector is not None:
+                collector.add_backend_call(call.url, call.status, time.perf_counter() - start, call.ttfb,
+                                           call.size)
+
+
+def traced_cache_method(method, alias, name):
+    def traced(*args, **kwargs):
+        if current_span() is None and current_collector() is None:
+            return method(*args, **kwargs)
+        start = time.perf_counter()
+        with span('cache.%s' % name, tags={'cache.alias': alias}):
+            result = method(*args, **kwargs)
+        record_cache_call(alias, name, args, kwargs, result, time.perf_counter() - start)
+        return result
+    return traced
+
+
+def instrument_caches():
+    """
+    Trace and record the calls to the caches of the current thread,
+    which each thread gets its own instances of.
+    """
+    for alias in settings.CACHES:
+        cache = caches[alias]
+        if '_traced' not in cache.__dict__:
+            for name in CACHE_METHODS:
+                setattr(cache, name, traced_cache_method(getattr(cache, name), alias, name))
+            cache._traced = True
+
+
+# spans waiting to be written, the oldest dropped past TRACE_BUFFER_SIZE
+_buffer = deque()
+_lock = threading.Lock()
+_pending = threading.Event()
+_writer = {}
+_dropped = [0]
+
+
+def export(finished):
+    """
+    Buffer a finished span. The spans are written in batches by a
+    background thread, or inline when TRACE_EXPORT_BACKGROUND is False.
+    """
+    with _lock:
+        if len(_buffer) >= getattr(settings, 'TRACE_BUFFER_SIZE', 10000):
+            _buffer.popleft()
+            _dropped[0] += 1
+        _buffer.append(finished)
+
+    if not getattr(settings, 'TRACE_EXPORT_BACKGROUND', True):
+        if finished.parent_id is None:
+            flush()
+        return
+    if len(_buffer) >= getattr(settings, 'TRACE_BATCH_SIZE', 500):
+        _pending.set()
+    _start_writer()
+
+
+_handler = {}
+_handler_lock = threading.Lock()
+
+
+def span_file():
+    """
+    The rotating file of the spans of this process, in TRACE_DIR: each
+    line a JSON array of spans, as the Zipkin v2 API takes them.
+    """
+    key = (os.getpid(), tracing_dir())
+    if _handler.get('key') != key:
+        with _handler_lock:
+            if _handler.get('key') != key:
+                pid, directory = key
+                handler = RotatingFileHandler(
+                    os.path.join(directory, 'spans_%s.json' % pid),
+                    maxBytes=getattr(settings, 'TRACE_FILE_MAX_BYTES', 50 * 1024 * 1024),
+                    backupCount=getattr(settings, 'TRACE_FILE_BACKUPS', 5), encoding='utf-8')
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                if 'handler' in _handler:
+                    _handler['handler'].close()
+                _handler.update(key=key, handler=handler)
+    return _handler['handler']
+
+
+def flush():
+    """
+    Write the buffered spans. Returns the number written.
+    """
+    batch_size = getattr(settings, 'TRACE_BATCH_SIZE', 500)
+    written = 0
+    while True:
+        with _lock:
+            batch = [_buffer.popleft() for _ in range(min(batch_size, len(_buffer)))]
+            dropped, _dropped[0] = _dropped[0], 0
+        if dropped:
+            logger.warning("%s trace spans dropped", dropped)
+        if not batch:
+            return written
+        line = json.dumps([finished.to_json() for finished in batch], separators=(',', ':'))
+        span_file().handle(logging.makeLogRecord({'msg': line}))
+        written += len(batch)
+
+
+def _write():
+    while True:
+        _pending.wait(getattr(settings, 'TRACE_EXPORT_INTERVAL', 5))
+        _pending.clear()
+        try:
+            flush()
+        except Exception:
+            logger.exception("Trace export failed")
+
+
+def _start_writer():
+    if _writer.get('pid') == os.getpid():
+        return
+    with _lock:
+        if _writer.get('pid') == os.getpid():
+            return
+        thread = threading.Thread(target=_write, name='trace-export')
+        thread.daemon = True
+        thread.start()
+        _writer['pid'] = os.getpid()
+
+
+class TracingMiddleware(object):
+    """
+    Opt-in tracing of one request in TRACE_SAMPLE_RATE, with TRACE_DIR
+    set. The root span of the request is tagged with its view, status
+    and request id; the code it runs adds the spans of the token check,
+    queries, cache calls, backend calls and the phases timed with
+    hhs_oauth_server.timing.phase. The backend calls carry the trace in
+    a traceparent header. The paths and URLs of the spans are redacted
+    as in the slow request records.
+    """
+
+    def process_request(self, request):
+        request.trace = None
+        # the slow request records get the cache calls as well
+        if not tracing_dir() and current_collector() is None:
+            return
+        instrument_caches()
+        request.trace = start_trace(request.method, tags={'http.method': request.method})
+        if getattr(request, 'trace', None) is not None:
+            request.trace.name = '%s %s' % (request.method, redact_path(request))
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.trace is not None:
+            request.trace.name = '%s %s' % (request.method, request.resolver_match.view_name)
+
+    def process_response(self, request, response):
+        root = getattr(request, 'trace', None)
+        if root is None:
+            return response
+        root.tag('http.status_code', response.status_code)
+        # resolved by now, so redacted of the arguments of its route
+        root.tag('http.path', redact_path(request))
+        if hasattr(request, '_logging_uuid'):
+            root.tag('request_id', request._logging_uuid)
+        finish_span(root)
+        _local.stack = []
+        return response
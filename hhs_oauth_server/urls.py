@@ -5,6 +5,10 @@ from apps.accounts.views.oauth2_profile import openidconnect_userinfo
 from apps.fhir.bluebutton.views.home import fhir_conformance
 from apps.home.views import home
 from hhs_oauth_server.hhs_oauth_server_context import IsAppInstalled
+from hhs_oauth_server.memory import memory_report
+from hhs_oauth_server.metrics import metrics
+from hhs_oauth_server.profiling import profile_token_view
+from hhs_oauth_server.slow_requests import slow_requests
 
 admin.autodiscover()
 
@@ -17,6 +21,10 @@ urlpatterns = [
     url(r'^v1/fhir/metadata$', fhir_conformance, name='fhir_conformance_metadata'),
     url(r'^v1/fhir/', include('apps.fhir.bluebutton.urls')),
     url(r'^v1/o/', include('apps.dot_ext.urls')),
+    url(r'^metrics$', metrics, name='metrics'),
+    url(r'^profile-token$', profile_token_view, name='profile_token'),
+    url(r'^memory-report$', memory_report, name='memory_report'),
+    url(r'^slow-requests$', slow_requests, name='slow_requests'),
     url(r'^social-auth/', include('social_django.urls', namespace='social')),
 
     url(r'^' + ADMIN_REDIRECTOR + 'admin/', include(admin.site.urls)),
@@ -24,3 +24,11 @@ def int_env(env_val):
     """ convert to integer from String """
 
     return int(Decimal(float(env_val)))
+
+
+def list_env(env_val):
+    """ convert a comma separated String to a list """
+
+    if isinstance(env_val, (list, tuple)):
+        return list(env_val)
+    return [value.strip() for value in str(env_val).split(',') if value.strip()]